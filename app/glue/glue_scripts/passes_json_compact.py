@@ -4,12 +4,20 @@ from awsglue.context import GlueContext
 from awsglue.utils import getResolvedOptions
 from pyspark.context import SparkContext
 from pyspark.sql.functions import *
-from awsglue.dynamicframe import DynamicFrame
 import datetime, sys
 
 args = getResolvedOptions(sys.argv, ['JOB_NAME', 'S3_BUCKET_NAME', 'PASSES_RAW_PREFIX'])
 
-date_prefix = datetime.datetime.now().strftime("year=%Y/month=%m/day=%d")
+# Gets the run date from the step function (see app/lambdas/functions/run_context.py),
+# or today if the job is run without one
+if '--RUN_DATE' in sys.argv:
+    run_date = datetime.date.fromisoformat(
+        getResolvedOptions(sys.argv, ['RUN_DATE'])['RUN_DATE']
+        )
+else:
+    run_date = datetime.datetime.now().date()
+
+date_prefix = run_date.strftime("year=%Y/month=%m/day=%d")
 input_path = "s3://{}/{}/{}/".format(
     args['S3_BUCKET_NAME'],
     args['PASSES_RAW_PREFIX'],
@@ -63,10 +71,6 @@ df = df.withColumn("lon", df["lon"].cast(DoubleType()))
 
 df = df.coalesce(1)
 
-glueContext.write_dynamic_frame.from_options(
-    frame=DynamicFrame.fromDF(df, glueContext, "df"),
-    connection_type="s3",
-    connection_options={"path": output_path},
-    format="parquet",
-    )
-
+# Overwrites the run date's compacted objects so that re-running (or backfilling) a
+# date replaces its data instead of adding duplicates
+df.write.mode("overwrite").parquet(output_path)
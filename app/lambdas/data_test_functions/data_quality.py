@@ -0,0 +1,201 @@
+from typing import NamedTuple, Optional
+import re
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Check names and column names are put in the query string, so only plain lowercase
+# identifiers are allowed
+SQL_IDENTIFIER_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class DataQualityCheck(NamedTuple):
+	"""
+	A declarative data quality check of a table, i.e. a SQL aggregate metric (see the
+	*_check functions) and the bounds that the metric must be within to PASS. Every
+	check of a table is compiled into one query (see compile_data_quality_query), so the
+	table's partition is only scanned once.
+	"""
+	name: str
+	metric: str
+	minimum: Optional[float] = None
+	maximum: Optional[float] = None
+	
+	def evaluate(self, value) -> bool:
+		"""
+		Checks that the metric value is within the check's bounds
+		:param value: Metric value from the data quality query result
+		:return: PASS (True) or FAIL (False) result
+		"""
+		if value is None:
+			return False
+		if self.minimum is not None and value < self.minimum:
+			return False
+		if self.maximum is not None and value > self.maximum:
+			return False
+		return True
+	
+	@property
+	def expectation(self) -> str:
+		"""
+		Bounds of the metric for logging e.g. "= 0" or ">= 1"
+		"""
+		if self.minimum is not None and self.minimum == self.maximum:
+			return f"= {self.minimum}"
+		bounds = [
+			f"{operator} {bound}"
+			for operator, bound in ((">=", self.minimum), ("<=", self.maximum))
+			if bound is not None
+			]
+		return " and ".join(bounds) or "any value"
+
+
+def row_count_check(
+	name: str,
+	minimum: Optional[int] = 1,
+	maximum: Optional[int] = None
+	) -> DataQualityCheck:
+	"""
+	Checks the number of rows
+	:param name: Check name
+	:param minimum: Minimum number of rows
+	:param maximum: Maximum number of rows
+	:return: Data quality check
+	"""
+	return DataQualityCheck(
+		name=_validate_identifier(name),
+		metric="COUNT(*)",
+		minimum=minimum,
+		maximum=maximum
+		)
+
+
+def distinct_key_check(
+	name: str,
+	columns: tuple,
+	expected: Optional[int] = None
+	) -> DataQualityCheck:
+	"""
+	Checks the number of distinct keys e.g. that every input city is in the table
+	:param name: Check name
+	:param columns: Key columns
+	:param expected: Expected number of distinct keys, or None to only require one
+	:return: Data quality check
+	"""
+	return DataQualityCheck(
+		name=_validate_identifier(name),
+		metric=f"COUNT(DISTINCT {_key_expression(columns)})",
+		minimum=1 if expected is None else expected,
+		maximum=expected
+		)
+
+
+def uniqueness_check(name: str, columns: tuple) -> DataQualityCheck:
+	"""
+	Checks that no two rows have the same key, i.e. that there are no duplicates
+	:param name: Check name
+	:param columns: Key columns
+	:return: Data quality check
+	"""
+	return DataQualityCheck(
+		name=_validate_identifier(name),
+		metric=f"COUNT(*) - COUNT(DISTINCT {_key_expression(columns)})",
+		maximum=0
+		)
+
+
+def not_null_check(name: str, columns: tuple) -> DataQualityCheck:
+	"""
+	Checks that there are no rows with NULL values in any of the columns
+	:param name: Check name
+	:param columns: Columns that must not be NULL
+	:return: Data quality check
+	"""
+	condition = " OR ".join(
+		f"{_validate_identifier(column)} IS NULL" for column in columns
+		)
+	return DataQualityCheck(
+		name=_validate_identifier(name),
+		metric=f"COUNT_IF({condition})",
+		maximum=0
+		)
+
+
+def range_check(
+	name: str,
+	column: str,
+	minimum: Optional[float] = None,
+	maximum: Optional[float] = None
+	) -> DataQualityCheck:
+	"""
+	Checks that there are no values of a column outside a range. NULL values are not
+	checked (see not_null_check).
+	:param name: Check name
+	:param column: Checked column
+	:param minimum: Minimum value
+	:param maximum: Maximum value
+	:return: Data quality check
+	"""
+	column = _validate_identifier(column)
+	conditions = [
+		f"{column} {operator} {float(bound)!r}"
+		for operator, bound in (("<", minimum), (">", maximum))
+		if bound is not None
+		]
+	if not conditions:
+		logger.error("Range check %s has no minimum or maximum", name)
+		raise ValueError("Range check without bounds")
+	return DataQualityCheck(
+		name=_validate_identifier(name),
+		metric=f"COUNT_IF({' OR '.join(conditions)})",
+		maximum=0
+		)
+
+
+def compile_data_quality_query(checks: list) -> str:
+	"""
+	Compiles data quality checks into one aggregate query of the run date's partition,
+	which returns every check's metric in a single row (one column per check). The
+	query is a SQL template with the {table} identifier and the {year}, {month} and
+	{day} parameters (see functions.sql_templates.SqlTemplate).
+	:param checks: List of DataQualityCheck
+	:return: SQL template text
+	"""
+	names = [check.name for check in checks]
+	if not checks or len(set(names)) != len(names):
+		logger.error("Data quality checks must have unique names: %s", names)
+		raise ValueError("Invalid data quality checks")
+	
+	metrics = "\n    , ".join(f"{check.metric} AS {check.name}" for check in checks)
+	return (
+		f"SELECT\n    {metrics}\n"
+		"FROM {table}\n"
+		"WHERE day = {day}\n"
+		"    AND month = {month}\n"
+		"    AND year = {year}"
+		)
+
+
+def _key_expression(columns: tuple) -> str:
+	"""
+	Gets the SQL expression of a key of one or more columns
+	"""
+	columns = [_validate_identifier(column) for column in columns]
+	if not columns:
+		logger.error("Key has no columns")
+		raise ValueError("Key without columns")
+	if len(columns) == 1:
+		return columns[0]
+	return f"({', '.join(columns)})"
+
+
+def _validate_identifier(identifier: str) -> str:
+	"""
+	Checks that a check name or column name can be put in the query string
+	"""
+	if not SQL_IDENTIFIER_PATTERN.match(identifier):
+		logger.error("Invalid data quality identifier: %s", identifier)
+		raise ValueError("Invalid data quality identifier")
+	return identifier
@@ -1,9 +1,11 @@
-from functions.s3 import (
-	get_sql_query_string_from_s3_sql_object
-	)
+from data_test_functions.data_quality import compile_data_quality_query
+from functions.run_context import RunContext
+from functions.sql_templates import SqlQuery, SqlTemplate, get_sql_template
 from functions.athena import (
+	AthenaQueryResult,
 	execute_athena_query,
-	return_results_athena_query,
+	read_athena_query_result,
+	run_athena_queries,
 	)
 import os
 import logging
@@ -13,85 +15,143 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def data_test_cities_input_and_output(
+def run_data_quality_checks(
 	table_name_env: str,
-	sql_file: str
-	) -> bool:
+	checks: list,
+	run_context: RunContext = None,
+	table_prefix_env: str = None,
+	aws_region_env: str = "MY_AWS_REGION",
+	glue_db_env: str = "GLUE_DB_NAME",
+	data_catalog_env: str = "DATA_CATALOG_NAME",
+	query_result_env: str = "QUERY_RESULT_LOCATION",
+	s3_bucket_env: str = "S3_BUCKET"
+	) -> dict:
 	"""
-	Checks whether all cities were processed from cities_to_sqs.py Lambda function
+	Runs data quality checks of a table's run date partition. The checks are compiled
+	into one aggregate query (see data_test_functions.data_quality), so the partition is
+	scanned once however many checks there are, and each check is then evaluated from
+	its metric in the query's single result row. If table_prefix_env is set, the result
+	of an unchanged partition is reused from the query result cache (see
+	functions.athena.run_athena_queries), e.g. when a run is re-run after a failure.
 	:param table_name_env: Athena table name
-	:param sql_file: Filename of SQL file to use in query
-	:return: PASS or FAIL logged result
+	:param checks: List of DataQualityCheck
+	:param run_context: Run context of the tested date (default today)
+	:param table_prefix_env: S3 prefix of the table
+	:param aws_region_env: Athena AWS region
+	:param glue_db_env: Glue database name
+	:param data_catalog_env: Glue data catalog name
+	:param query_result_env: Query result location
+	:param s3_bucket_env: S3 bucket name
+	:return: Dictionary of check name and PASS (True) or FAIL (False) result
 	"""
-	logger.info("Name of test: %s", data_test_no_duplicates.__name__)
-	
-	# Gets query parameters from Lambda environment variables
-	expected_num_of_cities = os.environ["EXPECTED_OBJECT_NUMBER"]
+	run_context = run_context or RunContext.today()
+	template = SqlTemplate.compile("data_quality", compile_data_quality_query(checks))
+	query = template.render(
+		parameters=run_context.sql_parameters(),
+		identifiers={"table": os.environ[table_name_env]}
+		)
 	
-	# Gets query result from "get_query_result_from_sql_script" function
-	query_result = get_query_result_from_sql_script(
-		table_name_env=table_name_env,
-		sql_file=sql_file
+	# Runs the single query of every check
+	query_execution, = run_athena_queries(
+		query_strs=[query.query_string],
+		query_parameters=[query.parameters],
+		region_env=aws_region_env,
+		database_env=glue_db_env,
+		catalog_env=data_catalog_env,
+		s3_bucket_env=s3_bucket_env,
+		query_results_env=query_result_env,
+		cache_prefixes=[
+			f"{os.environ[table_prefix_env]}/{run_context.date_prefix}/"
+			if table_prefix_env else None
+			]
 		)
-
-	# Gets number of unique cities from query result
-	num_unique_cities_found = query_result["ResultSet"]["Rows"][1]["Data"][0][
-		"VarCharValue"]
-
-	# Logs results
-	logger.info(
-		"Number of unique cities input/output: %s/%s",
-		expected_num_of_cities,
-		num_unique_cities_found,
+	query_result = read_athena_query_result(
+		query_id=query_execution.query_id,
+		region_env=aws_region_env
 		)
+	return evaluate_data_quality_checks(checks=checks, query_result=query_result)
 
-	# Runs test and logs result
-	if num_unique_cities_found == expected_num_of_cities:
-		logger.info("Test result PASS: input = output")
-		return True
-	else:
-		logger.error("Test result FAIL: input != output")
-		return False
 
+def evaluate_data_quality_checks(
+	checks: list,
+	query_result: AthenaQueryResult
+	) -> dict:
+	"""
+	Evaluates data quality checks from the single row result of their compiled query
+	:param checks: List of DataQualityCheck
+	:param query_result: Decoded Athena query result
+	:return: Dictionary of check name and PASS (True) or FAIL (False) result
+	"""
+	metrics = dict(zip(
+		[column.name for column in query_result.columns],
+		query_result.rows[0] if query_result.rows else []
+		))
+	
+	results = {}
+	for check in checks:
+		value = metrics.get(check.name)
+		results[check.name] = check.evaluate(value)
+		if results[check.name]:
+			logger.info("Test result PASS: %s = %s", check.name, value)
+		else:
+			logger.error(
+				"Test result FAIL: %s = %s, expected %s",
+				check.name,
+				value,
+				check.expectation
+				)
+	return results
+
+
+def get_expected_number_of_cities(
+	event: dict,
+	expected_objects_env: str = "EXPECTED_OBJECT_NUMBER"
+	) -> int:
+	"""
+	Gets the number of cities that the run sent, i.e. the expected_objects of the step
+	function input, which is counted by the shard plan if the city input data is sharded
+	:param event: Step function input
+	:param expected_objects_env: Expected number of cities from Lambda function
+	environment variables, used if the step function input has no expected_objects
+	:return: Expected number of cities
+	"""
+	event = event if isinstance(event, dict) else {}
+	if event.get("expected_objects") is not None:
+		return int(event["expected_objects"])
+	return int(os.environ[expected_objects_env])
 
-def data_test_no_duplicates(
+
+def get_number_of_cities_with_passes(
 	table_name_env: str,
-	sql_file: str
-	) -> bool:
+	sql_file: str,
+	run_context: RunContext = None
+	) -> int:
 	"""
-	Checks that there are no duplicates in the target table
-	:param table_name_env: Athena table name
+	Gets the number of cities with ISS passes on the run date, which is the number of cities
+	expected in the weather raw table in passes-first weather mode
+	:param table_name_env: Athena passes table name
 	:param sql_file: Filename of SQL file to use in query
-	:return: PASS or FAIL logged result
+	:param run_context: Run context of the tested date (default today)
+	:return: Number of cities with passes
 	"""
-	logger.info("Name of test: %s", data_test_no_duplicates.__name__)
-
-	# Gets query result from "get_query_result_from_sql_script" function
 	query_result = get_query_result_from_sql_script(
 		table_name_env=table_name_env,
-		sql_file=sql_file
+		sql_file=sql_file,
+		run_context=run_context
 		)
+	return query_result.scalar()
 
-	# Checks for duplicates
-	duplicates = []
-	for target in query_result["ResultSet"]["Rows"]:
-		duplicates.append(target["Data"])
-	if len(query_result["ResultSet"]["Rows"]) > 1:
-		logger.error("Test result FAIL: duplicate rows found")
-		return False
-	else:
-		logger.info("Test result PASS: no duplicates")
-		return True
 
-
-def data_test_null_values(
+def data_test_no_duplicates(
 	table_name_env: str,
-	sql_file: str
+	sql_file: str,
+	run_context: RunContext = None
 	) -> bool:
 	"""
-	Checks that there are no unexpected NULL values
+	Checks that there are no duplicates in the target table
 	:param table_name_env: Athena table name
 	:param sql_file: Filename of SQL file to use in query
+	:param run_context: Run context of the tested date (default today)
 	:return: PASS or FAIL logged result
 	"""
 	logger.info("Name of test: %s", data_test_no_duplicates.__name__)
@@ -99,50 +159,55 @@ def data_test_null_values(
 	# Gets query result from "get_query_result_from_sql_script" function
 	query_result = get_query_result_from_sql_script(
 		table_name_env=table_name_env,
-		sql_file=sql_file
+		sql_file=sql_file,
+		run_context=run_context
 		)
+	return evaluate_no_duplicates(query_result=query_result)
 
-	# Checks for null values
-	rows_with_nulls = []
-	for target in query_result["ResultSet"]["Rows"]:
-		rows_with_nulls.append(target["Data"])
-	if len(query_result["ResultSet"]["Rows"]) > 1:
-		logger.error("Test result FAIL: unexpected null values found")
+
+def evaluate_no_duplicates(query_result: AthenaQueryResult) -> bool:
+	"""
+	Checks that the query result of a no duplicates data test has no rows
+	:param query_result: Decoded Athena query result
+	:return: PASS or FAIL logged result
+	"""
+	# Checks for duplicates
+	if query_result.rows:
+		logger.error("Test result FAIL: %s duplicate rows found", len(query_result.rows))
 		return False
 	else:
-		logger.info("Test result PASS: no unexpected null values found")
+		logger.info("Test result PASS: no duplicates")
 		return True
 
 
 def get_query_result_from_sql_script(
 	table_name_env: str,
 	sql_file: str,
-	max_result_num: int = 100,
-	query_string_prefix_env: str = "SQL_LOCATION_PREFIX",
+	run_context: RunContext = None,
 	s3_bucket_env: str = "S3_BUCKET",
 	aws_region_env: str = "MY_AWS_REGION",
 	glue_db_env: str = "GLUE_DB_NAME",
 	data_catalog_env: str = "DATA_CATALOG_NAME",
 	query_result_env: str = "QUERY_RESULT_LOCATION"
-	) -> dict:
+	) -> AthenaQueryResult:
 	"""
-	Returns query result dictionary for use in data quality test functions
+	Returns the decoded query result for use in data quality test functions. The SQL
+	template's {year}, {month} and {day} parameters are set to the run date.
 	:param table_name_env: Athena table name
 	:param sql_file: Filename of SQL file to use in query
-	:param max_result_num: Maximum number or rows to return
-	:param query_string_prefix_env: S3 prefix of SQL query file object
+	:param run_context: Run context of the tested date (default today)
 	:param s3_bucket_env: S3 bucket name
 	:param aws_region_env: Athena AWS region
 	:param glue_db_env: Glue database name
 	:param data_catalog_env: Glue data catalog name
 	:param query_result_env: Query result location
-	:return: Athena query result dictionary
+	:return: Decoded Athena query result
 	"""
-	# Gets query string from SQL file in S3
-	query_string = get_sql_query_string_from_s3_sql_object(
-		sql_filename=sql_file,
-		prefix=query_string_prefix_env,
-		s3_bucket=s3_bucket_env,
+	query = get_query_from_sql_script(
+		table_name_env=table_name_env,
+		sql_file=sql_file,
+		run_context=run_context,
+		s3_bucket_env=s3_bucket_env
 		)
 	
 	# Executes Athena query
@@ -152,12 +217,36 @@ def get_query_result_from_sql_script(
 		catalog_env=data_catalog_env,
 		s3_bucket_env=s3_bucket_env,
 		query_results_env=query_result_env,
-		query_str=query_string.format(os.environ[table_name_env]),
+		query_str=query.query_string,
+		parameters=query.parameters
 		)
 	
-	# Gets query results
-	query_result = return_results_athena_query(
+	# Gets every row of the query result
+	query_result = read_athena_query_result(
 		query_id=query_response["QueryExecutionId"],
-		max_results=max_result_num
+		region_env=aws_region_env
 		)
 	return query_result
+
+
+def get_query_from_sql_script(
+	table_name_env: str,
+	sql_file: str,
+	run_context: RunContext = None,
+	s3_bucket_env: str = "S3_BUCKET"
+	) -> SqlQuery:
+	"""
+	Gets the query of a data quality test from its SQL template (see
+	functions.sql_templates.get_sql_template). The template's {table} is set to the
+	table name and its {year}, {month} and {day} parameters to the run date, which are
+	passed to Athena as execution parameters.
+	:param table_name_env: Athena table name
+	:param sql_file: Filename of SQL file to use in query
+	:param run_context: Run context of the tested date (default today)
+	:param s3_bucket_env: S3 bucket name
+	:return: SQL query and execution parameters
+	"""
+	return get_sql_template(sql_file=sql_file, s3_bucket_env=s3_bucket_env).render(
+		parameters=(run_context or RunContext.today()).sql_parameters(),
+		identifiers={"table": os.environ[table_name_env]}
+		)
@@ -1,7 +1,12 @@
+from datetime import datetime, timezone
+import decimal
+import hashlib
 import json
 import time
-from typing import Optional
-import boto3
+from typing import Iterable, Iterator, NamedTuple, Optional
+from botocore.exceptions import ClientError
+from .clients import get_boto3_client
+from .s3 import get_s3_prefix_snapshot, iter_rows_from_s3_csv_uri
 import os
 import logging
 
@@ -9,6 +14,99 @@ import logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Athena query states that are still in progress and that have not succeeded
+ATHENA_RUNNING_STATES = ("QUEUED", "RUNNING")
+ATHENA_FAILED_STATES = ("FAILED", "CANCELLED")
+
+# Default polling of running queries (see wait_for_athena_queries). The delay starts
+# short, as most data test queries finish in a few seconds, and grows for long queries.
+DEFAULT_POLL_INITIAL_DELAY_SECONDS = 0.25
+DEFAULT_POLL_MAX_DELAY_SECONDS = 5.0
+DEFAULT_POLL_BACKOFF = 2.0
+DEFAULT_QUERY_TIMEOUT_SECONDS = 600
+
+# Maximum number of rows in a GetQueryResults page
+ATHENA_MAX_RESULTS_PAGE_SIZE = 1000
+
+# Decoders of Athena result column types (see ResultSetMetadata). Other types e.g.
+# varchar, date, timestamp and arrays are kept as strings.
+ATHENA_TYPE_DECODERS = {
+	"tinyint": int,
+	"smallint": int,
+	"integer": int,
+	"bigint": int,
+	"float": float,
+	"real": float,
+	"double": float,
+	"decimal": decimal.Decimal,
+	"boolean": lambda value: value.lower() == "true",
+	}
+
+# Lambda environment variables of Athena result reuse (see start_athena_query) and the
+# S3 query result cache (see run_athena_queries). Both are off when not set.
+ATHENA_RESULT_REUSE_MAX_AGE_ENV = "ATHENA_RESULT_REUSE_MAX_AGE_MINUTES"
+ATHENA_CACHE_PREFIX_ENV = "ATHENA_CACHE_PREFIX"
+
+
+class AthenaQueryError(Exception):
+	"""
+	Raised when Athena queries fail, are cancelled or time out. failed is a dictionary of
+	query execution ID and the reason it did not succeed.
+	"""
+	
+	def __init__(self, message: str, failed: dict):
+		super().__init__(message)
+		self.failed = failed
+
+
+class AthenaResultColumn(NamedTuple):
+	"""
+	Name and Athena type of a query result column
+	"""
+	name: str
+	type: str
+
+
+class AthenaQueryResult(NamedTuple):
+	"""
+	Decoded result of an Athena query (see read_athena_query_result). Rows are tuples of
+	Python values in column order, with None for NULL.
+	"""
+	columns: tuple
+	rows: list
+	
+	def to_columns(self) -> dict:
+		"""
+		Gets the result as columnar arrays
+		:return: Dictionary of column name and list of values
+		"""
+		return {
+			column.name: [row[index] for row in self.rows]
+			for index, column in enumerate(self.columns)
+			}
+	
+	def scalar(self):
+		"""
+		Gets the first value of the first row e.g. the result of SELECT COUNT(*)
+		:return: Decoded value
+		"""
+		if not self.rows or not self.columns:
+			logger.error("Query result has no rows: %s", self.columns)
+			raise ValueError("Query result has no rows")
+		return self.rows[0][0]
+
+
+class AthenaQueryExecution(NamedTuple):
+	"""
+	Final state and statistics of a completed Athena query
+	"""
+	query_id: str
+	state: str
+	data_scanned_bytes: int = 0
+	execution_time_ms: int = 0
+	state_change_reason: Optional[str] = None
+	cached: bool = False
+
 
 def execute_athena_query(
 	catalog_env: str,
@@ -20,23 +118,206 @@ def execute_athena_query(
 	parameters: Optional[list[str]] = None
 	) -> dict:
 	"""
-	Executes Athena SQL query within specified context (e.g. Glue catalog and database).
+	Executes Athena SQL query within specified context (e.g. Glue catalog and database)
+	and waits for it to complete (see wait_for_athena_queries). Raises AthenaQueryError
+	if the query fails or is cancelled.
+	:param catalog_env: Glue data catalog name from Lambda function environment variables
+	:param database_env: Glue database name from Lambda function environment variables
+	:param query_results_env: Query result location from Lambda function environment
+	variables
+	:param query_str: SQL query as a string
+	:param region_env: Athena region from Lambda function environment variables
+	:param s3_bucket_env: S3 bucket name from Lambda function environment variables
+	:param parameters: Optional Athena execution parameters (? placeholders)
+	:return: Response from Boto3 start_query_execution
+	"""
+	response = start_athena_query(
+		catalog_env=catalog_env,
+		database_env=database_env,
+		query_results_env=query_results_env,
+		query_str=query_str,
+		region_env=region_env,
+		s3_bucket_env=s3_bucket_env,
+		parameters=parameters
+		)
+	wait_for_athena_queries(
+		query_ids=[response["QueryExecutionId"]],
+		region_env=region_env
+		)
+	return response
+
+
+def run_athena_queries(
+	query_strs: Iterable[str],
+	catalog_env: str,
+	database_env: str,
+	query_results_env: str,
+	region_env: str,
+	s3_bucket_env: str,
+	timeout_seconds: float = DEFAULT_QUERY_TIMEOUT_SECONDS,
+	query_parameters: Optional[list] = None,
+	cache_prefixes: Optional[list] = None,
+	cache_prefix_env: str = ATHENA_CACHE_PREFIX_ENV
+	) -> list:
+	"""
+	Submits several Athena SQL queries at once then waits for all of them together, so
+	the queries run concurrently in Athena instead of one after another. Raises
+	AthenaQueryError if any query fails, is cancelled or times out.
+	
+	If the cache prefix Lambda environment variable is set, a query with an S3 prefix
+	in cache_prefixes (i.e. the table partition that it reads) is cached in S3 by its
+	normalised query text, execution parameters and a snapshot of the partition's objects (see
+	get_athena_query_cache_key). An identical query of an unchanged partition, e.g. in a
+	re-run, reuses the earlier query's results without being run or scanning any data.
+	Athena result reuse (see start_athena_query) is only used for queries that are not
+	cached, because it does not know when the data changes and would return stale
+	results for a partition that was rewritten after a cache miss.
+	:param query_strs: SQL queries as strings
+	:param catalog_env: Glue data catalog name from Lambda function environment variables
+	:param database_env: Glue database name from Lambda function environment variables
+	:param query_results_env: Query result location from Lambda function environment
+	variables
+	:param region_env: Athena region from Lambda function environment variables
+	:param s3_bucket_env: S3 bucket name from Lambda function environment variables
+	:param timeout_seconds: Maximum time to wait for all queries
+	:param query_parameters: Athena execution parameters of each query, or None
+	:param cache_prefixes: S3 prefix of the data read by each query, or None for
+	queries that are not cached
+	:param cache_prefix_env: S3 prefix of the query result cache from Lambda function
+	environment variables
+	:return: List of AthenaQueryExecution in the same order as query_strs
+	"""
+	query_strs = list(query_strs)
+	query_parameters = query_parameters or [None] * len(query_strs)
+	cache_prefixes = cache_prefixes or [None] * len(query_strs)
+	cache_prefix = os.environ.get(cache_prefix_env)
+	
+	# Gets the cache key of each cached query and reuses the results of cache hits
+	cache_keys = [
+		get_athena_query_cache_key(
+			query_str=query_str,
+			partition_snapshot=get_s3_prefix_snapshot(s3_bucket_env, prefix),
+			parameters=parameters
+			) if cache_prefix and prefix is not None else None
+		for query_str, parameters, prefix in zip(
+			query_strs, query_parameters, cache_prefixes
+			)
+		]
+	executions = {
+		index: _get_cached_athena_query_execution(
+			s3_bucket_env=s3_bucket_env,
+			cache_key=f"{cache_prefix}/{cache_key}.json",
+			query_str=query_str,
+			region_env=region_env
+			)
+		for index, (query_str, cache_key) in enumerate(zip(query_strs, cache_keys))
+		if cache_key
+		}
+	
+	query_ids = {
+		index: start_athena_query(
+			catalog_env=catalog_env,
+			database_env=database_env,
+			query_results_env=query_results_env,
+			query_str=query_str,
+			region_env=region_env,
+			s3_bucket_env=s3_bucket_env,
+			parameters=query_parameters[index],
+			result_reuse_max_age_env=(
+				None if cache_keys[index] else ATHENA_RESULT_REUSE_MAX_AGE_ENV
+				)
+			)["QueryExecutionId"]
+		for index, query_str in enumerate(query_strs)
+		if executions.get(index) is None
+		}
+	completed = wait_for_athena_queries(
+		query_ids=list(query_ids.values()),
+		region_env=region_env,
+		timeout_seconds=timeout_seconds
+		) if query_ids else {}
+	
+	for index, query_id in query_ids.items():
+		executions[index] = completed[query_id]
+		if cache_keys[index]:
+			_put_cached_athena_query_execution(
+				s3_bucket_env=s3_bucket_env,
+				cache_key=f"{cache_prefix}/{cache_keys[index]}.json",
+				query_str=query_strs[index],
+				query_id=query_id
+				)
+	return [executions[index] for index in range(len(query_strs))]
+
+
+def get_athena_query_cache_key(
+	query_str: str,
+	partition_snapshot: str = "",
+	parameters: Optional[list] = None
+	) -> str:
+	"""
+	Gets the query result cache key of a query, i.e. a hash of its normalised query text
+	(whitespace is collapsed and a trailing semicolon removed, so formatting changes do
+	not miss the cache), its execution parameters and the snapshot of the data that it
+	reads (see functions.s3.get_s3_prefix_snapshot)
+	:param query_str: SQL query as a string
+	:param partition_snapshot: Snapshot of the queried table partition
+	:param parameters: Athena execution parameters
+	:return: Cache key
+	"""
+	return hashlib.sha256(
+		json.dumps(
+			[normalise_athena_query(query_str), parameters or [], partition_snapshot]
+			).encode("utf-8")
+		).hexdigest()
+
+
+def normalise_athena_query(query_str: str) -> str:
+	"""
+	Normalises the text of a query for caching
+	:param query_str: SQL query as a string
+	:return: Normalised SQL query
+	"""
+	return " ".join(query_str.split()).rstrip(";").strip()
+
+
+def start_athena_query(
+	catalog_env: str,
+	database_env: str,
+	query_results_env: str,
+	query_str: str,
+	region_env: str,
+	s3_bucket_env: str,
+	parameters: Optional[list[str]] = None,
+	result_reuse_max_age_env: Optional[str] = ATHENA_RESULT_REUSE_MAX_AGE_ENV
+	) -> dict:
+	"""
+	Starts an Athena SQL query without waiting for it to complete. If the result reuse
+	Lambda environment variable is set, Athena returns the results of an identical
+	query that ran within that many minutes instead of scanning the data again, even if
+	the data has changed since, so it is off unless the variable is set. Result reuse
+	needs Athena engine version 3, so the query is started without it if the workgroup
+	does not support it.
 	:param catalog_env: Glue data catalog name from Lambda function environment variables
 	:param database_env: Glue database name from Lambda function environment variables
 	:param query_results_env: Query result location from Lambda function environment
 	variables
 	:param query_str: SQL query as a string
 	:param region_env: Athena region from Lambda function environment variables
-	:param s3_bucket_env:
-	:param parameters:
-	:return:
+	:param s3_bucket_env: S3 bucket name from Lambda function environment variables
+	:param parameters: Optional Athena execution parameters (? placeholders)
+	:param result_reuse_max_age_env: Maximum age in minutes of reused query results
+	from Lambda function environment variables, or None to never reuse results
+	:return: Response from Boto3 start_query_execution
 	"""
 	# Gets Lambda environment variables
 	s3_bucket = os.environ[s3_bucket_env]
 	query_result_location = os.environ[query_results_env]
+	result_reuse_max_age = (
+		int(os.environ.get(result_reuse_max_age_env) or 0)
+		if result_reuse_max_age_env else 0
+		)
 	
 	# Connects to boto3 Athena client
-	athena_client = boto3.client("athena", region_name=os.environ[region_env])
+	athena_client = get_boto3_client("athena", region_name=os.environ[region_env])
 	
 	# Gets kwargs for use in athena_client.start_query_execution
 	kwargs = {
@@ -52,37 +333,194 @@ def execute_athena_query(
 	
 	# Execution parameters added to start_query_execution if passed to function
 	if parameters:
-		kwargs["ExecutionParameters"] = {"Parameters": parameters}
+		kwargs["ExecutionParameters"] = parameters
 	
-	# Executes query
-	response = athena_client.start_query_execution(**kwargs)
+	# Result reuse added to start_query_execution if enabled
+	if result_reuse_max_age > 0:
+		kwargs["ResultReuseConfiguration"] = {
+			"ResultReuseByAgeConfiguration": {
+				"Enabled": True,
+				"MaxAgeInMinutes": result_reuse_max_age
+				}
+			}
 	
-	# Waits for the query to complete
-	status = "RUNNING"
-	while status in ["RUNNING", "QUEUED"]:
-		get_query_execution_response = athena_client.get_query_execution(
-			QueryExecutionId=response["QueryExecutionId"]
+	# Executes query
+	try:
+		response = athena_client.start_query_execution(**kwargs)
+	except ClientError as error:
+		if (
+			"ResultReuseConfiguration" not in kwargs
+			or error.response["Error"]["Code"] != "InvalidRequestException"
+		):
+			raise
+		logger.warning(
+			"Query result reuse is not supported by the workgroup: %s", error
 			)
-		status = get_query_execution_response["QueryExecution"]["Status"]["State"]
-		logger.info("Query execution status: %s", status)
-		time.sleep(1)
-		
-	logger.info("Query execution response: %s", json.dumps(response))
+		del kwargs["ResultReuseConfiguration"]
+		response = athena_client.start_query_execution(**kwargs)
+	
+	logger.info("Started query execution: %s", response["QueryExecutionId"])
 	return response
 
 
+def wait_for_athena_queries(
+	query_ids: list,
+	region_env: str = None,
+	initial_delay_seconds: float = DEFAULT_POLL_INITIAL_DELAY_SECONDS,
+	max_delay_seconds: float = DEFAULT_POLL_MAX_DELAY_SECONDS,
+	backoff: float = DEFAULT_POLL_BACKOFF,
+	timeout_seconds: float = DEFAULT_QUERY_TIMEOUT_SECONDS
+	) -> dict:
+	"""
+	Waits for several Athena queries to complete. Only the queries that are still
+	running are polled, and the delay between polls grows exponentially (from
+	initial_delay_seconds up to max_delay_seconds), so short queries return quickly
+	while long queries are not polled every second. Queries that are still running
+	after timeout_seconds are stopped. Raises AthenaQueryError if any query did not
+	succeed.
+	:param query_ids: Query execution IDs
+	:param region_env: Athena region from Lambda function environment variables
+	:param initial_delay_seconds: Delay before the first poll
+	:param max_delay_seconds: Maximum delay between polls
+	:param backoff: Multiplier of the delay after each poll
+	:param timeout_seconds: Maximum time to wait for all queries
+	:return: Dictionary of query execution ID and AthenaQueryExecution
+	"""
+	# Connects to boto3 Athena client
+	athena_client = _get_athena_client(region_env)
+	
+	executions = {}
+	running = list(dict.fromkeys(query_ids))
+	delay = initial_delay_seconds
+	deadline = time.monotonic() + timeout_seconds
+	while running:
+		time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+		delay = min(delay * backoff, max_delay_seconds)
+		
+		for query_id in list(running):
+			execution = _get_athena_query_execution(athena_client, query_id)
+			if execution.state not in ATHENA_RUNNING_STATES:
+				logger.info(
+					"Query execution %s: %s (%s bytes scanned)",
+					query_id,
+					execution.state,
+					execution.data_scanned_bytes
+					)
+				executions[query_id] = execution
+				running.remove(query_id)
+		
+		# Stops the queries that are still running once the timeout is reached
+		if running and time.monotonic() >= deadline:
+			for query_id in running:
+				athena_client.stop_query_execution(QueryExecutionId=query_id)
+				executions[query_id] = AthenaQueryExecution(
+					query_id=query_id,
+					state="CANCELLED",
+					state_change_reason=f"Timed out after {timeout_seconds} seconds"
+					)
+			running = []
+	
+	failed = {
+		query_id: f"{execution.state}: {execution.state_change_reason}"
+		for query_id, execution in executions.items()
+		if execution.state in ATHENA_FAILED_STATES
+		}
+	if failed:
+		logger.error("%s Athena queries did not succeed: %s", len(failed), failed)
+		raise AthenaQueryError("Athena queries did not succeed", failed=failed)
+	return executions
+
+
+def _get_athena_query_execution(athena_client, query_id: str) -> AthenaQueryExecution:
+	"""
+	Gets the state and statistics of an Athena query
+	"""
+	query_execution = athena_client.get_query_execution(
+		QueryExecutionId=query_id
+		)["QueryExecution"]
+	statistics = query_execution.get("Statistics", {})
+	return AthenaQueryExecution(
+		query_id=query_id,
+		state=query_execution["Status"]["State"],
+		data_scanned_bytes=statistics.get("DataScannedInBytes", 0),
+		execution_time_ms=statistics.get("TotalExecutionTimeInMillis", 0),
+		state_change_reason=query_execution["Status"].get("StateChangeReason")
+		)
+
+
+def _get_cached_athena_query_execution(
+	s3_bucket_env: str,
+	cache_key: str,
+	query_str: str,
+	region_env: str = None
+	) -> Optional[AthenaQueryExecution]:
+	"""
+	Gets the execution of a cached query, or None if the query is not cached or its
+	results are no longer available
+	"""
+	s3_client = get_boto3_client("s3")
+	try:
+		content_object = s3_client.get_object(
+			Bucket=os.environ[s3_bucket_env], Key=cache_key
+			)
+	except ClientError as error:
+		if error.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+			raise
+		return None
+	cache_entry = json.loads(content_object["Body"].read())
+	if cache_entry["query"] != normalise_athena_query(query_str):
+		return None
+	
+	try:
+		execution = _get_athena_query_execution(
+			_get_athena_client(region_env), cache_entry["query_id"]
+			)
+	except ClientError:
+		return None
+	if execution.state != "SUCCEEDED":
+		return None
+	
+	logger.info(
+		"Reusing cached results of query execution %s (%s)",
+		execution.query_id,
+		cache_entry["created"]
+		)
+	return execution._replace(cached=True)
+
+
+def _put_cached_athena_query_execution(
+	s3_bucket_env: str,
+	cache_key: str,
+	query_str: str,
+	query_id: str
+	):
+	"""
+	Caches the query execution ID of a succeeded query
+	"""
+	get_boto3_client("s3").put_object(
+		Bucket=os.environ[s3_bucket_env],
+		Key=cache_key,
+		Body=json.dumps({
+			"query": normalise_athena_query(query_str),
+			"query_id": query_id,
+			"created": datetime.now(timezone.utc).isoformat()
+			})
+		)
+
+
 def return_results_athena_query(
 	query_id: str,
 	max_results: int
 	) -> dict:
 	"""
-	Returns results of Athena SQL query.
+	Returns the first page of results of Athena SQL query. Use read_athena_query_result
+	to read every row.
 	:param query_id: Query execution ID
 	:param max_results: Maximum number of results to return from query
 	:return: response: Response from Boto3
 	"""
 	# Connects to boto3 Athena client
-	athena_client = boto3.client("athena")
+	athena_client = get_boto3_client("athena")
 	
 	# Gets query result
 	response = athena_client.get_query_results(
@@ -90,5 +528,146 @@ def return_results_athena_query(
 		MaxResults=max_results
 		)
 	
-	logger.info("Query result metadata: %s", json.dumps(response))
+	logger.info(
+		"Query %s result rows: %s", query_id, len(response["ResultSet"]["Rows"])
+		)
 	return response
+
+
+def read_athena_query_result(
+	query_id: str,
+	region_env: str = None,
+	from_s3: bool = False
+	) -> AthenaQueryResult:
+	"""
+	Reads every row of a completed Athena query and decodes the values by column type.
+	Rows are read from the GetQueryResults pages (see iter_athena_query_rows), or, if
+	from_s3 is True, straight from the csv result object in the query result location
+	(see iter_athena_query_rows_from_s3), which is faster for large results.
+	:param query_id: Query execution ID
+	:param region_env: Athena region from Lambda function environment variables
+	:param from_s3: Whether to read the csv result object from S3
+	:return: Decoded query result
+	"""
+	columns = get_athena_query_columns(query_id=query_id, region_env=region_env)
+	if from_s3:
+		rows = iter_athena_query_rows_from_s3(
+			query_id=query_id, columns=columns, region_env=region_env
+			)
+	else:
+		rows = iter_athena_query_rows(
+			query_id=query_id, columns=columns, region_env=region_env
+			)
+	result = AthenaQueryResult(columns=columns, rows=list(rows))
+	
+	logger.info("Query %s result rows: %s", query_id, len(result.rows))
+	return result
+
+
+def get_athena_query_columns(query_id: str, region_env: str = None) -> tuple:
+	"""
+	Gets the result columns of a completed Athena query
+	:param query_id: Query execution ID
+	:param region_env: Athena region from Lambda function environment variables
+	:return: Tuple of AthenaResultColumn
+	"""
+	athena_client = _get_athena_client(region_env)
+	response = athena_client.get_query_results(QueryExecutionId=query_id, MaxResults=1)
+	return _get_result_columns(response)
+
+
+def iter_athena_query_rows(
+	query_id: str,
+	columns: tuple,
+	region_env: str = None,
+	page_size: int = ATHENA_MAX_RESULTS_PAGE_SIZE
+	) -> Iterator[tuple]:
+	"""
+	Yields the decoded rows of a completed Athena query from every GetQueryResults page,
+	so results of any size are read without holding every page in memory. The header
+	row of SELECT queries is skipped.
+	:param query_id: Query execution ID
+	:param columns: Result columns (see get_athena_query_columns)
+	:param region_env: Athena region from Lambda function environment variables
+	:param page_size: Number of rows in each page (up to 1000)
+	:return: Iterator of row tuples
+	"""
+	athena_client = _get_athena_client(region_env)
+	column_names = [column.name for column in columns]
+	
+	paginator = athena_client.get_paginator("get_query_results")
+	pages = paginator.paginate(
+		QueryExecutionId=query_id,
+		PaginationConfig={"PageSize": min(page_size, ATHENA_MAX_RESULTS_PAGE_SIZE)}
+		)
+	for page_number, page in enumerate(pages):
+		for row_number, row in enumerate(page["ResultSet"]["Rows"]):
+			values = [data.get("VarCharValue") for data in row["Data"]]
+			if page_number == 0 and row_number == 0 and values == column_names:
+				continue
+			yield _decode_row(values, columns)
+
+
+def iter_athena_query_rows_from_s3(
+	query_id: str,
+	columns: tuple,
+	region_env: str = None
+	) -> Iterator[tuple]:
+	"""
+	Yields the decoded rows of a completed Athena query from the csv result object that
+	Athena writes to the query result location (<OutputLocation>/<query id>.csv). The
+	object is streamed, so large results are read without GetQueryResults requests. Empty
+	values are decoded as NULL for all but string columns, as the csv cannot tell them
+	apart.
+	:param query_id: Query execution ID
+	:param columns: Result columns (see get_athena_query_columns)
+	:param region_env: Athena region from Lambda function environment variables
+	:return: Iterator of row tuples
+	"""
+	athena_client = _get_athena_client(region_env)
+	output_location = athena_client.get_query_execution(
+		QueryExecutionId=query_id
+		)["QueryExecution"]["ResultConfiguration"]["OutputLocation"]
+	if not output_location.endswith(".csv"):
+		output_location = f"{output_location.rstrip('/')}/{query_id}.csv"
+	
+	rows = iter_rows_from_s3_csv_uri(output_location)
+	next(rows, None)  # Skips the header row
+	for row in rows:
+		yield _decode_row(
+			[
+				None if value == "" and column.type in ATHENA_TYPE_DECODERS else value
+				for value, column in zip(row, columns)
+				],
+			columns
+			)
+
+
+def _get_athena_client(region_env: str = None):
+	"""
+	Gets the boto3 Athena client of the region from Lambda function environment
+	variables, or of the default region
+	"""
+	return get_boto3_client(
+		"athena", region_name=os.environ[region_env] if region_env else None
+		)
+
+
+def _get_result_columns(response: dict) -> tuple:
+	"""
+	Gets the result columns from the ResultSetMetadata of a GetQueryResults response
+	"""
+	return tuple(
+		AthenaResultColumn(name=column["Name"], type=column["Type"].lower())
+		for column in response["ResultSet"]["ResultSetMetadata"]["ColumnInfo"]
+		)
+
+
+def _decode_row(values: list, columns: tuple) -> tuple:
+	"""
+	Decodes the string values of a result row by column type. NULL values are None.
+	"""
+	return tuple(
+		None if value is None else ATHENA_TYPE_DECODERS.get(column.type, str)(value)
+		for value, column in zip(values, columns)
+		)
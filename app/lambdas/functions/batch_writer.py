@@ -0,0 +1,209 @@
+from datetime import date
+import hashlib
+import json
+from .parquet_writer import create_parquet_bytes
+from .run_context import RunContext
+from .other import (
+    create_s3_object_name_for_batch_export,
+    create_s3_object_name_for_batch_manifest,
+    )
+from .s3 import put_object_in_s3_bucket
+from .serialization import NDJSON_COMPRESSIONS, create_ndjson_bytes
+from .sqs import transform_city_sqs_message_response_to_list
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Supported raw writer modes i.e. one S3 object per city, one newline-delimited json
+# object per invocation or one Parquet object per invocation in the compacted prefix
+RAW_WRITER_MODES = ("object", "batch", "parquet")
+
+# Supported file formats of batch objects
+RAW_BATCH_FILE_FORMATS = ("json", "parquet")
+
+# Supported compression of batch objects
+RAW_BATCH_COMPRESSIONS = NDJSON_COMPRESSIONS
+
+
+def get_raw_writer_mode() -> str:
+    """
+    Gets the raw writer mode from the RAW_WRITER_MODE Lambda environment variable
+    (default object)
+    :return: Raw writer mode
+    """
+    mode = os.environ.get("RAW_WRITER_MODE", "object")
+    if mode not in RAW_WRITER_MODES:
+        logger.error("Invalid raw writer mode: %s, expected %s", mode, RAW_WRITER_MODES)
+        raise ValueError("Invalid raw writer mode")
+    return mode
+
+
+def create_city_key(city_data_dict: dict) -> str:
+    """
+    Creates a key that identifies a city in a batch object and its manifest
+    :param city_data_dict: Dictionary containing city, region and country_code
+    :return: City key e.g. AUS-Western Australia-Perth
+    """
+    return "-".join(
+        [city_data_dict["country_code"], city_data_dict["region"], city_data_dict["city"]]
+        )
+
+
+def get_failed_city_keys(failed_records: list) -> set:
+    """
+    Gets the cities of failed SQS records, i.e. the cities that will be processed again
+    when the records are retried. Records whose message body could not be parsed have
+    no cities.
+    :param failed_records: Failed event['Records'] (see
+    functions.sqs.process_city_records_from_sqs_event)
+    :return: Set of (run date, city key) tuples (see create_city_key)
+    """
+    failed_city_keys = set()
+    for record in failed_records:
+        try:
+            city_data_list = transform_city_sqs_message_response_to_list(record=record)
+        except (KeyError, TypeError, ValueError):
+            continue
+        failed_city_keys.update(
+            (RunContext.from_city(city).run_date, create_city_key(city))
+            for city in city_data_list
+            )
+    return failed_city_keys
+
+
+def put_raw_batch_in_s3(
+    city_rows: dict,
+    s3_bucket_env: str,
+    raw_prefix_env: str,
+    manifest_prefix_env: str,
+    api_call_name: str,
+    compression: str = "none",
+    file_format: str = "json",
+    columns: tuple = None,
+    run_date: date = None,
+) -> str:
+    """
+    Puts the raw data rows of several cities in a single S3 object, followed by a
+    manifest of the cities in the object. The batch id is a hash of the city keys, so a
+    retried batch overwrites the same object and manifest instead of adding duplicates.
+    json objects are put in the raw prefix and Parquet objects are put in the compacted
+    (i.e. <raw prefix>_compacted) prefix that the Glue compaction jobs write to.
+    :param city_rows: Dictionary of city key (see create_city_key) and raw data rows
+    :param s3_bucket_env: S3 bucket name from Lambda function environment variables
+    :param raw_prefix_env: Raw data S3 prefix from Lambda function environment variables
+    :param manifest_prefix_env: Manifest S3 prefix from Lambda function environment
+    variables
+    :param api_call_name: Name to use in the key/filename e.g. iss-passes
+    :param compression: "none" or "gzip" (json only, Parquet is snappy compressed)
+    :param file_format: "json" or "parquet"
+    :param columns: Parquet column names and types (see functions.parquet_writer)
+    :param run_date: Run date of the cities (default today, see functions.run_context)
+    :return: S3 object key of the batch object
+    """
+    if file_format not in RAW_BATCH_FILE_FORMATS:
+        logger.error(
+            "Invalid raw batch file format: %s, expected %s",
+            file_format,
+            RAW_BATCH_FILE_FORMATS,
+            )
+        raise ValueError("Invalid raw batch file format")
+    if compression not in RAW_BATCH_COMPRESSIONS:
+        logger.error(
+            "Invalid raw batch compression: %s, expected %s",
+            compression,
+            RAW_BATCH_COMPRESSIONS,
+            )
+        raise ValueError("Invalid raw batch compression")
+
+    city_keys = sorted(city_rows)
+    batch_id = hashlib.sha256("\n".join(city_keys).encode("utf-8")).hexdigest()[:16]
+
+    # Writes the rows in a fixed order so that retries are identical
+    rows = [row for city_key in city_keys for row in city_rows[city_key]]
+    if file_format == "parquet":
+        body = create_parquet_bytes(rows=rows, columns=columns)
+        s3_bucket_prefix = f"{os.environ[raw_prefix_env]}_compacted"
+        extension = ".parquet"
+    else:
+        body = create_ndjson_bytes(rows=rows, compression=compression)
+        s3_bucket_prefix = os.environ[raw_prefix_env]
+        extension = ".json.gz" if compression == "gzip" else ".json"
+
+    s3_object_key = create_s3_object_name_for_batch_export(
+        s3_bucket_prefix=s3_bucket_prefix,
+        api_call_name=api_call_name,
+        batch_id=batch_id,
+        extension=extension,
+        run_date=run_date,
+        )
+    put_object_in_s3_bucket(s3_bucket=s3_bucket_env, body=body, s3_key=s3_object_key)
+
+    # Puts the manifest after the batch object so that counted cities always exist
+    manifest = {"object_key": s3_object_key, "records": len(city_keys), "cities": city_keys}
+    put_object_in_s3_bucket(
+        s3_bucket=s3_bucket_env,
+        body=json.dumps(manifest),
+        s3_key=create_s3_object_name_for_batch_manifest(
+            s3_bucket_prefix=os.environ[manifest_prefix_env],
+            batch_id=batch_id,
+            run_date=run_date,
+            ),
+        )
+
+    logger.info("Put %s cities in batch object: %s", len(city_keys), s3_object_key)
+    return s3_object_key
+
+
+def put_raw_batch_for_sqs_event(
+    city_rows: dict,
+    failed_records: list,
+    raw_prefix_env: str,
+    api_call_name: str,
+    columns: tuple = None,
+    run_date: date = None,
+) -> str:
+    """
+    Puts the raw data rows of an SQS invocation in a single S3 object (see
+    put_raw_batch_in_s3). Cities from failed records are left out, as the records are
+    retried and their cities will be written by a later invocation. The handlers call
+    this once per run date, as an invocation can hold cities of several runs (e.g. a
+    backfill). Uses the S3_BUCKET,
+    MANIFEST_PREFIX, RAW_WRITER_MODE and RAW_BATCH_COMPRESSION Lambda environment
+    variables.
+    :param city_rows: Dictionary of city key (see create_city_key) and raw data rows
+    :param failed_records: Failed event['Records'] (see
+    functions.sqs.process_city_records_from_sqs_event)
+    :param raw_prefix_env: Raw data S3 prefix from Lambda function environment variables
+    :param api_call_name: Name to use in the key/filename e.g. iss-passes
+    :param columns: Parquet column names and types (see functions.parquet_writer)
+    :param run_date: Run date of the cities in city_rows (default today)
+    :return: S3 object key of the batch object, or None if there were no cities
+    """
+    failed_city_keys = {
+        city_key
+        for city_run_date, city_key in get_failed_city_keys(failed_records)
+        if run_date is None or city_run_date == run_date
+        }
+
+    city_rows = {
+        city_key: rows
+        for city_key, rows in city_rows.items()
+        if city_key not in failed_city_keys
+        }
+    if not city_rows:
+        return None
+
+    return put_raw_batch_in_s3(
+        city_rows=city_rows,
+        s3_bucket_env="S3_BUCKET",
+        raw_prefix_env=raw_prefix_env,
+        manifest_prefix_env="MANIFEST_PREFIX",
+        api_call_name=api_call_name,
+        compression=os.environ.get("RAW_BATCH_COMPRESSION", "none"),
+        file_format="parquet" if get_raw_writer_mode() == "parquet" else "json",
+        columns=columns,
+        run_date=run_date,
+        )
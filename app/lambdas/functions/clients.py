@@ -0,0 +1,75 @@
+import threading
+from typing import Optional
+import boto3
+from botocore.config import Config
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Default size of the urllib3 connection pool used by each boto3 client. Can be
+# overridden with the BOTO3_MAX_POOL_CONNECTIONS Lambda environment variable.
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+# Module scope registry so that clients survive across records and warm Lambda
+# invocations. Keyed by (service name, region name).
+_boto3_session = None
+_boto3_clients = {}
+_boto3_clients_lock = threading.Lock()
+
+
+def get_boto3_client(
+    service_name: str,
+    region_name: Optional[str] = None,
+):
+    """
+    Returns a cached boto3 client for the service and region, creating it on first use.
+    Clients are created from a single shared boto3 session so that the botocore
+    service models are only loaded once and TLS connections are kept alive.
+    :param service_name: AWS service name e.g. s3, sqs, athena
+    :param region_name: AWS region name. Defaults to the session region (i.e.
+    AWS_REGION or AWS_DEFAULT_REGION)
+    :return: boto3 client
+    """
+    global _boto3_session
+
+    with _boto3_clients_lock:
+        # Creates the shared boto3 session (boto3.client() is not thread safe)
+        if _boto3_session is None:
+            _boto3_session = boto3.session.Session()
+
+        # Resolves the region so that the default region has a single registry entry
+        region = region_name or _boto3_session.region_name
+        key = (service_name, region)
+
+        client = _boto3_clients.get(key)
+        if client is None:
+            max_pool_connections = int(
+                os.environ.get(
+                    "BOTO3_MAX_POOL_CONNECTIONS", DEFAULT_MAX_POOL_CONNECTIONS
+                    )
+                )
+            client = _boto3_session.client(
+                service_name,
+                region_name=region,
+                config=Config(max_pool_connections=max_pool_connections),
+                )
+            _boto3_clients[key] = client
+            logger.info("Created boto3 client: %s (%s)", service_name, region)
+
+    return client
+
+
+def reset_boto3_clients() -> None:
+    """
+    Clears the cached boto3 session and clients. Used in tests so that each moto mock
+    gets freshly created clients.
+    :return: None
+    """
+    global _boto3_session
+
+    with _boto3_clients_lock:
+        _boto3_clients.clear()
+        _boto3_session = None
@@ -0,0 +1,91 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Supported execution modes for run_concurrently
+EXECUTION_MODES = ("thread", "asyncio", "sequential")
+
+
+class TaskResult(NamedTuple):
+    """
+    Result of running a function on a single item. Exactly one of result or error is
+    set so that errors are isolated to the item that raised them.
+    """
+    item: Any
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+def run_concurrently(
+    func: Callable[[Any], Any],
+    items: Iterable,
+    max_concurrency: int = 10,
+    mode: str = "thread",
+) -> list:
+    """
+    Runs a blocking function on each item with at most max_concurrency items in
+    progress at once. Exceptions are caught per item and returned in the results rather
+    than raised, so one failing item does not stop the others.
+    :param func: Function that takes a single item
+    :param items: Items to run the function on
+    :param max_concurrency: Maximum number of items in progress at once
+    :param mode: "thread" (thread pool), "asyncio" (event loop with a semaphore and
+    worker threads) or "sequential" (one item at a time)
+    :return: List of TaskResult in the same order as items
+    """
+    items = list(items)
+    if mode not in EXECUTION_MODES:
+        logger.error("Invalid execution mode: %s, expected %s", mode, EXECUTION_MODES)
+        raise ValueError("Invalid execution mode")
+
+    if mode == "sequential" or max_concurrency <= 1 or len(items) <= 1:
+        return [_run_task(func, item) for item in items]
+
+    if mode == "asyncio":
+        return asyncio.run(_run_tasks_asyncio(func, items, max_concurrency))
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(items))) as executor:
+        return list(executor.map(lambda item: _run_task(func, item), items))
+
+
+async def _run_tasks_asyncio(
+    func: Callable[[Any], Any],
+    items: list,
+    max_concurrency: int,
+) -> list:
+    """
+    Runs the blocking function on each item in worker threads, limited by a semaphore.
+    :param func: Function that takes a single item
+    :param items: Items to run the function on
+    :param max_concurrency: Maximum number of items in progress at once
+    :return: List of TaskResult in the same order as items
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_with_semaphore(item):
+        async with semaphore:
+            return await asyncio.to_thread(_run_task, func, item)
+
+    return list(await asyncio.gather(*(run_with_semaphore(item) for item in items)))
+
+
+def _run_task(
+    func: Callable[[Any], Any],
+    item: Any,
+) -> TaskResult:
+    """
+    Runs the function on a single item and captures any exception.
+    :param func: Function that takes a single item
+    :param item: Item to run the function on
+    :return: TaskResult
+    """
+    try:
+        return TaskResult(item=item, result=func(item))
+    except Exception as error:
+        logger.exception("Task failed for item: %s", item)
+        return TaskResult(item=item, error=error)
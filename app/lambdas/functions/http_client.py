@@ -0,0 +1,149 @@
+import random
+import re
+import threading
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Defaults that can be overridden with Lambda environment variables (see
+# get_http_session and http_get)
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_MAXSIZE = 10
+
+# Responses that are retried i.e. rate limiting and server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Responses that mean the api key was rejected (see is_auth_error)
+AUTH_ERROR_STATUS_CODES = (401, 403)
+
+# Query string parameters holding api keys, which are redacted from error messages
+API_KEY_PATTERN = re.compile(r"(api_?key|appid)=[^&\s]*", re.IGNORECASE)
+
+# Module scope session so that keep-alive connections survive warm Lambda invocations
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+class JitteredRetry(Retry):
+    """
+    urllib3 Retry with "full jitter" exponential backoff, so that concurrent Lambda
+    workers that are throttled at the same time do not all retry at the same time.
+    Retry-After headers on 429 and 503 responses are still respected.
+    """
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the shared requests session, creating it on first use. The session keeps
+    connections alive between requests and retries 429 and 5xx responses with jittered
+    exponential backoff. Uses the HTTP_MAX_RETRIES, HTTP_BACKOFF_FACTOR and
+    HTTP_POOL_MAXSIZE Lambda environment variables if set.
+    :return: requests session
+    """
+    global _http_session
+
+    with _http_session_lock:
+        if _http_session is None:
+            retry = JitteredRetry(
+                total=int(os.environ.get("HTTP_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                backoff_factor=float(
+                    os.environ.get("HTTP_BACKOFF_FACTOR", DEFAULT_BACKOFF_FACTOR)
+                    ),
+                status_forcelist=RETRY_STATUS_CODES,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+                )
+            pool_maxsize = int(os.environ.get("HTTP_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE))
+            adapter = HTTPAdapter(
+                pool_connections=pool_maxsize,
+                pool_maxsize=pool_maxsize,
+                max_retries=retry,
+                )
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+            logger.info("Created HTTP session")
+
+    return _http_session
+
+
+def http_get(
+    url: str,
+    params: Optional[dict] = None,
+) -> requests.Response:
+    """
+    Sends a GET request with the shared session. Requests time out after
+    HTTP_CONNECT_TIMEOUT and HTTP_READ_TIMEOUT seconds (Lambda environment variables)
+    so that a hung request can not use up the Lambda timeout.
+    :param url: Request url
+    :param params: Optional query string parameters
+    :return: requests response
+    :raises requests.HTTPError: if the response is still an error after retries
+    """
+    timeout = (
+        float(os.environ.get("HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+        float(os.environ.get("HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+        )
+
+    try:
+        response = get_http_session().get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException as error:
+        # Re-raises without the original message and context, which contain the url
+        # and therefore the api key
+        raise type(error)(
+            redact_api_keys(str(error)), response=error.response
+            ) from None
+    return response
+
+
+def is_auth_error(error: Exception) -> bool:
+    """
+    Checks whether an exception raised by http_get is an authentication error i.e. a
+    401 or 403 response, which can mean that the api key has been rotated.
+    :param error: Exception raised by http_get
+    :return: True if the api key was rejected
+    """
+    return (
+        isinstance(error, requests.HTTPError)
+        and error.response is not None
+        and error.response.status_code in AUTH_ERROR_STATUS_CODES
+        )
+
+
+def redact_api_keys(text: str) -> str:
+    """
+    Redacts api keys (e.g. apiKey= and appid= parameters) from a url or message.
+    :param text: Url or message
+    :return: Text with api key values replaced by ***
+    """
+    return API_KEY_PATTERN.sub(r"\1=***", text)
+
+
+def reset_http_session() -> None:
+    """
+    Closes and clears the shared session. Used in tests.
+    :return: None
+    """
+    global _http_session
+
+    with _http_session_lock:
+        if _http_session is not None:
+            _http_session.close()
+        _http_session = None
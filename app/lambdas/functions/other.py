@@ -1,4 +1,5 @@
-from datetime import datetime, date
+from datetime import date
+from .run_context import RunContext
 import logging
 
 # Sets logging level
@@ -12,6 +13,7 @@ def create_s3_object_name_for_api_data_export(
     region: str,
     country_code: str,
     api_call_name: str,
+    run_date: date = None,
 ) -> str:
     """
     Creates key name for saving api data into S3 bucket. Note that the s3_object_key (
@@ -21,24 +23,74 @@ def create_s3_object_name_for_api_data_export(
     :param region: Name of the region or state of the city
     :param country_code: 3-letter country code
     :param api_call_name: Name to use in the key/filename e.g. iss_passes or iss_weather
+    :param run_date: Run date (default today, see functions.run_context)
     :return: Object S3 key name
     """
-    # Gets current date to use in filename
-    date = datetime.now().strftime("%Y_%m_%d")
-    year_prefix = "year=" + datetime.now().strftime("%Y")
-    month_prefix = "month=" + datetime.now().strftime("%m")
-    day_prefix = "day=" + datetime.now().strftime("%d")
+    # Gets the run date once so that the filename and prefixes always match
+    run_context = _get_run_context(run_date)
 
     # Generates filename
     filename = "".join(
-        [api_call_name, "-", country_code, "-", region, "-", date, "-", city_name,
-         "-utc", ".json"]
+        [api_call_name, "-", country_code, "-", region, "-",
+         run_context.filename_date, "-", city_name, "-utc", ".json"]
         )
 
     # Generates final object key name (including the S3 prefixes)
-    s3_object_key = "/".join(
-        [s3_bucket_prefix, year_prefix, month_prefix, day_prefix, filename]
+    s3_object_key = "/".join([s3_bucket_prefix, run_context.date_prefix, filename])
+
+    logger.info("Successfully created S3 object name: %s", s3_object_key)
+    return s3_object_key
+
+
+def create_s3_object_name_for_batch_export(
+    s3_bucket_prefix: str,
+    api_call_name: str,
+    batch_id: str,
+    extension: str = ".json",
+    run_date: date = None,
+) -> str:
+    """
+    Creates key name for saving a batch of api data (several cities) into S3 bucket.
+    Uses the same year=, month= and day= partitions as
+    create_s3_object_name_for_api_data_export.
+    :param s3_bucket_prefix: S3 prefix to save file to
+    :param api_call_name: Name to use in the key/filename e.g. iss_passes or iss_weather
+    :param batch_id: Deterministic id of the batch
+    :param extension: File extension e.g. .json or .json.gz
+    :param run_date: Run date (default today, see functions.run_context)
+    :return: Object S3 key name
+    """
+    run_context = _get_run_context(run_date)
+    filename = "".join(
+        [api_call_name, "-batch-", run_context.filename_date, "-", batch_id, "-utc",
+         extension]
         )
 
+    s3_object_key = "/".join([s3_bucket_prefix, run_context.date_prefix, filename])
+
     logger.info("Successfully created S3 object name: %s", s3_object_key)
     return s3_object_key
+
+
+def create_s3_object_name_for_batch_manifest(
+    s3_bucket_prefix: str,
+    batch_id: str,
+    run_date: date = None,
+) -> str:
+    """
+    Creates key name for saving the manifest of a batch object into S3 bucket
+    :param s3_bucket_prefix: S3 manifest prefix to save file to
+    :param batch_id: Deterministic id of the batch
+    :param run_date: Run date (default today, see functions.run_context)
+    :return: Object S3 key name
+    """
+    return "/".join(
+        [s3_bucket_prefix, _get_run_context(run_date).date_prefix, f"{batch_id}.json"]
+        )
+
+
+def _get_run_context(run_date: date = None) -> RunContext:
+    """
+    Gets the run context of a run date, or of today if the run date is not set
+    """
+    return RunContext.today() if run_date is None else RunContext(run_date)
@@ -0,0 +1,174 @@
+import io
+import json
+from typing import Iterable
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Column names and types of the compacted tables. These match the StructType schemas
+# in glue/glue_scripts/*_json_compact.py (int is IntegerType, double is DoubleType and
+# string is StringType) so that Athena reads Lambda and Glue Parquet files the same.
+PASSES_COLUMNS = (
+    ("city", "string"),
+    ("lat", "double"),
+    ("lon", "double"),
+    ("region", "string"),
+    ("country", "string"),
+    ("satid", "int"),
+    ("satname", "string"),
+    ("transactionscount", "int"),
+    ("passescount", "int"),
+    ("startAz", "double"),
+    ("startAzCompass", "string"),
+    ("startEl", "double"),
+    ("startUTC", "int"),
+    ("maxAz", "double"),
+    ("maxAzCompass", "string"),
+    ("maxEl", "double"),
+    ("maxUTC", "int"),
+    ("endAz", "double"),
+    ("endAzCompass", "string"),
+    ("endEl", "double"),
+    ("endUTC", "int"),
+    ("mag", "double"),
+    ("duration", "int"),
+    ("startVisibility", "int"),
+    )
+
+WEATHER_COLUMNS = (
+    ("city", "string"),
+    ("lat", "double"),
+    ("lon", "double"),
+    ("region", "string"),
+    ("country", "string"),
+    ("timezone", "string"),
+    ("timezone_offset", "int"),
+    ("dt", "int"),
+    ("temp", "double"),
+    ("feels_like", "double"),
+    ("pressure", "int"),
+    ("humidity", "int"),
+    ("dew_point", "double"),
+    ("uvi", "double"),
+    ("clouds", "int"),
+    ("visibility", "int"),
+    ("wind_speed", "double"),
+    ("wind_deg", "int"),
+    ("wind_gust", "double"),
+    ("pop", "double"),
+    ("id", "int"),
+    ("main", "string"),
+    ("description", "string"),
+    ("icon", "string"),
+    ("rain", (("1h", "double"),)),
+    ("snow", (("1h", "double"),)),
+    )
+
+# Range of IntegerType (32-bit) values
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+
+def create_parquet_bytes(
+    rows: Iterable[dict],
+    columns: tuple,
+    compression: str = "snappy",
+) -> bytes:
+    """
+    Converts raw data rows (see transform_*_from_api_response in the sqs_to_*_api
+    Lambda functions) into a Parquet file with a fixed schema. Keys that are not
+    columns are dropped and values that do not match the column type are null.
+    :param rows: Iterable of raw data dictionaries
+    :param columns: Column names and types e.g. PASSES_COLUMNS or WEATHER_COLUMNS
+    :param compression: Parquet compression codec
+    :return: Parquet file contents
+    """
+    pa, pq = _import_pyarrow()
+
+    rows = list(rows)
+    table = pa.Table.from_pydict(
+        {
+            name: [_convert_value(row.get(name), column_type) for row in rows]
+            for name, column_type in columns
+            },
+        schema=get_arrow_schema(columns),
+        )
+
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=compression)
+    logger.info("Created Parquet file with %s rows", table.num_rows)
+    return buffer.getvalue()
+
+
+def get_arrow_schema(columns: tuple):
+    """
+    Creates a pyarrow schema from column names and types
+    :param columns: Column names and types e.g. PASSES_COLUMNS or WEATHER_COLUMNS
+    :return: pyarrow schema
+    """
+    pa, _ = _import_pyarrow()
+    return pa.schema(
+        [(name, _get_arrow_type(pa, column_type)) for name, column_type in columns]
+        )
+
+
+def _import_pyarrow():
+    """
+    Imports pyarrow when Parquet is first written, as it is large and only needed in
+    parquet raw writer mode.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        logger.error("pyarrow is required to write Parquet")
+        raise
+    return pa, pq
+
+
+def _get_arrow_type(pa, column_type):
+    """
+    Returns the pyarrow type of a column type. Tuples of (name, type) are structs.
+    """
+    if isinstance(column_type, tuple):
+        return pa.struct(
+            [(name, _get_arrow_type(pa, field_type)) for name, field_type in column_type]
+            )
+    return {"string": pa.string(), "int": pa.int32(), "double": pa.float64()}[column_type]
+
+
+def _convert_value(value, column_type):
+    """
+    Converts a raw value to the column type, or None if it cannot be converted. Strings
+    are converted to doubles as the city lat and lon are strings in the raw data.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+
+    if isinstance(column_type, tuple):
+        if not isinstance(value, dict):
+            return None
+        return {
+            name: _convert_value(value.get(name), field_type)
+            for name, field_type in column_type
+            }
+
+    if column_type == "string":
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return str(value)
+
+    if column_type == "int":
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, int) and INT_MIN <= value <= INT_MAX:
+            return value
+        return None
+
+    # Double columns
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
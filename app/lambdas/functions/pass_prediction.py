@@ -0,0 +1,368 @@
+import math
+import os
+import time
+from typing import Optional
+from .http_client import http_get
+import logging
+
+# numpy and sgp4 are only required by the pass prediction Lambda function
+try:
+    import numpy as np
+    from sgp4.api import Satrec
+except ImportError:
+    np = None
+    Satrec = None
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Defaults that can be overridden in lambdas_config.ini (see pass_prediction_config)
+DEFAULT_TLE_URL = "https://celestrak.org/NORAD/elements/gp.php?CATNR={nor_id}&FORMAT=TLE"
+DEFAULT_TLE_MAX_AGE_SECONDS = 12 * 3600
+DEFAULT_STEP_SECONDS = 10
+DEFAULT_SUN_MAX_ELEVATION = -6.0
+DEFAULT_STANDARD_MAGNITUDE = -1.8
+DEFAULT_CITY_CHUNK_SIZE = 100
+
+# WGS84 ellipsoid (km)
+WGS84_A = 6378.137
+WGS84_E2 = 6.69437999014e-3
+
+# Magnitude that N2YO reports when the magnitude is unknown
+UNKNOWN_MAGNITUDE = 100000
+
+COMPASS_POINTS = (
+    "N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+    "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW",
+)
+
+
+def get_tle(
+    nor_id: str,
+    tle_url: str = DEFAULT_TLE_URL,
+    cache_path: Optional[str] = None,
+    max_age_seconds: float = DEFAULT_TLE_MAX_AGE_SECONDS,
+) -> tuple:
+    """
+    Gets the two-line element set (TLE) of a satellite. The TLE is read from the cache
+    file if it is younger than max_age_seconds, otherwise it is downloaded once and
+    written to the cache file for later (warm) invocations.
+    :param nor_id: NORAD id of the satellite e.g. 25544 for the ISS
+    :param tle_url: Url of the TLE with a {nor_id} placeholder
+    :param cache_path: Cache file path. Defaults to /tmp/tle_<nor_id>.txt
+    :param max_age_seconds: Maximum age of the cache file in seconds
+    :return: Tuple of satellite name, TLE line 1 and TLE line 2
+    """
+    cache_path = cache_path or f"/tmp/tle_{nor_id}.txt"
+
+    if (
+        os.path.exists(cache_path)
+        and time.time() - os.path.getmtime(cache_path) < max_age_seconds
+    ):
+        with open(cache_path) as cache_file:
+            tle_text = cache_file.read()
+        logger.info("Read TLE from cache file: %s", cache_path)
+    else:
+        tle_text = http_get(tle_url.format(nor_id=nor_id)).text
+        with open(cache_path, "w") as cache_file:
+            cache_file.write(tle_text)
+        logger.info("Downloaded TLE for NORAD id: %s", nor_id)
+
+    return parse_tle(tle_text, default_name=str(nor_id))
+
+
+def parse_tle(
+    tle_text: str,
+    default_name: str = "",
+) -> tuple:
+    """
+    Parses a two or three line TLE.
+    :param tle_text: TLE text with an optional satellite name line
+    :param default_name: Satellite name used if the TLE has no name line
+    :return: Tuple of satellite name, TLE line 1 and TLE line 2
+    """
+    lines = [line.strip() for line in tle_text.splitlines() if line.strip()]
+    if len(lines) == 2:
+        lines.insert(0, default_name)
+
+    if len(lines) != 3 or not lines[1].startswith("1 ") or not lines[2].startswith("2 "):
+        logger.error("Invalid TLE: %s", tle_text)
+        raise ValueError("Invalid TLE")
+    return lines[0], lines[1], lines[2]
+
+
+def predict_passes(
+    cities: list,
+    tle: tuple,
+    nor_id: str,
+    start_utc: int,
+    days: float = 1,
+    min_visibility: float = 0,
+    obs_alt: float = 0.0,
+    step_seconds: int = DEFAULT_STEP_SECONDS,
+    sun_max_elevation: float = DEFAULT_SUN_MAX_ELEVATION,
+    standard_magnitude: float = DEFAULT_STANDARD_MAGNITUDE,
+    city_chunk_size: int = DEFAULT_CITY_CHUNK_SIZE,
+) -> list:
+    """
+    Predicts the visual passes of a satellite over every city from a single TLE. The
+    satellite is propagated once with SGP4, then the look angles of all cities are
+    computed in a vectorised sweep over cities x time steps. A time step is visible
+    when the satellite is above the horizon and sunlit, and the sun is below
+    sun_max_elevation at the city.
+    :param cities: City dictionaries containing lat and lon (see
+    functions.sqs._transform_city_message_data_to_dictionary)
+    :param tle: Tuple of satellite name, TLE line 1 and TLE line 2
+    :param nor_id: NORAD id of the satellite
+    :param start_utc: Unix time of the start of the prediction window
+    :param days: Length of the prediction window in days
+    :param min_visibility: Minimum visible duration of a pass in seconds
+    :param obs_alt: Altitude of the observers in metres
+    :param step_seconds: Time step of the sweep in seconds
+    :param sun_max_elevation: Maximum sun elevation in degrees for a pass to be visible
+    :param standard_magnitude: Magnitude of the satellite at 1000 km and 90 degrees phase
+    :param city_chunk_size: Number of cities swept at once, which bounds memory use
+    :return: List of N2YO visualpasses shaped responses i.e. {"info": {...},
+    "passes": [...]} in the same order as cities
+    """
+    if np is None or Satrec is None:
+        logger.error("numpy and sgp4 are required for pass prediction")
+        raise ImportError("numpy and sgp4 are required for pass prediction")
+
+    satname, line1, line2 = tle
+
+    # Propagates the satellite once for all cities
+    times = start_utc + np.arange(0, int(days * 86400) + 1, step_seconds, dtype=np.int64)
+    jd = 2440587.5 + times // 86400
+    fr = (times % 86400) / 86400.0
+    errors, sat_teme, _ = Satrec.twoline2rv(line1, line2).sgp4_array(
+        jd.astype(float), fr
+        )
+    valid = errors == 0
+
+    # Rotates the satellite and sun positions from the TEME (inertial) frame to the
+    # Earth fixed frame
+    gmst = _greenwich_mean_sidereal_time(jd, fr)
+    sun_teme = _sun_direction(jd, fr)
+    sat_ecef = _rotate_z(sat_teme, -gmst)
+    sun_ecef = _rotate_z(sun_teme, -gmst)
+    sunlit = _is_sunlit(sat_teme, sun_teme)
+
+    lat = np.radians([float(city["lat"]) for city in cities])
+    lon = np.radians([float(city["lon"]) for city in cities])
+    obs_ecef = _geodetic_to_ecef(lat, lon, obs_alt / 1000)
+    east, north, up = _east_north_up_basis(lat, lon)
+
+    responses = []
+    for chunk_start in range(0, len(cities), city_chunk_size):
+        chunk = slice(chunk_start, chunk_start + city_chunk_size)
+
+        # Look angles of every city (rows) at every time step (columns)
+        relative = sat_ecef[None, :, :] - obs_ecef[chunk, None, :]
+        rel_east = np.einsum("ck,ctk->ct", east[chunk], relative)
+        rel_north = np.einsum("ck,ctk->ct", north[chunk], relative)
+        rel_up = np.einsum("ck,ctk->ct", up[chunk], relative)
+        elevation = np.degrees(np.arctan2(rel_up, np.hypot(rel_east, rel_north)))
+        azimuth = np.degrees(np.arctan2(rel_east, rel_north)) % 360
+        sun_elevation = np.degrees(np.arcsin(np.clip(up[chunk] @ sun_ecef.T, -1, 1)))
+
+        visible = (
+            (elevation > 0)
+            & (sun_elevation < sun_max_elevation)
+            & sunlit[None, :]
+            & valid[None, :]
+            )
+
+        # Finds the start (inclusive) and end (exclusive) of each visible run
+        edges = np.diff(np.pad(visible.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+        run_cities, run_starts = np.nonzero(edges == 1)
+        _, run_ends = np.nonzero(edges == -1)
+
+        passes = [[] for _ in range(visible.shape[0])]
+        for city_index, start, end in zip(run_cities, run_starts, run_ends):
+            end -= 1
+            if times[end] - times[start] < min_visibility:
+                continue
+            peak = start + int(np.argmax(elevation[city_index, start:end + 1]))
+            passes[city_index].append(
+                _create_pass(
+                    times=times,
+                    azimuth=azimuth[city_index],
+                    elevation=elevation[city_index],
+                    start=start,
+                    peak=peak,
+                    end=end,
+                    mag=_visual_magnitude(
+                        relative=relative[city_index, peak],
+                        sun_direction=sun_ecef[peak],
+                        standard_magnitude=standard_magnitude,
+                        ),
+                    )
+                )
+
+        for city_passes in passes:
+            response = {
+                "info": {
+                    "satid": int(nor_id),
+                    "satname": satname,
+                    "transactionscount": 0,
+                    "passescount": len(city_passes),
+                    }
+                }
+            if city_passes:
+                response["passes"] = city_passes
+            responses.append(response)
+
+    logger.info(
+        "Predicted %s passes for %s cities",
+        sum(response["info"]["passescount"] for response in responses),
+        len(cities),
+        )
+    return responses
+
+
+def azimuth_to_compass(azimuth: float) -> str:
+    """
+    Converts an azimuth to a 16-point compass direction.
+    :param azimuth: Azimuth in degrees
+    :return: Compass direction e.g. NNE
+    """
+    return COMPASS_POINTS[int((azimuth % 360 + 11.25) // 22.5) % 16]
+
+
+def _create_pass(
+    times,
+    azimuth,
+    elevation,
+    start: int,
+    peak: int,
+    end: int,
+    mag: float,
+) -> dict:
+    """
+    Creates a pass in the N2YO visualpasses format from the time step indices of the
+    start, peak and end of the visible run.
+    :return: Pass dictionary
+    """
+    visual_pass = {}
+    for name, index in (("start", start), ("max", peak), ("end", end)):
+        visual_pass[f"{name}Az"] = round(float(azimuth[index]), 2)
+        visual_pass[f"{name}AzCompass"] = azimuth_to_compass(float(azimuth[index]))
+        visual_pass[f"{name}El"] = round(float(elevation[index]), 2)
+        visual_pass[f"{name}UTC"] = int(times[index])
+    visual_pass["mag"] = mag
+    visual_pass["duration"] = int(times[end] - times[start])
+    visual_pass["startVisibility"] = int(times[start])
+    return visual_pass
+
+
+def _visual_magnitude(relative, sun_direction, standard_magnitude: float) -> float:
+    """
+    Estimates the visual magnitude of the satellite from its range and the phase angle
+    (sun - satellite - observer) using a diffuse sphere model.
+    :param relative: Observer to satellite vector (km)
+    :param sun_direction: Unit vector towards the sun
+    :param standard_magnitude: Magnitude at 1000 km and 90 degrees phase
+    :return: Magnitude rounded to 1 decimal place
+    """
+    distance = float(np.linalg.norm(relative))
+    cos_phase = float(np.dot(sun_direction, -relative)) / distance
+    phase = math.acos(max(-1.0, min(1.0, cos_phase)))
+    phase_factor = math.sin(phase) + (math.pi - phase) * math.cos(phase)
+    if phase_factor <= 0:
+        return UNKNOWN_MAGNITUDE
+    mag = (
+        standard_magnitude
+        + 5 * math.log10(distance / 1000)
+        - 2.5 * math.log10(phase_factor)
+        )
+    return round(mag, 1)
+
+
+def _greenwich_mean_sidereal_time(jd, fr):
+    """
+    Greenwich mean sidereal time (IAU 1982) in radians.
+    """
+    centuries = ((jd - 2451545.0) + fr) / 36525.0
+    seconds = (
+        67310.54841
+        + (876600.0 * 3600 + 8640184.812866) * centuries
+        + 0.093104 * centuries ** 2
+        - 6.2e-6 * centuries ** 3
+        )
+    return np.radians((seconds % 86400) / 240.0)
+
+
+def _sun_direction(jd, fr):
+    """
+    Low precision (about 0.01 degree) unit vector towards the sun in the equatorial
+    frame, from the Astronomical Almanac.
+    """
+    days = (jd - 2451545.0) + fr
+    mean_longitude = np.radians(280.460 + 0.9856474 * days)
+    mean_anomaly = np.radians(357.528 + 0.9856003 * days)
+    ecliptic_longitude = (
+        mean_longitude
+        + np.radians(1.915) * np.sin(mean_anomaly)
+        + np.radians(0.020) * np.sin(2 * mean_anomaly)
+        )
+    obliquity = np.radians(23.439 - 0.0000004 * days)
+    return np.column_stack((
+        np.cos(ecliptic_longitude),
+        np.cos(obliquity) * np.sin(ecliptic_longitude),
+        np.sin(obliquity) * np.sin(ecliptic_longitude),
+        ))
+
+
+def _is_sunlit(sat_position, sun_direction):
+    """
+    Whether the satellite is outside the Earth's (cylindrical) shadow.
+    """
+    along_sun = np.einsum("tk,tk->t", sat_position, sun_direction)
+    across_sun = np.linalg.norm(
+        sat_position - along_sun[:, None] * sun_direction, axis=1
+        )
+    return (along_sun > 0) | (across_sun > WGS84_A)
+
+
+def _rotate_z(vectors, angle):
+    """
+    Rotates vectors (time steps x 3) about the z axis by angle (radians per time step).
+    """
+    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
+    return np.column_stack((
+        cos_angle * vectors[:, 0] - sin_angle * vectors[:, 1],
+        sin_angle * vectors[:, 0] + cos_angle * vectors[:, 1],
+        vectors[:, 2],
+        ))
+
+
+def _geodetic_to_ecef(lat, lon, alt):
+    """
+    Converts WGS84 geodetic coordinates (radians, km) to Earth fixed coordinates (km).
+    """
+    prime_vertical = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+    return np.column_stack((
+        (prime_vertical + alt) * np.cos(lat) * np.cos(lon),
+        (prime_vertical + alt) * np.cos(lat) * np.sin(lon),
+        (prime_vertical * (1 - WGS84_E2) + alt) * np.sin(lat),
+        ))
+
+
+def _east_north_up_basis(lat, lon):
+    """
+    Local east, north and up unit vectors (cities x 3) in Earth fixed coordinates.
+    """
+    east = np.column_stack((-np.sin(lon), np.cos(lon), np.zeros_like(lon)))
+    north = np.column_stack((
+        -np.sin(lat) * np.cos(lon),
+        -np.sin(lat) * np.sin(lon),
+        np.cos(lat),
+        ))
+    up = np.column_stack((
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+        ))
+    return east, north, up
@@ -0,0 +1,300 @@
+import random
+import threading
+import time
+from typing import Callable, Optional
+from botocore.exceptions import ClientError
+from .clients import get_boto3_client
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Default maximum time that a worker waits for a token before giving up. Can be
+# overridden with the RATE_LIMIT_MAX_WAIT_SECONDS Lambda environment variable.
+DEFAULT_MAX_WAIT_SECONDS = 60.0
+
+# Maximum number of attempts of a conditional write of the DynamoDB backend before the
+# update fails (i.e. when other containers keep updating the same bucket)
+DYNAMODB_MAX_UPDATE_ATTEMPTS = 10
+
+# Module scope rate limiters so that in-memory buckets survive warm invocations
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a token is not available within the maximum wait time (or the shared
+    bucket could not be updated). The record is failed so that SQS redelivers it after
+    the visibility timeout.
+    """
+
+
+class InMemoryRateLimitBackend:
+    """
+    Stores bucket state in memory. Coordinates the threads of a single Lambda
+    container and is used in tests.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, name: str, func: Callable[[Optional[dict]], tuple]):
+        """
+        Atomically applies func to the bucket state.
+        :param name: Bucket name
+        :param func: Takes the current state (None if new) and returns (new state,
+        result)
+        :return: Result from func
+        """
+        with self._lock:
+            state, result = func(self._states.get(name))
+            self._states[name] = state
+        return result
+
+
+class DynamoDBRateLimitBackend:
+    """
+    Stores bucket state as a DynamoDB item so that concurrent Lambda containers share
+    one bucket. Updates are conditional writes on the item's version, so an update
+    based on state that another container has since changed is retried with the new
+    state. The last written state is kept in memory, so an update is usually a single
+    PutItem request and the item is only read again after a conflict.
+    """
+
+    def __init__(
+        self,
+        table_env: str,
+        max_attempts: int = DYNAMODB_MAX_UPDATE_ATTEMPTS,
+    ):
+        self._table_name = os.environ[table_env]
+        self._max_attempts = max_attempts
+        # Bucket name and (state, version) of the last state read or written
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, name: str, func: Callable[[Optional[dict]], tuple]):
+        """
+        Applies func to the bucket state stored in DynamoDB. Nothing is written if
+        func returns the state unchanged.
+        :param name: Bucket name
+        :param func: Takes the current state (None if new) and returns (new state,
+        result)
+        :return: Result from func
+        :raises RateLimitExceeded: if the state could not be written within
+        max_attempts because of conflicting updates
+        """
+        dynamodb_client = get_boto3_client("dynamodb")
+
+        with self._lock:
+            for attempt in range(self._max_attempts):
+                if attempt:
+                    time.sleep(random.uniform(0, 0.05 * 2**attempt))
+                if name not in self._states:
+                    self._states[name] = self._get_state(dynamodb_client, name)
+                state, version = self._states[name]
+
+                new_state, result = func(state)
+                if new_state == state:
+                    return result
+                try:
+                    self._put_state(dynamodb_client, name, new_state, version)
+                except ClientError as error:
+                    if error.response["Error"]["Code"] != (
+                        "ConditionalCheckFailedException"
+                    ):
+                        raise
+                    # Another container has updated the bucket, so it is read again
+                    del self._states[name]
+                    continue
+                self._states[name] = (new_state, version + 1)
+                return result
+
+        logger.warning("Too many conflicting rate limit updates for: %s", name)
+        raise RateLimitExceeded(f"Too many conflicting rate limit updates for: {name}")
+
+    def _get_state(self, dynamodb_client, name: str) -> tuple:
+        """
+        Reads the bucket state and its version (0 if the bucket is new).
+        """
+        item = dynamodb_client.get_item(
+            TableName=self._table_name,
+            Key={"name": {"S": name}},
+            ConsistentRead=True,
+            ).get("Item")
+        if item is None:
+            return None, 0
+        state = {
+            "tokens": float(item["tokens"]["N"]),
+            "updated": float(item["updated"]["N"]),
+            }
+        return state, int(item["version"]["N"])
+
+    def _put_state(self, dynamodb_client, name: str, state: dict, version: int) -> None:
+        """
+        Writes the bucket state if its version has not changed since it was read.
+        """
+        if version == 0:
+            condition = {
+                "ConditionExpression": "attribute_not_exists(#name)",
+                # name is a DynamoDB reserved word
+                "ExpressionAttributeNames": {"#name": "name"},
+                }
+        else:
+            condition = {
+                "ConditionExpression": "version = :version",
+                "ExpressionAttributeValues": {":version": {"N": str(version)}},
+                }
+        dynamodb_client.put_item(
+            TableName=self._table_name,
+            Item={
+                "name": {"S": name},
+                "tokens": {"N": repr(float(state["tokens"]))},
+                "updated": {"N": repr(float(state["updated"]))},
+                "version": {"N": str(version + 1)},
+                },
+            **condition,
+            )
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. The bucket holds up to capacity tokens and refills at
+    capacity / period_seconds tokens per second. Each api request takes one token.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        capacity: float,
+        period_seconds: float,
+        backend,
+        max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_rate = self.capacity / period_seconds
+        self.backend = backend
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._sleep = sleep
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket, waiting for them to refill if required.
+        :param tokens: Number of tokens to take
+        :return: Total time waited in seconds
+        :raises RateLimitExceeded: if the tokens are not available within
+        max_wait_seconds
+        """
+        waited = 0.0
+        while True:
+            wait = self.backend.update(
+                self.name, lambda state: self._take(state, tokens)
+                )
+            if wait <= 0:
+                return waited
+            if waited + wait > self.max_wait_seconds:
+                logger.warning("Rate limit exceeded for: %s", self.name)
+                raise RateLimitExceeded(f"Rate limit exceeded for: {self.name}")
+            self._sleep(wait)
+            waited += wait
+
+    def observe_usage(self, used: float) -> None:
+        """
+        Syncs the bucket with the number of requests the api reports as used in the
+        current period (e.g. N2YO info.transactionscount), so that requests made by
+        other workers are accounted for.
+        :param used: Number of requests used in the current period
+        :return: None
+        """
+        self.backend.update(self.name, lambda state: self._observe(state, used))
+
+    def _refill(self, state: Optional[dict]) -> dict:
+        now = self._clock()
+        if state is None:
+            return {"tokens": self.capacity, "updated": now}
+        elapsed = max(now - state["updated"], 0)
+        tokens = min(self.capacity, state["tokens"] + elapsed * self.refill_rate)
+        return {"tokens": tokens, "updated": now}
+
+    def _take(self, state: Optional[dict], tokens: float) -> tuple:
+        refilled = self._refill(state)
+        if refilled["tokens"] >= tokens:
+            refilled["tokens"] -= tokens
+            return refilled, 0.0
+        # Nothing is taken, so the state is returned unchanged and is not written
+        wait = (tokens - refilled["tokens"]) / self.refill_rate
+        return (refilled if state is None else state), wait
+
+    def _observe(self, state: Optional[dict], used: float) -> tuple:
+        refilled = self._refill(state)
+        available = max(self.capacity - used, 0)
+        # The state is returned unchanged if the usage does not remove any tokens, so
+        # that shared backends do not write it
+        if state is not None and refilled["tokens"] <= available:
+            return state, None
+        refilled["tokens"] = min(refilled["tokens"], available)
+        return refilled, None
+
+
+def get_rate_limiter(
+    name: str,
+    capacity: float,
+    period_seconds: float,
+) -> TokenBucket:
+    """
+    Returns the module scope token bucket for name, creating it on first use. The
+    backend is selected with the RATE_LIMIT_BACKEND Lambda environment variable:
+    "memory" (default, one bucket per Lambda container) or "dynamodb" (one bucket
+    shared by every container, stored in the RATE_LIMIT_TABLE DynamoDB table).
+    :param name: Bucket name e.g. n2yo or openweather
+    :param capacity: Number of requests allowed per period
+    :param period_seconds: Length of the period in seconds
+    :return: TokenBucket
+    """
+    with _rate_limiters_lock:
+        rate_limiter = _rate_limiters.get(name)
+        if rate_limiter is None:
+            backend_name = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+            if backend_name == "dynamodb":
+                backend = DynamoDBRateLimitBackend(table_env="RATE_LIMIT_TABLE")
+            elif backend_name == "memory":
+                backend = InMemoryRateLimitBackend()
+            else:
+                logger.error("Invalid rate limit backend: %s", backend_name)
+                raise ValueError("Invalid rate limit backend")
+
+            rate_limiter = TokenBucket(
+                name=name,
+                capacity=capacity,
+                period_seconds=period_seconds,
+                backend=backend,
+                max_wait_seconds=float(
+                    os.environ.get(
+                        "RATE_LIMIT_MAX_WAIT_SECONDS", DEFAULT_MAX_WAIT_SECONDS
+                        )
+                    ),
+                )
+            _rate_limiters[name] = rate_limiter
+            logger.info(
+                "Created %s rate limiter: %s requests per %s seconds",
+                backend_name,
+                capacity,
+                period_seconds,
+                )
+    return rate_limiter
+
+
+def reset_rate_limiters() -> None:
+    """
+    Clears the module scope rate limiters. Used in tests.
+    :return: None
+    """
+    with _rate_limiters_lock:
+        _rate_limiters.clear()
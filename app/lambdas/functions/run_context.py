@@ -0,0 +1,149 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, NamedTuple
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# S3 prefix (i.e. Athena date partition) and filename date formats
+DATE_PREFIX_FORMAT = "year=%Y/month=%m/day=%d"
+FILENAME_DATE_FORMAT = "%Y_%m_%d"
+
+# Maximum number of days in a single backfill (see iter_run_contexts)
+MAX_BACKFILL_DAYS = 366
+
+
+class RunContext(NamedTuple):
+    """
+    The date that a pipeline run processes. It is created once at the start of a run
+    (see from_event) and passed to everything that depends on the date i.e. S3 object
+    names, the "already run today" check, the run ledger, SQS messages, Glue job
+    arguments and SQL templates, so a run that crosses midnight, a re-run or a
+    backfill of a past date all use the same date throughout.
+    """
+    run_date: date
+
+    @classmethod
+    def today(cls) -> "RunContext":
+        """
+        Creates the run context of the current UTC date
+        :return: Run context
+        """
+        return cls(datetime.now(timezone.utc).date())
+
+    @classmethod
+    def from_string(cls, run_date: str) -> "RunContext":
+        """
+        Creates a run context from an ISO date string
+        :param run_date: Run date e.g. 2023-05-23
+        :return: Run context
+        """
+        try:
+            return cls(date.fromisoformat(run_date))
+        except (TypeError, ValueError):
+            logger.error("Invalid run date: %s, expected YYYY-MM-DD", run_date)
+            raise ValueError("Invalid run date")
+
+    @classmethod
+    def from_event(cls, event: dict, run_date_env: str = "RUN_DATE") -> "RunContext":
+        """
+        Creates the run context of a Lambda invocation. The run date is taken from (in
+        order) the run_date of the step function input, the time of an EventBridge
+        scheduled event, the run date Lambda environment variable, or today.
+        :param event: Lambda event
+        :param run_date_env: Run date from Lambda function environment variables
+        :return: Run context
+        """
+        event = event if isinstance(event, dict) else {}
+        if event.get("run_date"):
+            return cls.from_string(event["run_date"])
+        if event.get("time"):
+            # e.g. 2023-05-23T16:00:00Z
+            return cls.from_string(event["time"][:10])
+        if os.environ.get(run_date_env):
+            return cls.from_string(os.environ[run_date_env])
+        return cls.today()
+
+    @classmethod
+    def from_city(cls, city_data_dict: dict) -> "RunContext":
+        """
+        Creates the run context of a city from an SQS message (see
+        functions.sqs.OPTIONAL_CITY_KEYS). Cities sent without a run date are run
+        today.
+        :param city_data_dict: Dictionary containing city, lat, lon and other data
+        :return: Run context
+        """
+        if city_data_dict.get("run_date"):
+            return cls.from_string(city_data_dict["run_date"])
+        return cls.today()
+
+    @property
+    def iso(self) -> str:
+        """
+        Run date in ISO format e.g. 2023-05-23
+        """
+        return self.run_date.isoformat()
+
+    @property
+    def date_prefix(self) -> str:
+        """
+        S3 date prefix e.g. year=2023/month=05/day=23
+        """
+        return self.run_date.strftime(DATE_PREFIX_FORMAT)
+
+    @property
+    def filename_date(self) -> str:
+        """
+        Date used in S3 object filenames e.g. 2023_05_23
+        """
+        return self.run_date.strftime(FILENAME_DATE_FORMAT)
+
+    def sql_parameters(self) -> dict:
+        """
+        Gets the named parameters of the SQL templates in sql_scripts i.e. {year},
+        {month}, {day} and {run_date}
+        :return: Dictionary of parameter name and value
+        """
+        return {
+            "year": self.run_date.strftime("%Y"),
+            "month": self.run_date.strftime("%m"),
+            "day": self.run_date.strftime("%d"),
+            "run_date": self.iso,
+            }
+
+    def glue_arguments(self) -> dict:
+        """
+        Gets the Glue job arguments of the run (see glue/glue_scripts)
+        :return: Dictionary of Glue job arguments
+        """
+        return {"--RUN_DATE": self.iso}
+
+    def to_dict(self) -> dict:
+        """
+        Gets the step function input of the run
+        :return: Dictionary containing run_date and the SQL parameters
+        """
+        return self.sql_parameters()
+
+
+def iter_run_contexts(start_date: str, end_date: str) -> Iterator[RunContext]:
+    """
+    Yields the run context of every date from start_date to end_date (inclusive) for a
+    backfill
+    :param start_date: First run date e.g. 2023-03-01
+    :param end_date: Last run date e.g. 2023-05-29
+    :return: Iterator of run contexts
+    """
+    start = RunContext.from_string(start_date).run_date
+    end = RunContext.from_string(end_date).run_date
+    days = (end - start).days + 1
+    if days < 1:
+        logger.error("Backfill end date %s is before start date %s", end, start)
+        raise ValueError("Backfill end date is before start date")
+    if days > MAX_BACKFILL_DAYS:
+        logger.error("Backfill of %s days exceeds %s days", days, MAX_BACKFILL_DAYS)
+        raise ValueError("Backfill date range is too long")
+
+    return (RunContext(start + timedelta(days=day)) for day in range(days))
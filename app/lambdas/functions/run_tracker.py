@@ -0,0 +1,491 @@
+from datetime import date
+import time
+from typing import Iterable
+from .batch_writer import create_city_key
+from .clients import get_boto3_client
+from .run_context import RunContext
+from .sqs import transform_city_sqs_message_response_to_list
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Default time that the step functions wait for a run to complete before failing. Can
+# be overridden with the RUN_TRACKER_TIMEOUT_SECONDS Lambda environment variable.
+DEFAULT_RUN_TIMEOUT_SECONDS = 3600
+
+# Number of days that run items are kept for (DynamoDB TTL)
+RUN_ITEM_TTL_DAYS = 30
+
+# Sort key of the run summary item. Each city of a run also has an item with the sort
+# key city#<city key> (see functions.batch_writer.create_city_key) holding its status.
+# The summary item holds the numbers of processed and failed cities, which are only
+# changed when a city item's status changes (in the same transaction), so a city that
+# is recorded more than once (e.g. a redelivered SQS message) is counted once.
+RUN_SUMMARY_ITEM = "run"
+CITY_ITEM_PREFIX = "city#"
+CITY_STATUSES = ("processed", "failed")
+
+# Maximum number of keys in a single BatchGetItem request
+DYNAMODB_MAX_BATCH_GET_SIZE = 100
+
+# Maximum number of items in a single TransactWriteItems request, i.e. the run summary
+# item and up to 99 city items
+DYNAMODB_MAX_TRANSACTION_SIZE = 100
+
+
+def get_run_id(pipeline: str, run_date: date = None) -> str:
+    """
+    Creates the id of a pipeline run. The pipelines run once a day, so the id is the
+    pipeline name and the run date.
+    :param pipeline: Pipeline name e.g. passes or weather
+    :param run_date: Run date (default today, see functions.run_context)
+    :return: Run id e.g. passes/2023-05-23
+    """
+    run_context = RunContext.today() if run_date is None else RunContext(run_date)
+    return f"{pipeline}/{run_context.iso}"
+
+
+def start_run(table_env: str, run_id: str, expected: int) -> dict:
+    """
+    Creates the run summary item with the number of cities that are expected to be
+    processed. Must be called before the cities are sent to the SQS queue. If the run
+    is re-started on the same day then the processed count is kept (only the missing
+    cities are sent again, see get_city_statuses) and the failed count is reset, as
+    the failed cities are retried, i.e. only cities that failed after the run started
+    are counted.
+    :param table_env: DynamoDB table name from Lambda function environment variables
+    :param run_id: Run id (see get_run_id)
+    :param expected: Number of cities that are expected to be processed
+    :return: Run status (see get_run_status)
+    """
+    started_at = int(time.time())
+    response = get_boto3_client("dynamodb").update_item(
+        TableName=os.environ[table_env],
+        Key=_create_item_key(run_id, RUN_SUMMARY_ITEM),
+        UpdateExpression=(
+            "SET expected = :expected, started_at = :started_at, "
+            "expires_at = :expires_at, #failed = :zero ADD #processed :zero"
+            ),
+        # processed is a DynamoDB reserved word
+        ExpressionAttributeNames={"#processed": "processed", "#failed": "failed"},
+        ExpressionAttributeValues={
+            ":expected": {"N": str(expected)},
+            ":started_at": {"N": str(started_at)},
+            ":expires_at": {"N": str(_get_expires_at(started_at))},
+            ":zero": {"N": "0"},
+            },
+        ReturnValues="ALL_NEW",
+        )
+    processed = int(response["Attributes"]["processed"]["N"])
+    logger.info(
+        "Started run: %s, expecting %s cities (%s already processed)",
+        run_id,
+        expected,
+        processed,
+        )
+    return _create_run_status(
+        run_id, expected, processed, 0, started_at, timeout_seconds=None
+        )
+
+
+def record_city_statuses(
+    table_env: str,
+    run_id: str,
+    city_keys: Iterable[str],
+    status: str,
+    max_attempts: int = 5,
+) -> int:
+    """
+    Puts the status of each city of a run in the run ledger and updates the run's
+    counts (see get_run_status). The current city items are read (BatchGetItem), and
+    the cities whose status changes are put with a condition on the status that was
+    read, in one transaction with the change of the counts of the run summary item (99
+    cities per TransactWriteItems request). A transaction that is cancelled by a
+    concurrent update is read and retried with exponential backoff.
+
+    Putting a city's status again does not change the run's counts, so SQS messages can
+    safely be recorded more than once. A processed city stays processed, and a failed
+    city is only counted again if it failed before the run was re-started.
+    :param table_env: DynamoDB table name from Lambda function environment variables
+    :param run_id: Run id (see get_run_id)
+    :param city_keys: City keys (see functions.batch_writer.create_city_key)
+    :param status: "processed" or "failed"
+    :param max_attempts: Maximum number of attempts per TransactWriteItems request
+    :return: Number of cities whose status changed
+    """
+    if status not in CITY_STATUSES:
+        logger.error("Invalid city status: %s, expected %s", status, CITY_STATUSES)
+        raise ValueError("Invalid city status")
+
+    client = get_boto3_client("dynamodb")
+    # Keys are de-duplicated as a transaction cannot put an item twice
+    city_keys = sorted(set(city_keys))
+    batch_size = DYNAMODB_MAX_TRANSACTION_SIZE - 1
+    changed = 0
+    for start in range(0, len(city_keys), batch_size):
+        batch_city_keys = city_keys[start:start + batch_size]
+        for attempt in range(max_attempts):
+            summary_item = _get_run_summary_item(table_env=table_env, run_id=run_id)
+            transaction = _create_city_status_transaction(
+                table_name=os.environ[table_env],
+                run_id=run_id,
+                city_items=_get_city_items(table_env, run_id, batch_city_keys),
+                city_keys=batch_city_keys,
+                status=status,
+                started_at=(
+                    int(summary_item["started_at"]["N"])
+                    if summary_item and "started_at" in summary_item
+                    else None
+                    ),
+                )
+            if not transaction:
+                break
+            try:
+                client.transact_write_items(TransactItems=transaction)
+                changed += len(transaction) - 1
+                break
+            except client.exceptions.TransactionCanceledException:
+                time.sleep(0.05 * 2**attempt)
+        else:
+            logger.error("Failed to put city statuses of run: %s", run_id)
+            raise Exception("Failed to put all city statuses in run ledger")
+
+    return changed
+
+
+def get_city_statuses(table_env: str, run_id: str) -> dict:
+    """
+    Gets the status of every city of a run that has been processed or has failed.
+    Cities that are not in the result are missing i.e. were never processed.
+    :param table_env: DynamoDB table name from Lambda function environment variables
+    :param run_id: Run id (see get_run_id)
+    :return: Dictionary of city key and status
+    """
+    return {
+        item["item"]["S"][len(CITY_ITEM_PREFIX):]: item["status"]["S"]
+        for item in _query_city_items(table_env=table_env, run_id=run_id)
+        }
+
+
+def get_processed_city_count(table_env: str, run_id: str) -> int:
+    """
+    Gets the number of processed cities of a run from the run summary item (a single
+    GetItem request). Used for the "has the pipeline already been run today" check.
+    :param table_env: DynamoDB table name from Lambda function environment variables
+    :param run_id: Run id (see get_run_id)
+    :return: Number of processed cities, or None if the run has not been started
+    """
+    item = _get_run_summary_item(table_env=table_env, run_id=run_id)
+    if item is None or "started_at" not in item:
+        return None
+    return int(item["processed"]["N"])
+
+
+def record_sqs_event_progress(
+    records: list,
+    failed_records: list,
+    table_env: str = "RUN_TRACKER_TABLE",
+    pipeline_env: str = "RUN_TRACKER_PIPELINE",
+    max_receive_count_env: str = "SQS_MAX_RECEIVE_COUNT",
+) -> dict:
+    """
+    Records the cities of an SQS invocation in the run tracker. Cities of successful
+    records are processed. Cities of failed records are only counted as failed on
+    their last receive (i.e. before SQS moves them to the dead-letter queue), as they
+    are otherwise retried. The counts of the run only change when a city's status in
+    the run ledger changes (see record_city_statuses), so recording a redelivered
+    message again does not count its cities twice. Does nothing if the table
+    environment variable is not set.
+    :param records: Takes event['Records'] input from SQS invoked lambda function
+    :param failed_records: Failed records (see process_city_records_from_sqs_event)
+    :param table_env: DynamoDB table name from Lambda function environment variables
+    :param pipeline_env: Pipeline name from Lambda function environment variables
+    :param max_receive_count_env: maxReceiveCount of the SQS redrive policy from Lambda
+    function environment variables
+    :return: Dictionary of the number of processed and failed cities, or None if the
+    run tracker is not used
+    """
+    if not os.environ.get(table_env):
+        return None
+
+    pipeline = os.environ[pipeline_env]
+    max_receive_count = int(os.environ.get(max_receive_count_env, "1"))
+    failed_message_ids = {record["messageId"] for record in failed_records}
+
+    # Cities are recorded in the run of their run date, as a batch can contain
+    # messages of more than one run e.g. during a backfill
+    runs = {}
+    for record in records:
+        status = "failed" if record["messageId"] in failed_message_ids else "processed"
+        receive_count = int(
+            record.get("attributes", {}).get("ApproximateReceiveCount", "1")
+            )
+        if status == "failed" and receive_count < max_receive_count:
+            continue
+        try:
+            city_data_list = transform_city_sqs_message_response_to_list(record=record)
+            run_dates = [RunContext.from_city(city).run_date for city in city_data_list]
+        except (KeyError, TypeError, ValueError):
+            # Invalid messages are counted as a single city of today's run, keyed by
+            # their message id
+            run = _get_run_progress(runs, get_run_id(pipeline))
+            run["progress"][status] += 1
+            run["city_keys"][status].append(f"message-{record['messageId']}")
+            continue
+        for city, run_date in zip(city_data_list, run_dates):
+            run = _get_run_progress(runs, get_run_id(pipeline, run_date))
+            run["progress"][status] += 1
+            run["city_keys"][status].append(create_city_key(city))
+
+    for run_id, run in runs.items():
+        # A city in both a successful and a failed (duplicate) message is processed
+        processed_city_keys = set(run["city_keys"]["processed"])
+        run["city_keys"]["failed"] = [
+            city_key
+            for city_key in run["city_keys"]["failed"]
+            if city_key not in processed_city_keys
+            ]
+        for status in CITY_STATUSES:
+            record_city_statuses(
+                table_env=table_env,
+                run_id=run_id,
+                city_keys=run["city_keys"][status],
+                status=status,
+                )
+
+    return {
+        status: sum(run["progress"][status] for run in runs.values())
+        for status in CITY_STATUSES
+        }
+
+
+def get_run_status(
+    table_env: str,
+    run_id: str,
+    timeout_seconds: int = DEFAULT_RUN_TIMEOUT_SECONDS,
+) -> dict:
+    """
+    Gets the status of a run. A run is complete when the number of processed plus
+    failed cities reaches the number of expected cities. The counts are read from the
+    run summary item (a single GetItem request), so polling the status does not depend
+    on the number of cities.
+    :param table_env: DynamoDB table name from Lambda function environment variables
+    :param run_id: Run id (see get_run_id)
+    :param timeout_seconds: Time after the run started that it has timed out
+    :return: Dictionary of run_id, expected, processed, failed, started_at, complete
+    and timed_out
+    """
+    item = _get_run_summary_item(table_env=table_env, run_id=run_id)
+    if item is None or "started_at" not in item:
+        logger.error("Run not found: %s", run_id)
+        raise ValueError("Run not found")
+
+    return _create_run_status(
+        run_id,
+        int(item["expected"]["N"]),
+        int(item["processed"]["N"]),
+        int(item["failed"]["N"]),
+        int(item["started_at"]["N"]),
+        timeout_seconds=timeout_seconds,
+        )
+
+
+def _get_run_progress(runs: dict, run_id: str) -> dict:
+    """
+    Gets the progress of a run within an SQS invocation (see record_sqs_event_progress)
+    """
+    if run_id not in runs:
+        runs[run_id] = {
+            "progress": {"processed": 0, "failed": 0},
+            "city_keys": {"processed": [], "failed": []},
+            }
+    return runs[run_id]
+
+
+def _query_city_items(table_env: str, run_id: str) -> Iterable[dict]:
+    """
+    Gets the status of every city item of a run.
+    """
+    paginator = get_boto3_client("dynamodb").get_paginator("query")
+    for page in paginator.paginate(
+        TableName=os.environ[table_env],
+        KeyConditionExpression="run_id = :run_id AND begins_with(#item, :prefix)",
+        # item and status are DynamoDB reserved words
+        ExpressionAttributeNames={"#item": "item", "#status": "status"},
+        ExpressionAttributeValues={
+            ":run_id": {"S": run_id},
+            ":prefix": {"S": CITY_ITEM_PREFIX},
+            },
+        ProjectionExpression="#item, #status",
+        ConsistentRead=True,
+        ):
+        yield from page["Items"]
+
+
+def _get_city_items(table_env: str, run_id: str, city_keys: list) -> dict:
+    """
+    Gets the current city items of a run (BatchGetItem requests of up to 100 keys).
+    Cities without an item are not in the result.
+    """
+    client = get_boto3_client("dynamodb")
+    table_name = os.environ[table_env]
+    city_items = {}
+    for start in range(0, len(city_keys), DYNAMODB_MAX_BATCH_GET_SIZE):
+        request_items = {
+            table_name: {
+                "Keys": [
+                    _create_item_key(run_id, CITY_ITEM_PREFIX + city_key)
+                    for city_key in city_keys[start:start + DYNAMODB_MAX_BATCH_GET_SIZE]
+                    ],
+                "ConsistentRead": True,
+                }
+            }
+        attempt = 0
+        while request_items:
+            response = client.batch_get_item(RequestItems=request_items)
+            for item in response["Responses"].get(table_name, []):
+                city_items[item["item"]["S"][len(CITY_ITEM_PREFIX):]] = item
+            request_items = response.get("UnprocessedKeys")
+            if request_items:
+                time.sleep(0.05 * 2**attempt)
+                attempt += 1
+    return city_items
+
+
+def _create_city_status_transaction(
+    table_name: str,
+    run_id: str,
+    city_items: dict,
+    city_keys: list,
+    status: str,
+    started_at,
+) -> list:
+    """
+    Creates the TransactWriteItems items that change the status of the cities (see
+    record_city_statuses), or an empty list if no city's status changes. Each city
+    item is put with the started_at of the run, so a failed city is only counted in the
+    run's failed count until the run is re-started.
+    """
+    run_started_at = 0 if started_at is None else started_at
+    updated_at = int(time.time())
+    counts = {status: 0 for status in CITY_STATUSES}
+    transaction = []
+    for city_key in city_keys:
+        city_item = city_items.get(city_key)
+        old_status = city_item["status"]["S"] if city_item else None
+        counted = (
+            city_item is not None
+            and int(city_item["started_at"]["N"]) == run_started_at
+            )
+        if old_status == "processed" or (old_status == status and counted):
+            continue
+        counts[status] += 1
+        if old_status == "failed" and counted:
+            counts["failed"] -= 1
+
+        put = {
+            "TableName": table_name,
+            "Item": _create_item_key(run_id, CITY_ITEM_PREFIX + city_key)
+            | {
+                "status": {"S": status},
+                "started_at": {"N": str(run_started_at)},
+                "updated_at": {"N": str(updated_at)},
+                "expires_at": {"N": str(_get_expires_at(updated_at))},
+                },
+            }
+        if city_item is None:
+            put["ConditionExpression"] = "attribute_not_exists(#item)"
+            put["ExpressionAttributeNames"] = {"#item": "item"}
+        else:
+            put["ConditionExpression"] = (
+                "#status = :status AND started_at = :started_at"
+                )
+            put["ExpressionAttributeNames"] = {"#status": "status"}
+            put["ExpressionAttributeValues"] = {
+                ":status": city_item["status"],
+                ":started_at": city_item["started_at"],
+                }
+        transaction.append({"Put": put})
+
+    if not transaction:
+        return []
+
+    # The counts are only changed if the run has not been (re-)started since the run
+    # summary item was read. Cities of a run that has not been started are counted in
+    # a summary item without started_at.
+    update = {
+        "TableName": table_name,
+        "Key": _create_item_key(run_id, RUN_SUMMARY_ITEM),
+        "UpdateExpression": (
+            "ADD #processed :processed, #failed :failed "
+            "SET expires_at = if_not_exists(expires_at, :expires_at)"
+            ),
+        "ExpressionAttributeNames": {"#processed": "processed", "#failed": "failed"},
+        "ExpressionAttributeValues": {
+            ":processed": {"N": str(counts["processed"])},
+            ":failed": {"N": str(counts["failed"])},
+            ":expires_at": {"N": str(_get_expires_at(updated_at))},
+            },
+        }
+    if started_at is None:
+        update["ConditionExpression"] = "attribute_not_exists(started_at)"
+    else:
+        update["ConditionExpression"] = "started_at = :started_at"
+        update["ExpressionAttributeValues"][":started_at"] = {"N": str(started_at)}
+    return [{"Update": update}] + transaction
+
+
+def _get_run_summary_item(table_env: str, run_id: str) -> dict:
+    """
+    Gets the run summary item, or None if the run has not been started.
+    """
+    response = get_boto3_client("dynamodb").get_item(
+        TableName=os.environ[table_env],
+        Key=_create_item_key(run_id, RUN_SUMMARY_ITEM),
+        ConsistentRead=True,
+        )
+    return response.get("Item")
+
+
+def _create_item_key(run_id: str, item: str) -> dict:
+    """
+    Creates the key of a run ledger item i.e. the run summary or a city.
+    """
+    return {"run_id": {"S": run_id}, "item": {"S": item}}
+
+
+def _get_expires_at(timestamp: int) -> int:
+    """
+    Gets the time that a run ledger item is deleted by the DynamoDB TTL.
+    """
+    return timestamp + RUN_ITEM_TTL_DAYS * 86400
+
+
+def _create_run_status(
+    run_id: str,
+    expected: int,
+    processed: int,
+    failed: int,
+    started_at: int,
+    timeout_seconds,
+) -> dict:
+    """
+    Creates the run status dictionary that is returned to the step functions.
+    """
+    complete = processed + failed >= expected
+    return {
+        "run_id": run_id,
+        "expected": expected,
+        "processed": processed,
+        "failed": failed,
+        "started_at": started_at,
+        "complete": complete,
+        "timed_out": (
+            not complete
+            and timeout_seconds is not None
+            and time.time() - started_at > timeout_seconds
+            ),
+        }
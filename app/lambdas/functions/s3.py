@@ -1,5 +1,10 @@
 from datetime import date
-import boto3
+import hashlib
+import io
+import itertools
+import json
+from typing import Iterable, Iterator
+from .clients import get_boto3_client
 import os
 import csv
 import logging
@@ -8,6 +13,12 @@ import logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Columns of the city input data csv file, in the order they are put in city records
+CITY_CSV_COLUMNS = ('city', 'region', 'latitude', 'longitude', 'country', 'country_code')
+
+# Maximum number of keys in a DeleteObjects request
+S3_MAX_DELETE_KEYS = 1000
+
 
 def get_list_from_s3_csv_object(
 	input_data: str,
@@ -23,6 +34,84 @@ def get_list_from_s3_csv_object(
 	:param log_index: Used to specify a row index when logging contents of list
 	:return: List of input data file contents
 	"""
+	file_content = list(
+		iter_rows_from_s3_csv_object(
+			input_data=input_data,
+			prefix=prefix,
+			s3_bucket=s3_bucket
+			)
+		)
+	
+	logger.info(
+		'Successfully sent rows to SQS queue. Number of rows = %s', len(file_content) - 1
+		)
+	logger.info('First row of S3 object data: %s', file_content[log_index])
+	return file_content
+
+
+def iter_rows_from_s3_csv_object(
+	input_data: str,
+	prefix: str,
+	s3_bucket: str,
+	byte_range: tuple = None,
+	etag: str = None
+	) -> Iterator[list]:
+	"""
+	Reads the rows of an S3 csv object one at a time straight from the response body
+	(StreamingBody), so the object is never held in memory as a whole. A UTF-8 BOM is
+	removed.
+	:param input_data: Input data filename from Lambda function environment variables
+	:param prefix: Prefix name from Lambda function environment variables
+	:param s3_bucket: S3 bucket name from Lambda function environment variables
+	:param byte_range: Optional (start, end) byte offsets to read, end not included.
+	The range must start and end on a line boundary (see plan_s3_csv_object_shards).
+	:param etag: Optional ETag that the object must still have
+	:return: Iterator of csv rows, including the header row if the whole object is read
+	"""
+	get_object_kwargs = {}
+	if byte_range is not None:
+		get_object_kwargs['Range'] = f'bytes={byte_range[0]}-{byte_range[1] - 1}'
+	if etag is not None:
+		get_object_kwargs['IfMatch'] = etag
+	
+	# Gets the target S3 object, the body is only read as the rows are iterated
+	content_object = _get_s3_csv_object(
+		input_data=input_data,
+		prefix=prefix,
+		s3_bucket=s3_bucket,
+		**get_object_kwargs
+		)
+	return _iter_csv_rows(content_object.get('Body'))
+
+
+def iter_rows_from_s3_csv_uri(s3_uri: str) -> Iterator[list]:
+	"""
+	Reads the rows of an S3 csv object from its S3 URI one at a time (see
+	iter_rows_from_s3_csv_object), e.g. an Athena query result object
+	:param s3_uri: S3 URI e.g. s3://bucket/query-results/<query id>.csv
+	:return: Iterator of csv rows, including the header row
+	"""
+	if not s3_uri.startswith('s3://') or '/' not in s3_uri[len('s3://'):]:
+		logger.error('Invalid S3 URI: %s, expected s3://bucket/key', s3_uri)
+		raise ValueError('Invalid S3 URI')
+	bucket, key = s3_uri[len('s3://'):].split('/', 1)
+	
+	# Connects to boto S3 client
+	s3_client = get_boto3_client("s3")
+	
+	content_object = s3_client.get_object(Bucket=bucket, Key=key)
+	return _iter_csv_rows(content_object.get('Body'))
+
+
+def _get_s3_csv_object(
+	input_data: str,
+	prefix: str,
+	s3_bucket: str,
+	**get_object_kwargs
+	) -> dict:
+	"""
+	Checks that the input data file is a .csv file then gets it from S3.
+	"""
 	# Gets Lambda environment variables
 	# Checks that input_data file is a .csv file
 	input_data_env = os.environ[input_data]
@@ -35,21 +124,212 @@ def get_list_from_s3_csv_object(
 	prefix_env = os.environ[prefix]
 	
 	# Connects to boto S3 client
-	s3_client = boto3.client('s3')
+	s3_client = get_boto3_client("s3")
 	
-	# Gets content of the target S3 object as a list
-	content_object = s3_client.get_object(
+	return s3_client.get_object(
 		Bucket=s3_bucket_env,
-		Key=f'{prefix_env}/{input_data_env}'
+		Key=f'{prefix_env}/{input_data_env}',
+		**get_object_kwargs
 		)
-	file_content = content_object.get('Body').read().decode('utf-8-sig')
-	file_content = list(csv.reader(file_content.splitlines()))
+
+
+def _iter_csv_rows(body) -> Iterator[list]:
+	"""
+	Decodes and parses a csv response body as it is read. newline='' is used so that
+	quoted fields can contain line breaks.
+	"""
+	with io.TextIOWrapper(body, encoding='utf-8-sig', newline='') as text_body:
+		yield from csv.reader(text_body)
+
+
+def plan_s3_csv_object_shards(
+	input_data: str,
+	prefix: str,
+	s3_bucket: str,
+	shards: int,
+	chunk_size: int = 1024 * 1024
+	) -> dict:
+	"""
+	Splits an S3 csv object into shards of about the same size that can be read in
+	parallel (see iter_rows_from_s3_csv_object). The object is scanned once in chunks
+	to find the line boundaries, so every shard starts and ends on a whole row, and
+	the non-blank rows are counted. Quoted fields must not contain line breaks.
+	:param input_data: Input data filename from Lambda function environment variables
+	:param prefix: Prefix name from Lambda function environment variables
+	:param s3_bucket: S3 bucket name from Lambda function environment variables
+	:param shards: Maximum number of shards (shards without rows are left out)
+	:param chunk_size: Number of bytes read from the object at a time
+	:return: Dictionary of the header row, ETag, number of rows (not including the
+	header) and the shards i.e. [{"shard": 0, "start": 52, "end": 1024, "rows": 17}, ...]
+	"""
+	if shards < 1:
+		logger.error('Invalid number of shards: %s, expected >= 1', shards)
+		raise ValueError('Invalid number of shards')
 	
-	logger.info(
-		'Successfully sent rows to SQS queue. Number of rows = %s', len(file_content) - 1
+	content_object = _get_s3_csv_object(
+		input_data=input_data,
+		prefix=prefix,
+		s3_bucket=s3_bucket
 		)
-	logger.info('First row of S3 object data: %s', file_content[log_index])
-	return file_content
+	object_size = content_object['ContentLength']
+	lines = _iter_lines_with_offsets(content_object.get('Body'), chunk_size=chunk_size)
+	
+	header_line = next(lines, (0, b''))[1]
+	header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+	data_start = len(header_line)
+	
+	# Shards end at the first line boundary after each target offset
+	targets = [
+		data_start + (object_size - data_start) * count // shards
+		for count in range(1, shards)
+		]
+	shard_list = []
+	shard_start = data_start
+	shard_rows = 0
+	for offset, line in lines:
+		if targets and offset >= targets[0]:
+			while targets and offset >= targets[0]:
+				targets.pop(0)
+			if shard_rows:
+				shard_list.append(
+					{'start': shard_start, 'end': offset, 'rows': shard_rows}
+					)
+				shard_start = offset
+				shard_rows = 0
+		if line.strip():
+			shard_rows += 1
+	if shard_rows:
+		shard_list.append({'start': shard_start, 'end': object_size, 'rows': shard_rows})
+	
+	for count, shard in enumerate(shard_list):
+		shard['shard'] = count
+	rows = sum(shard['rows'] for shard in shard_list)
+	logger.info('Planned %s shards of %s rows in total', len(shard_list), rows)
+	return {
+		'header': header,
+		'etag': content_object['ETag'],
+		'rows': rows,
+		'shards': shard_list
+		}
+
+
+def _iter_lines_with_offsets(body, chunk_size: int) -> Iterator[tuple]:
+	"""
+	Yields the byte offset and contents (including the newline) of each line of a
+	response body, reading chunk_size bytes at a time.
+	"""
+	offset = 0
+	pending = b''
+	try:
+		for chunk in iter(lambda: body.read(chunk_size), b''):
+			data = pending + chunk
+			line_start = 0
+			line_end = data.find(b'\n')
+			while line_end != -1:
+				yield offset + line_start, data[line_start:line_end + 1]
+				line_start = line_end + 1
+				line_end = data.find(b'\n', line_start)
+			offset += line_start
+			pending = data[line_start:]
+		if pending:
+			yield offset, pending
+	finally:
+		body.close()
+
+
+def iter_city_records_from_s3_csv_object(
+	input_data: str,
+	prefix: str,
+	s3_bucket: str
+	) -> Iterator[dict]:
+	"""
+	Reads the city input data csv object one city at a time (see
+	iter_rows_from_s3_csv_object and create_city_records_from_csv_rows), so that the
+	cities can be sent to SQS as they are read.
+	:param input_data: Input data filename from Lambda function environment variables
+	:param prefix: Prefix name from Lambda function environment variables
+	:param s3_bucket: S3 bucket name from Lambda function environment variables
+	:return: Iterator of city dictionaries
+	"""
+	return create_city_records_from_csv_rows(
+		iter_rows_from_s3_csv_object(
+			input_data=input_data,
+			prefix=prefix,
+			s3_bucket=s3_bucket
+			)
+		)
+
+
+def iter_city_records_from_s3_csv_shard(
+	input_data: str,
+	prefix: str,
+	s3_bucket: str,
+	shard: dict,
+	header: list,
+	etag: str = None
+	) -> Iterator[dict]:
+	"""
+	Reads the cities of a single shard of the city input data csv object (see
+	plan_s3_csv_object_shards) one city at a time.
+	:param input_data: Input data filename from Lambda function environment variables
+	:param prefix: Prefix name from Lambda function environment variables
+	:param s3_bucket: S3 bucket name from Lambda function environment variables
+	:param shard: Shard dictionary containing the start and end byte offsets
+	:param header: Header row of the csv object
+	:param etag: Optional ETag that the object must still have
+	:return: Iterator of city dictionaries
+	"""
+	return create_city_records_from_csv_rows(
+		itertools.chain(
+			[header],
+			iter_rows_from_s3_csv_object(
+				input_data=input_data,
+				prefix=prefix,
+				s3_bucket=s3_bucket,
+				byte_range=(shard['start'], shard['end']),
+				etag=etag
+				)
+			)
+		)
+
+
+def create_city_records_from_csv_rows(rows: Iterable[list]) -> Iterator[dict]:
+	"""
+	Maps the rows of the city input data csv to city dictionaries using the header row,
+	so the columns can be in any order. The header row is checked straight away and
+	the other rows are mapped as they are iterated. Blank rows are skipped.
+	:param rows: Iterable of csv rows, including the header row
+	:return: Iterator of dictionaries containing city, region, latitude, longitude,
+	country and country_code
+	"""
+	rows = iter(rows)
+	header = next(rows, None)
+	if header is None:
+		logger.error('City input data has no header row')
+		raise ValueError('City input data has no header row')
+	
+	# Creates dictionary of column header (key) and column index (value)
+	headers = {value.strip(): count for count, value in enumerate(header)}
+	missing_columns = [column for column in CITY_CSV_COLUMNS if column not in headers]
+	if missing_columns:
+		logger.error('City input data is missing columns: %s', missing_columns)
+		raise ValueError('City input data is missing columns')
+	column_indexes = [(column, headers[column]) for column in CITY_CSV_COLUMNS]
+	return _iter_city_records(rows, column_indexes)
+
+
+def _iter_city_records(rows: Iterator[list], column_indexes: list) -> Iterator[dict]:
+	"""
+	Yields a city dictionary for each non-blank csv row.
+	"""
+	city_count = 0
+	for row in rows:
+		if not row:
+			continue
+		yield {column: row[index] for column, index in column_indexes}
+		city_count += 1
+	
+	logger.info('Read %s cities from city input data', city_count)
 
 
 def get_sql_query_string_from_s3_sql_object(
@@ -69,7 +349,7 @@ def get_sql_query_string_from_s3_sql_object(
 	prefix_env = os.environ[prefix]
 	
 	# Connects to boto3 S3 client
-	s3_client = boto3.client("s3")
+	s3_client = get_boto3_client("s3")
 	
 	# Checks that the sql_filename is a .sql file
 	sql_file = sql_filename
@@ -105,7 +385,7 @@ def put_object_in_s3_bucket(
 	s3_bucket_name = os.environ[s3_bucket]
 	
 	# Connects to boto3 S3 client
-	s3_client = boto3.client("s3")
+	s3_client = get_boto3_client("s3")
 	
 	# Puts object in S3 bucket
 	response = s3_client.put_object(
@@ -122,13 +402,15 @@ def put_object_in_s3_bucket(
 
 def count_objects_in_s3_prefix(
 	s3_bucket_env: str,
-	base_prefix_env: str
+	base_prefix_env: str,
+	run_date: date = None
 	) -> int:
 	"""
 	Counts number of saved objects in prefix with year=, month= and day= prefixes
 	:param s3_bucket_env: S3 bucket name from Lambda function environment variables
 	:param base_prefix_env: S3 prefix that comes after the S3 bucket e.g.
 	s3_bucket/base_prefix/files
+	:param run_date: Run date (default today, see functions.run_context)
 	:return: Number of objects in base prefix
 	"""
 	# Gets Lambda environment variables
@@ -136,27 +418,130 @@ def count_objects_in_s3_prefix(
 	base_prefix = os.environ[base_prefix_env]
 	
 	# Connects to boto3 S3 client
-	client = boto3.client("s3")
+	client = get_boto3_client("s3")
 	
 	# Specifies S3 prefix format and Athena date partition format
 	date_format = "year=%Y/month=%m/day=%d"
 	
-	# Gets current UTC date
-	utc_date = date.today()
+	# Gets the run date (default current UTC date)
+	utc_date = run_date or date.today()
 	utc_date = str(date.strftime(utc_date, date_format))
 	
-	# Returns number of objects in S3 prefix. If there are no objects then the KeyError
-	# is handled and the count is set to 0.
+	# Returns number of objects in S3 prefix. Pages without objects (e.g. an empty
+	# prefix) have no Contents and add nothing to the count.
 	count = 0
-	paginator = client.get_paginator("list_objects")
+	paginator = client.get_paginator("list_objects_v2")
 	for result in paginator.paginate(
 		Bucket=s3_bucket_name,
 		Prefix=f"{base_prefix}/{utc_date}/", Delimiter="/"):
-		try:
-			count += len(result["Contents"])
-		except KeyError:
-			count = 0
+		count += len(result.get("Contents", []))
 	
 	logger.info("Number of objects in %s: %s", os.environ[base_prefix_env], count)
 	return count
 
+
+
+def count_records_in_s3_manifests(
+	s3_bucket_env: str,
+	manifest_prefix_env: str,
+	run_date: date = None
+	) -> int:
+	"""
+	Counts number of cities in the run date's batch object manifests (see
+	functions.batch_writer). Used instead of count_objects_in_s3_prefix when each
+	object holds several cities. Cities are only counted once if they are in more than
+	one manifest.
+	:param s3_bucket_env: S3 bucket name from Lambda function environment variables
+	:param manifest_prefix_env: S3 manifest prefix from Lambda function environment
+	variables
+	:param run_date: Run date (default today, see functions.run_context)
+	:return: Number of cities in manifests
+	"""
+	# Gets Lambda environment variables
+	s3_bucket_name = os.environ[s3_bucket_env]
+	manifest_prefix = os.environ[manifest_prefix_env]
+	
+	# Connects to boto3 S3 client
+	client = get_boto3_client("s3")
+	
+	# Gets the run date (default current UTC date) in the S3 prefix format
+	utc_date = (run_date or date.today()).strftime("year=%Y/month=%m/day=%d")
+	
+	cities = set()
+	paginator = client.get_paginator("list_objects_v2")
+	for result in paginator.paginate(
+		Bucket=s3_bucket_name,
+		Prefix=f"{manifest_prefix}/{utc_date}/"):
+		for content in result.get("Contents", []):
+			content_object = client.get_object(Bucket=s3_bucket_name, Key=content["Key"])
+			cities.update(json.loads(content_object["Body"].read())["cities"])
+	
+	logger.info("Number of records in %s: %s", manifest_prefix, len(cities))
+	return len(cities)
+
+
+def delete_objects_in_s3_prefix(
+	s3_bucket_env: str,
+	prefix: str
+	) -> int:
+	"""
+	Deletes every object in an S3 prefix, in DeleteObjects requests of up to 1000 keys.
+	Used to replace a date partition (e.g. of the final table) when a run date is
+	re-run or backfilled.
+	:param s3_bucket_env: S3 bucket name from Lambda function environment variables
+	:param prefix: S3 prefix to delete e.g. query-results/year=2023/month=05/day=23/
+	:return: Number of deleted objects
+	"""
+	# Gets Lambda environment variables
+	s3_bucket_name = os.environ[s3_bucket_env]
+	
+	# Connects to boto3 S3 client
+	client = get_boto3_client("s3")
+	
+	deleted = 0
+	paginator = client.get_paginator("list_objects_v2")
+	for result in paginator.paginate(Bucket=s3_bucket_name, Prefix=prefix):
+		keys = [{"Key": content["Key"]} for content in result.get("Contents", [])]
+		for start in range(0, len(keys), S3_MAX_DELETE_KEYS):
+			response = client.delete_objects(
+				Bucket=s3_bucket_name,
+				Delete={"Objects": keys[start:start + S3_MAX_DELETE_KEYS], "Quiet": True}
+				)
+			if response.get("Errors"):
+				logger.error(
+					"Failed to delete %s objects in %s", len(response["Errors"]), prefix
+					)
+				raise Exception("Failed to delete objects in S3 prefix")
+			deleted += len(keys[start:start + S3_MAX_DELETE_KEYS])
+	
+	logger.info("Deleted %s objects in %s", deleted, prefix)
+	return deleted
+
+
+def get_s3_prefix_snapshot(s3_bucket_env: str, prefix: str) -> str:
+	"""
+	Gets a snapshot of the objects in an S3 prefix, i.e. a hash of every object's key,
+	ETag and size. The snapshot changes whenever an object is added, replaced or
+	deleted, so it identifies the data of a table partition (see
+	functions.athena.run_athena_queries).
+	:param s3_bucket_env: S3 bucket name from Lambda function environment variables
+	:param prefix: S3 prefix e.g. passes_raw_compacted/year=2023/month=05/day=23/
+	:return: Snapshot hash
+	"""
+	# Gets Lambda environment variables
+	s3_bucket_name = os.environ[s3_bucket_env]
+	
+	# Connects to boto3 S3 client
+	client = get_boto3_client("s3")
+	
+	objects = []
+	paginator = client.get_paginator("list_objects_v2")
+	for result in paginator.paginate(Bucket=s3_bucket_name, Prefix=prefix):
+		objects.extend(
+			(content["Key"], content["ETag"], content["Size"])
+			for content in result.get("Contents", [])
+			)
+	
+	snapshot = hashlib.sha256(json.dumps(sorted(objects)).encode("utf-8")).hexdigest()
+	logger.info("Snapshot of %s objects in %s: %s", len(objects), prefix, snapshot)
+	return snapshot
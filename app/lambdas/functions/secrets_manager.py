@@ -1,5 +1,8 @@
 import json
-import boto3
+import threading
+from time import monotonic
+from typing import Any, Callable
+from .clients import get_boto3_client
 import os
 import logging
 
@@ -7,21 +10,135 @@ import logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Default time that secrets are cached for. Can be overridden with the
+# SECRET_CACHE_TTL_SECONDS Lambda environment variable (0 disables the cache).
+DEFAULT_SECRET_CACHE_TTL_SECONDS = 300.0
 
-def get_secret_from_secrets_manager(region_env: str, secret_name: str) -> str:
+# Module scope cache so that secrets survive warm Lambda invocations. Keyed by
+# (region, secret name) with values of (secret, expiry time).
+_secret_cache = {}
+_secret_cache_lock = threading.Lock()
+
+
+def get_secret_from_secrets_manager(
+    region_env: str,
+    secret_name: str,
+    force_refresh: bool = False,
+) -> str:
     """
-    Returns secret from Secrets Manager for input into other lambda_functions.
+    Returns secret from Secrets Manager for input into other lambda_functions. Secrets
+    are cached in memory for SECRET_CACHE_TTL_SECONDS.
     :param region_env: Secrets Manager region from Lambda function environment variables
     :param secret_name: Name of the secret to be retrieved
+    :param force_refresh: If True then the cache is bypassed and updated
     :return: Secret as a string
     """
+    region = os.environ[region_env]
+
+    if not force_refresh:
+        secret = _get_cached_secret(region, secret_name)
+        if secret is not None:
+            return secret
+
     # Connects to boto3 Secrets Manager client
-    secrets_client = boto3.client("secretsmanager", region_name=os.environ[region_env])
+    secrets_client = get_boto3_client("secretsmanager", region_name=region)
 
     # Gets secret from Secrets Manager
     get_secret_value_response = secrets_client.get_secret_value(SecretId=secret_name)
-    secret = json.loads(get_secret_value_response["SecretString"])
-    secret = list(secret.values())[0]
+    secret = _parse_secret_string(get_secret_value_response["SecretString"])
+    _cache_secret(region, secret_name, secret)
 
     logger.info("Successfully retrieved secret: %s", secret_name)
     return secret
+
+
+def refresh_secret_from_secrets_manager(
+    region_env: str,
+    secret_name: str,
+    stale_secret: str,
+) -> str:
+    """
+    Refreshes a secret that was rejected (e.g. after the api key was rotated). If
+    another worker has already refreshed the cached secret then the cached secret is
+    returned without calling Secrets Manager again.
+    :param region_env: Secrets Manager region from Lambda function environment variables
+    :param secret_name: Name of the secret to be retrieved
+    :param stale_secret: Secret that was rejected
+    :return: Secret as a string
+    """
+    cached_secret = _get_cached_secret(os.environ[region_env], secret_name)
+    if cached_secret is not None and cached_secret != stale_secret:
+        return cached_secret
+    return get_secret_from_secrets_manager(
+        region_env=region_env, secret_name=secret_name, force_refresh=True
+        )
+
+
+def call_with_secret_refresh(
+    func: Callable[[str], Any],
+    secret: str,
+    region_env: str,
+    secret_name: str,
+    is_auth_error: Callable[[Exception], bool],
+) -> Any:
+    """
+    Calls func with the secret. If func raises an authentication error then the secret
+    is refreshed (see refresh_secret_from_secrets_manager) and func is retried once.
+    :param func: Function that takes the secret e.g. an api call
+    :param secret: Current secret
+    :param region_env: Secrets Manager region from Lambda function environment variables
+    :param secret_name: Name of the secret
+    :param is_auth_error: Function that returns True if an exception is an
+    authentication error
+    :return: Result of func
+    """
+    try:
+        return func(secret)
+    except Exception as error:
+        if not is_auth_error(error):
+            raise
+        logger.warning("Authentication failed, refreshing secret: %s", secret_name)
+
+    refreshed_secret = refresh_secret_from_secrets_manager(
+        region_env=region_env, secret_name=secret_name, stale_secret=secret
+        )
+    return func(refreshed_secret)
+
+
+def clear_secret_cache() -> None:
+    """
+    Removes all secrets from the cache. Used in tests.
+    :return: None
+    """
+    with _secret_cache_lock:
+        _secret_cache.clear()
+
+
+def _get_cached_secret(region: str, secret_name: str):
+    """
+    Returns the cached secret, or None if it is not cached or has expired.
+    """
+    with _secret_cache_lock:
+        cached = _secret_cache.get((region, secret_name))
+    if cached is None or monotonic() >= cached[1]:
+        return None
+    return cached[0]
+
+
+def _cache_secret(region: str, secret_name: str, secret: str) -> None:
+    """
+    Caches a secret for SECRET_CACHE_TTL_SECONDS.
+    """
+    ttl = float(
+        os.environ.get("SECRET_CACHE_TTL_SECONDS", DEFAULT_SECRET_CACHE_TTL_SECONDS)
+        )
+    with _secret_cache_lock:
+        _secret_cache[(region, secret_name)] = (secret, monotonic() + ttl)
+
+
+def _parse_secret_string(secret_string: str) -> str:
+    """
+    Returns the first value of a key/value secret string.
+    """
+    secret = json.loads(secret_string)
+    return list(secret.values())[0]
@@ -0,0 +1,122 @@
+import gzip
+import json
+import math
+from typing import Iterable, Iterator
+import logging
+
+# Uses orjson if it is installed as it is several times faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Supported compression of newline-delimited json bodies
+NDJSON_COMPRESSIONS = ("none", "gzip")
+
+# Compact encoder used if orjson is not installed. Non-finite floats are null as in
+# orjson (see _encode_json), but other floats can be formatted differently from orjson
+# e.g. 1e+16 instead of 1e16, which decode to the same value.
+_json_encoder = json.JSONEncoder(
+    ensure_ascii=False, separators=(",", ":"), allow_nan=False
+    )
+
+
+def get_json_encoder_name() -> str:
+    """
+    Returns the name of the json encoder that is used
+    :return: "orjson" or "json"
+    """
+    return "json" if orjson is None else "orjson"
+
+
+def dumps_json(record) -> bytes:
+    """
+    Serializes a record to compact UTF-8 json
+    :param record: Dictionary (or other json serializable value)
+    :return: json bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(record)
+    return _encode_json(record).encode("utf-8")
+
+
+def iter_ndjson_lines(rows: Iterable[dict]) -> Iterator[bytes]:
+    """
+    Serializes rows to json lines, each ending in a newline
+    :param rows: Iterable of raw data dictionaries
+    :return: Iterator of json lines
+    """
+    if orjson is not None:
+        for row in rows:
+            yield orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+    else:
+        for row in rows:
+            yield (_encode_json(row) + "\n").encode("utf-8")
+
+
+def create_ndjson_bytes(
+    rows: Iterable[dict],
+    compression: str = "none",
+) -> bytes:
+    """
+    Converts raw data rows into a newline-delimited json (json lines) body that can be
+    put in S3 directly
+    :param rows: Iterable of raw data dictionaries
+    :param compression: "none" or "gzip"
+    :return: json lines body
+    """
+    return join_ndjson_lines(iter_ndjson_lines(rows), compression=compression)
+
+
+def join_ndjson_lines(
+    lines: Iterable[bytes],
+    compression: str = "none",
+) -> bytes:
+    """
+    Joins serialized json lines (see iter_ndjson_lines) into a single body. The body
+    is sized from the lengths of the lines and filled once, and is only copied again
+    if it is compressed.
+    :param lines: Iterable of json lines, each ending in a newline
+    :param compression: "none" or "gzip"
+    :return: json lines body
+    """
+    if compression not in NDJSON_COMPRESSIONS:
+        logger.error(
+            "Invalid json lines compression: %s, expected %s",
+            compression,
+            NDJSON_COMPRESSIONS,
+            )
+        raise ValueError("Invalid json lines compression")
+
+    body = b"".join(lines)
+    if compression == "gzip":
+        return gzip.compress(body, mtime=0)
+    return body
+
+
+def _encode_json(record) -> str:
+    """
+    Serializes a record with the stdlib encoder. Records with NaN or infinite floats,
+    which are not valid json, are encoded again with the floats replaced with null.
+    """
+    try:
+        return _json_encoder.encode(record)
+    except ValueError:
+        return _json_encoder.encode(_replace_non_finite_floats(record))
+
+
+def _replace_non_finite_floats(value):
+    """
+    Replaces NaN and infinite floats in a record with None
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _replace_non_finite_floats(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_non_finite_floats(item) for item in value]
+    return value
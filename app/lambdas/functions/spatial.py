@@ -0,0 +1,89 @@
+import itertools
+import math
+from typing import Iterable, Iterator
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Number of cities that are grouped by grid cell at a time, which bounds the memory
+# used by the grouping of a streamed city input
+GRID_CELL_WINDOW_SIZE = 10_000
+
+
+def get_grid_cell(
+    latitude: float,
+    longitude: float,
+    cell_degrees: float,
+) -> dict:
+    """
+    Snaps a location to a grid of cell_degrees x cell_degrees cells.
+    :param latitude: Latitude in degrees
+    :param longitude: Longitude in degrees
+    :param cell_degrees: Size of the grid cells in degrees
+    :return: Dictionary containing the cell id and the latitude and longitude of the
+    cell centre e.g. {"id": "-339:1512", "latitude": -33.85, "longitude": 151.25}
+    """
+    row = math.floor(float(latitude) / cell_degrees)
+    column = math.floor(float(longitude) / cell_degrees)
+    return {
+        "id": f"{row}:{column}",
+        "latitude": round((row + 0.5) * cell_degrees, 4),
+        "longitude": round((column + 0.5) * cell_degrees, 4),
+        }
+
+
+def assign_grid_cells(
+    cities: Iterable[dict],
+    cell_degrees: float,
+    window_size: int = GRID_CELL_WINDOW_SIZE,
+) -> Iterator[dict]:
+    """
+    Adds the grid cell (see get_grid_cell) to each city and orders the cities by cell,
+    so that the cities in a cell are kept together when they are packed into SQS
+    messages. Cities in the same cell can share a single api call. The cities are
+    grouped in windows of window_size cities as they are read, so the input can be a
+    stream of any size. A cell whose cities are in different windows is split into
+    several groups.
+    :param cities: Iterable of city dictionaries containing latitude and longitude
+    :param cell_degrees: Size of the grid cells in degrees
+    :param window_size: Maximum number of cities held in memory while grouping
+    :return: Iterator of city dictionaries with a cell key
+    """
+    if cell_degrees <= 0:
+        logger.error("Invalid grid cell size: %s, expected > 0", cell_degrees)
+        raise ValueError("Invalid grid cell size")
+    if window_size < 1:
+        logger.error("Invalid grid cell window size: %s, expected > 0", window_size)
+        raise ValueError("Invalid grid cell window size")
+    return _iter_grid_cell_windows(iter(cities), cell_degrees, window_size)
+
+
+def _iter_grid_cell_windows(
+    cities: Iterator[dict],
+    cell_degrees: float,
+    window_size: int,
+) -> Iterator[dict]:
+    """
+    Groups each window of cities by grid cell (see assign_grid_cells)
+    """
+    city_count, cell_count = 0, 0
+    while True:
+        cells = {}
+        for city in itertools.islice(cities, window_size):
+            cell = get_grid_cell(city["latitude"], city["longitude"], cell_degrees)
+            cells.setdefault(cell["id"], []).append(city | {"cell": cell})
+        if not cells:
+            break
+        for cell_cities in cells.values():
+            city_count += len(cell_cities)
+            yield from cell_cities
+        cell_count += len(cells)
+
+    logger.info(
+        "Assigned %s cities to %s grid cell groups of %s degrees",
+        city_count,
+        cell_count,
+        cell_degrees,
+        )
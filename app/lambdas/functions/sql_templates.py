@@ -0,0 +1,215 @@
+import string
+import threading
+from time import monotonic
+from typing import NamedTuple, Optional
+from botocore.exceptions import ClientError
+from .clients import get_boto3_client
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# SQL templates bundled in the Lambda deployment package
+SQL_TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql_scripts"
+    )
+
+# Default time before an S3 override of a SQL template is checked for changes. Can be
+# overridden with the SQL_OVERRIDE_TTL_SECONDS Lambda environment variable.
+DEFAULT_SQL_OVERRIDE_TTL_SECONDS = 300.0
+
+# Module scope cache of S3 overrides so that they survive warm Lambda invocations.
+# Keyed by SQL filename with values of (template, time of the next ETag check).
+_sql_override_cache = {}
+_sql_override_cache_lock = threading.Lock()
+
+
+class SqlQuery(NamedTuple):
+    """
+    A rendered SQL template, i.e. the query string with ? placeholders and the Athena
+    execution parameters that fill them (see functions.athena.start_athena_query)
+    """
+    query_string: str
+    parameters: list
+
+
+class SqlTemplate(NamedTuple):
+    """
+    A SQL template from sql_scripts, compiled once into its literal text and named
+    fields e.g. {table} or {day}. Fields are filled by render with either an
+    identifier (e.g. a table name, which Athena cannot take as a parameter) or an
+    Athena execution parameter.
+    """
+    name: str
+    parts: tuple
+    etag: Optional[str] = None
+
+    @classmethod
+    def compile(cls, name: str, text: str, etag: str = None) -> "SqlTemplate":
+        """
+        Compiles a SQL template
+        :param name: SQL filename
+        :param text: SQL template text
+        :param etag: S3 ETag of an overridden template
+        :return: SQL template
+        """
+        return cls(
+            name=name,
+            parts=tuple(
+                (literal, field)
+                for literal, field, _, _ in string.Formatter().parse(text)
+                ),
+            etag=etag
+            )
+
+    @property
+    def fields(self) -> set:
+        """
+        Names of the template's fields
+        """
+        return {field for _, field in self.parts if field is not None}
+
+    def render(self, parameters: dict = None, identifiers: dict = None) -> SqlQuery:
+        """
+        Renders the template. Parameter fields become ? placeholders with their values
+        quoted as SQL string literals in the execution parameters (in order of
+        appearance), and identifier fields are replaced with their values.
+        :param parameters: Dictionary of parameter name and value e.g. the run date's
+        SQL parameters (see functions.run_context.RunContext.sql_parameters)
+        :param identifiers: Dictionary of identifier name and value e.g. table names
+        :return: SQL query
+        """
+        parameters = parameters or {}
+        identifiers = identifiers or {}
+        missing = self.fields - set(parameters) - set(identifiers)
+        if missing:
+            logger.error("Missing fields of SQL template %s: %s", self.name, missing)
+            raise ValueError("Missing SQL template fields")
+
+        query_parts, execution_parameters = [], []
+        for literal, field in self.parts:
+            query_parts.append(literal)
+            if field is None:
+                continue
+            if field in identifiers:
+                query_parts.append(str(identifiers[field]))
+            else:
+                query_parts.append("?")
+                execution_parameters.append(_quote_sql_literal(parameters[field]))
+        return SqlQuery(
+            query_string="".join(query_parts), parameters=execution_parameters
+            )
+
+
+def load_bundled_sql_templates(directory: str = SQL_TEMPLATE_DIR) -> dict:
+    """
+    Loads and compiles every SQL template in the deployment package
+    :param directory: Directory of the SQL files
+    :return: Dictionary of SQL filename and SQL template
+    """
+    templates = {}
+    for sql_file in sorted(os.listdir(directory)):
+        if sql_file.endswith(".sql"):
+            with open(os.path.join(directory, sql_file), encoding="utf-8") as file:
+                templates[sql_file] = SqlTemplate.compile(sql_file, file.read())
+    return templates
+
+
+# Loaded once when the Lambda function starts
+SQL_TEMPLATES = load_bundled_sql_templates()
+
+
+def get_sql_template(
+    sql_file: str,
+    override_prefix_env: str = "SQL_OVERRIDE_PREFIX",
+    s3_bucket_env: str = "S3_BUCKET"
+    ) -> SqlTemplate:
+    """
+    Gets a SQL template from the deployment package, so no S3 request is made. If the
+    SQL override prefix Lambda environment variable is set, a template of the same name
+    in that S3 prefix is used instead, e.g. to fix a query without redeploying. The
+    override is memoised and only downloaded again when its ETag changes, which is
+    checked every SQL_OVERRIDE_TTL_SECONDS.
+    :param sql_file: SQL filename e.g. final_data_test_no_duplicates.sql
+    :param override_prefix_env: S3 prefix of SQL overrides from Lambda function
+    environment variables
+    :param s3_bucket_env: S3 bucket name from Lambda function environment variables
+    :return: SQL template
+    """
+    if not sql_file.endswith(".sql"):
+        logger.error("Invalid file extension for: %s, expected .sql", sql_file)
+        raise ValueError("Invalid SQL file extension")
+
+    override_prefix = os.environ.get(override_prefix_env)
+    if override_prefix:
+        template = _get_sql_template_override(
+            sql_file=sql_file,
+            s3_bucket=os.environ[s3_bucket_env],
+            key=f"{override_prefix}/{sql_file}"
+            )
+        if template is not None:
+            return template
+
+    try:
+        return SQL_TEMPLATES[sql_file]
+    except KeyError:
+        logger.error("SQL template not found: %s", sql_file)
+        raise ValueError("SQL template not found")
+
+
+def clear_sql_override_cache() -> None:
+    """
+    Removes all SQL template overrides from the cache. Used in tests.
+    :return: None
+    """
+    with _sql_override_cache_lock:
+        _sql_override_cache.clear()
+
+
+def _get_sql_template_override(
+    sql_file: str,
+    s3_bucket: str,
+    key: str
+    ) -> Optional[SqlTemplate]:
+    """
+    Returns the memoised S3 override of a SQL template, downloading it only if its ETag
+    has changed, or None if there is no override.
+    """
+    with _sql_override_cache_lock:
+        cached = _sql_override_cache.get(sql_file)
+    if cached is not None and monotonic() < cached[1]:
+        return cached[0]
+    template = cached[0] if cached is not None else None
+
+    s3_client = get_boto3_client("s3")
+    kwargs = {"IfNoneMatch": template.etag} if template is not None else {}
+    try:
+        content_object = s3_client.get_object(Bucket=s3_bucket, Key=key, **kwargs)
+        template = SqlTemplate.compile(
+            sql_file,
+            content_object["Body"].read().decode("utf-8"),
+            etag=content_object["ETag"]
+            )
+        logger.info("Using SQL template override: %s", key)
+    except ClientError as error:
+        code = error.response["Error"]["Code"]
+        if code in ("NoSuchKey", "404"):
+            template = None
+        elif code not in ("NotModified", "304"):
+            raise
+
+    ttl = float(
+        os.environ.get("SQL_OVERRIDE_TTL_SECONDS", DEFAULT_SQL_OVERRIDE_TTL_SECONDS)
+        )
+    with _sql_override_cache_lock:
+        _sql_override_cache[sql_file] = (template, monotonic() + ttl)
+    return template
+
+
+def _quote_sql_literal(value) -> str:
+    """
+    Quotes a parameter value as a SQL string literal for Athena execution parameters
+    """
+    return "'{}'".format(str(value).replace("'", "''"))
@@ -1,5 +1,14 @@
 import json
-import boto3
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+from botocore.exceptions import BotoCoreError, ClientError
+from .clients import get_boto3_client
+from .concurrency import run_concurrently
+from .s3 import create_city_records_from_csv_rows
+from .spatial import assign_grid_cells
 import os
 import logging
 
@@ -7,52 +16,351 @@ import logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Maximum number of entries allowed in a single SendMessageBatch request
+SQS_MAX_BATCH_SIZE = 10
+
+# Maximum size of a message body and of the sum of all message bodies in a single
+# SendMessageBatch request (256 KiB)
+SQS_MAX_BATCH_BYTES = 262_144
+
+# Version of the packed (multi-city) message format. Unversioned message bodies are
+# single-city messages i.e. {"city": ..., "region": ..., ...}
+CITY_MESSAGE_VERSION = 2
+
+# A city is roughly 200 bytes (more with pass windows), so packed message bodies stay
+# well below the 256 KiB SQS limit, which applies to the whole SendMessageBatch request
+# rather than to each message. Batches are split by size (see _batch_message_entries)
+# and packed messages that are still too large are split (see
+# create_city_message_bodies).
+SQS_MAX_CITIES_PER_MESSAGE = 100
+
+# Optional city keys that are passed through from the message to the city dictionary
+# i.e. the grid cell (see functions.spatial), the ISS pass windows (passes-first
+# weather mode) and the run date (see functions.run_context)
+OPTIONAL_CITY_KEYS = ("cell", "pass_windows", "run_date")
+
 
 def send_city_list_to_sqs_queue(
     region_env: str,
-    data: list,
-    queue_url_env: str
+    data: Iterable[list],
+    queue_url_env: str,
+    max_workers: int = 4,
+    max_attempts: int = 5,
+    cities_per_message: int = 1,
+    grid_cell_degrees: float = 0,
 ) -> dict:
     """
-    Iterates through city input data list and sends each city/row to an SQS queue
+    Iterates through city input data list and sends the cities/rows to an SQS queue in
+    batches of up to 10 messages
     :param region_env: SQS queue region from Lambda function environment variables
-    :param data: City input data list
+    :param data: City input data list (or iterable of csv rows) including the header row
     :param queue_url_env: SQS queue url from Lambda function environment variables
-    :return: boto3 sqs_client.send_message response
+    :param max_workers: Maximum number of SendMessageBatch calls in flight at once
+    :param max_attempts: Maximum number of attempts for each batch entry
+    :param cities_per_message: Number of cities packed into each SQS message. If 1 then
+    single-city messages are sent
+    :param grid_cell_degrees: If > 0 then each city is tagged with its grid cell (see
+    functions.spatial) so that consumers can make one api call per cell
+    :return: Summary of messages sent and failed (see send_messages_to_sqs_queue_in_batches)
+    """
+    # Adds location data to city dictionaries. Generators are used so that message
+    # bodies are only created as batches are sent.
+    cities = create_city_records_from_csv_rows(data)
+    return send_cities_to_sqs_queue(
+        region_env=region_env,
+        cities=cities,
+        queue_url_env=queue_url_env,
+        max_workers=max_workers,
+        max_attempts=max_attempts,
+        cities_per_message=cities_per_message,
+        grid_cell_degrees=grid_cell_degrees,
+        )
+
+
+def send_cities_to_sqs_queue(
+    region_env: str,
+    cities: Iterable[dict],
+    queue_url_env: str,
+    max_workers: int = 4,
+    max_attempts: int = 5,
+    cities_per_message: int = 1,
+    grid_cell_degrees: float = 0,
+) -> dict:
+    """
+    Sends city dictionaries to an SQS queue in batches of up to 10 messages
+    :param region_env: SQS queue region from Lambda function environment variables
+    :param cities: Iterable of city dictionaries (city, region, latitude, longitude,
+    country, country_code and optionally pass_windows and run_date)
+    :param queue_url_env: SQS queue url from Lambda function environment variables
+    :param max_workers: Maximum number of SendMessageBatch calls in flight at once
+    :param max_attempts: Maximum number of attempts for each batch entry
+    :param cities_per_message: Number of cities packed into each SQS message. If 1 then
+    single-city messages are sent
+    :param grid_cell_degrees: If > 0 then each city is tagged with its grid cell (see
+    functions.spatial) so that consumers can make one api call per cell
+    :return: Summary of messages sent and failed (see send_messages_to_sqs_queue_in_batches)
+    """
+    if not 1 <= cities_per_message <= SQS_MAX_CITIES_PER_MESSAGE:
+        logger.error(
+            "Invalid cities per message: %s, expected 1 to %s",
+            cities_per_message,
+            SQS_MAX_CITIES_PER_MESSAGE,
+            )
+        raise ValueError("Invalid cities per message")
+
+    if grid_cell_degrees > 0:
+        cities = assign_grid_cells(cities=cities, cell_degrees=grid_cell_degrees)
+    message_bodies = create_city_message_bodies(
+        cities=cities,
+        cities_per_message=cities_per_message
+        )
+
+    summary = send_messages_to_sqs_queue_in_batches(
+        region_env=region_env,
+        message_bodies=message_bodies,
+        queue_url_env=queue_url_env,
+        max_workers=max_workers,
+        max_attempts=max_attempts,
+        )
+    summary["cities_per_message"] = cities_per_message
+    return summary
+
+
+def create_city_message_bodies(
+    cities: Iterable[dict],
+    cities_per_message: int = 1,
+) -> Iterator[str]:
+    """
+    Creates SQS message bodies from city dictionaries. Single-city messages are the
+    city dictionary itself, while packed messages are versioned and hold a list of
+    cities i.e. {"version": 2, "cities": [{"city": ..., ...}, ...]}. A packed message
+    body larger than the SQS message size limit is split in half until it fits.
+    :param cities: Iterable of city dictionaries (city, region, latitude, longitude,
+    country and country_code)
+    :param cities_per_message: Number of cities packed into each SQS message
+    :return: Iterator of message body strings
+    """
+    if cities_per_message == 1:
+        for city in cities:
+            yield json.dumps(city)
+        return
+
+    for chunk in _chunk_iterable(cities, cities_per_message):
+        yield from _create_packed_message_bodies(chunk)
+
+
+def _create_packed_message_bodies(cities: list) -> Iterator[str]:
+    """
+    Creates a packed message body, or several if the body is larger than the SQS
+    message size limit.
+    :param cities: List of city dictionaries
+    :return: Iterator of message body strings
+    """
+    body = json.dumps({"version": CITY_MESSAGE_VERSION, "cities": cities})
+    if len(cities) == 1 or len(body.encode("utf-8")) <= SQS_MAX_BATCH_BYTES:
+        yield body
+        return
+    middle = len(cities) // 2
+    yield from _create_packed_message_bodies(cities[:middle])
+    yield from _create_packed_message_bodies(cities[middle:])
+
+
+def send_messages_to_sqs_queue_in_batches(
+    region_env: str,
+    message_bodies: Iterable[str],
+    queue_url_env: str,
+    max_workers: int = 4,
+    max_attempts: int = 5,
+    base_delay: float = 0.1,
+) -> dict:
     """
+    Sends message bodies to an SQS queue with SendMessageBatch (up to 10 entries and
+    256 KiB of message bodies per call).
+    Batches are dispatched concurrently on a bounded thread pool and the number of
+    batches in flight is capped, so the message bodies can be a generator of any size.
+    Failed entries within a batch are retried with exponential backoff.
+    :param region_env: SQS queue region from Lambda function environment variables
+    :param message_bodies: Iterable of message body strings
+    :param queue_url_env: SQS queue url from Lambda function environment variables
+    :param max_workers: Maximum number of SendMessageBatch calls in flight at once
+    :param max_attempts: Maximum number of attempts for each batch entry
+    :param base_delay: Initial backoff delay in seconds between attempts
+    :return: Dictionary with the number of messages sent and failed, the number of
+    SendMessageBatch requests made and the failed entries
+    """
+    if max_attempts < 1:
+        logger.error("Invalid max attempts: %s, expected >= 1", max_attempts)
+        raise ValueError("Invalid max attempts")
+
     # Gets Lambda environment variables
     sqs_queue_env = os.environ[queue_url_env]
 
-    # Creates dictionary of column header (key) and column index (value)
-    headers = []
-    for count, value in enumerate(iterable=data[0]):
-        headers.extend([[value, count]])
-    headers = dict(headers)
-
     # Connects to boto3 SQS client
-    sqs_client = boto3.client("sqs", region_name=os.environ[region_env])
-
-    # Adds location data to SQS message. Enumerate used to count number of messages for
-    # logging.
-    for count, row in enumerate(iterable=data[1:], start=1):
-        response = sqs_client.send_message(
-            QueueUrl=sqs_queue_env,
-            MessageBody=json.dumps(
-                {
-                    "city": row[headers["city"]],
-                    "region": row[headers["region"]],
-                    "latitude": row[headers["latitude"]],
-                    "longitude": row[headers["longitude"]],
-                    "country": row[headers["country"]],
-                    "country_code": row[headers["country_code"]],
-                    }
-                ),
+    sqs_client = get_boto3_client("sqs", region_name=os.environ[region_env])
+
+    summary = {
+        "messages_sent": 0,
+        "messages_failed": 0,
+        "requests": 0,
+        "failed_entries": [],
+        }
+
+    # Entry ids only need to be unique within a batch, however, a running count is
+    # used so that failed entries can be traced back to the input row
+    entries = (
+        {"Id": str(count), "MessageBody": body}
+        for count, body in enumerate(iterable=message_bodies, start=1)
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+        for batch in _batch_message_entries(entries):
+            in_flight.add(
+                executor.submit(
+                    _send_message_batch_with_retry,
+                    sqs_client,
+                    sqs_queue_env,
+                    batch,
+                    max_attempts,
+                    base_delay,
+                    )
+                )
+
+            # Waits for a batch to complete before queueing more, which keeps memory
+            # flat for large city lists
+            if len(in_flight) >= max_workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                _add_batch_results_to_summary(summary, done)
+
+        done, _ = wait(in_flight)
+        _add_batch_results_to_summary(summary, done)
+
+    logger.info("Successfully sent messages to SQS queue: %s", queue_url_env)
+    logger.info("Number of messages sent to SQS queue = %s", summary["messages_sent"])
+    logger.info("Number of SendMessageBatch requests = %s", summary["requests"])
+    if summary["messages_failed"]:
+        logger.error(
+            "Number of messages that failed to send = %s: %s",
+            summary["messages_failed"],
+            json.dumps(summary["failed_entries"]),
             )
+    return summary
+
+
+def _send_message_batch_with_retry(
+    sqs_client,
+    queue_url: str,
+    entries: list,
+    max_attempts: int,
+    base_delay: float,
+) -> dict:
+    """
+    Sends a batch of up to 10 entries and retries failed entries with exponential
+    backoff and jitter. Entries that failed due to a sender fault are not retried.
+    :param sqs_client: boto3 SQS client
+    :param queue_url: SQS queue url
+    :param entries: SendMessageBatch entries
+    :param max_attempts: Maximum number of attempts for each entry
+    :param base_delay: Initial backoff delay in seconds between attempts
+    :return: Dictionary with the number of entries sent, the number of requests made and
+    the failed entries
+    """
+    result = {"sent": 0, "requests": 0, "failed": []}
+
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(base_delay * 2 ** (attempt - 1) * (1 + random.random()))
+
+        result["requests"] += 1
+        try:
+            response = sqs_client.send_message_batch(
+                QueueUrl=queue_url, Entries=entries
+                )
+        except (BotoCoreError, ClientError) as error:
+            # Whole request failed (e.g. throttling after botocore retries) so all
+            # entries are retried
+            logger.warning("SendMessageBatch request failed: %s", error)
+            failed = [
+                {"Id": entry["Id"], "Code": type(error).__name__,
+                 "Message": str(error), "SenderFault": False}
+                for entry in entries
+                ]
+        else:
+            result["sent"] += len(response.get("Successful", []))
+            failed = response.get("Failed", [])
+
+        # Sender faults (e.g. invalid message body) will not succeed on retry
+        retryable = []
+        for entry in failed:
+            if entry.get("SenderFault"):
+                result["failed"].append(entry)
+            else:
+                retryable.append(entry)
+
+        retryable_ids = {entry["Id"] for entry in retryable}
+        entries = [entry for entry in entries if entry["Id"] in retryable_ids]
+        if not entries:
+            return result
+
+        if attempt + 1 < max_attempts:
+            logger.warning("Retrying %s failed SQS batch entries", len(entries))
+
+    # Entries that are still failing after the final attempt
+    result["failed"].extend(retryable)
+    return result
+
+
+def _add_batch_results_to_summary(summary: dict, futures: set) -> None:
+    """
+    Adds completed batch results to the send summary.
+    :param summary: Summary dictionary from send_messages_to_sqs_queue_in_batches
+    :param futures: Completed futures from _send_message_batch_with_retry
+    :return: None
+    """
+    for future in futures:
+        result = future.result()
+        summary["messages_sent"] += result["sent"]
+        summary["messages_failed"] += len(result["failed"])
+        summary["requests"] += result["requests"]
+        summary["failed_entries"].extend(result["failed"])
+
+
+def _batch_message_entries(entries: Iterable[dict]) -> Iterator[list]:
+    """
+    Lazily splits SendMessageBatch entries into batches of at most 10 entries whose
+    message bodies add up to at most 256 KiB. A batch is sent as soon as the next entry
+    would not fit.
+    :param entries: Iterable of SendMessageBatch entries
+    :return: Iterator of lists of entries
+    """
+    batch, batch_bytes = [], 0
+    for entry in entries:
+        entry_bytes = len(entry["MessageBody"].encode("utf-8"))
+        if batch and (
+            len(batch) == SQS_MAX_BATCH_SIZE
+            or batch_bytes + entry_bytes > SQS_MAX_BATCH_BYTES
+        ):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(entry)
+        batch_bytes += entry_bytes
+    if batch:
+        yield batch
 
-    logger.info("Successfully sent message to SQS queue: %s", queue_url_env)
-    logger.info("Message sent: %s", json.dumps(response))
-    logger.info("Number of messages sent to SQS queue = %s", count)
-    return response
+
+def _chunk_iterable(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Lazily splits an iterable into lists of at most the specified size.
+    :param iterable: Iterable to split
+    :param size: Maximum size of each list
+    :return: Iterator of lists
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 def transform_city_sqs_message_response_to_dictionary(
@@ -67,6 +375,126 @@ def transform_city_sqs_message_response_to_dictionary(
     # Gets SQS messages from queue
     sqs_message_data = json.loads(record["body"])
 
+    city_data_dict = _transform_city_message_data_to_dictionary(sqs_message_data)
+
+    logger.info("Successfully transformed data from SQS message to dictionary")
+    return city_data_dict
+
+
+def transform_city_sqs_message_response_to_list(
+    record: dict,
+) -> list:
+    """
+    Transforms city data from SQS queue into a list of dictionaries for input into api
+    calls. Handles both single-city and packed (multi-city) message bodies.
+    :param record: Takes event['Records'] input from SQS invoked lambda function. See
+    https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html for more info.
+    :return: List of dictionaries containing city, region, country, lat and lon.
+    """
+    # Gets SQS messages from queue
+    sqs_message_data = json.loads(record["body"])
+
+    # Unversioned message bodies are single-city messages
+    version = sqs_message_data.get("version")
+    if version is None:
+        city_data_list = [_transform_city_message_data_to_dictionary(sqs_message_data)]
+    elif version == CITY_MESSAGE_VERSION:
+        city_data_list = [
+            _transform_city_message_data_to_dictionary(city)
+            for city in sqs_message_data["cities"]
+            ]
+    else:
+        logger.error("Unsupported SQS city message version: %s", version)
+        raise ValueError("Unsupported SQS city message version")
+
+    logger.info(
+        "Successfully transformed %s cities from SQS message to dictionaries",
+        len(city_data_list),
+        )
+    return city_data_list
+
+
+def process_city_records_from_sqs_event(
+    records: list,
+    process_city: Callable[[dict], Any],
+    max_concurrency: int = 10,
+    mode: str = "thread",
+    process_cell: Callable[[list], Any] = None,
+) -> list:
+    """
+    Parses the cities from each SQS record and runs process_city on every city in the
+    batch concurrently. Errors are isolated per record: a record has failed if its
+    message body could not be parsed or if any of its cities failed.
+    :param records: Takes event['Records'] input from SQS invoked lambda function
+    :param process_city: Function that takes a city dictionary (see
+    transform_city_sqs_message_response_to_list) e.g. calls an api and uploads to S3
+    :param max_concurrency: Maximum number of cities (or cells) processed at once
+    :param mode: Execution mode, see functions.concurrency.run_concurrently
+    :param process_cell: Optional function that takes the list of cities in a grid
+    cell (see functions.spatial). If given, cities with a cell are grouped across the
+    batch and process_cell is called once per cell instead of process_city per city.
+    If a cell fails then every record containing one of its cities has failed.
+    :return: List of records that failed
+    """
+    # Tasks are (message ids, function, city or list of cities in a cell)
+    tasks = []
+    cells = {}
+    failed_message_ids = set()
+    city_count = 0
+    for record in records:
+        try:
+            city_data_list = transform_city_sqs_message_response_to_list(record=record)
+        except (KeyError, TypeError, ValueError):
+            logger.exception("Invalid SQS message: %s", record["messageId"])
+            failed_message_ids.add(record["messageId"])
+            continue
+        city_count += len(city_data_list)
+
+        for city in city_data_list:
+            if process_cell is not None and "cell" in city:
+                message_ids, cell_cities = cells.setdefault(
+                    city["cell"]["id"], (set(), [])
+                    )
+                message_ids.add(record["messageId"])
+                cell_cities.append(city)
+            else:
+                tasks.append(({record["messageId"]}, process_city, city))
+    tasks.extend(
+        (message_ids, process_cell, cell_cities)
+        for message_ids, cell_cities in cells.values()
+        )
+
+    # Runs one task per city (or cell) so that packed messages are also processed
+    # concurrently
+    results = run_concurrently(
+        func=lambda task: task[1](task[2]),
+        items=tasks,
+        max_concurrency=max_concurrency,
+        mode=mode,
+        )
+    for result in results:
+        if result.error is not None:
+            failed_message_ids.update(result.item[0])
+
+    logger.info(
+        "Processed %s cities (%s grid cells) from %s SQS messages, %s messages failed",
+        city_count,
+        len(cells),
+        len(records),
+        len(failed_message_ids),
+        )
+    return [record for record in records if record["messageId"] in failed_message_ids]
+
+
+def _transform_city_message_data_to_dictionary(
+    sqs_message_data: dict,
+) -> dict:
+    """
+    Transforms a single city from an SQS message body into a dictionary for input into
+    api call.
+    :param sqs_message_data: City dictionary from SQS message body
+    :return: Dictionary containing city, region, country, lat and lon.
+    """
     # Gets city name, latitude and longitude from SQS message for input into ISS api
     # request
     city = sqs_message_data["city"]
@@ -88,33 +516,135 @@ def transform_city_sqs_message_response_to_dictionary(
         "country_code": country_code,
         }
 
-    logger.info("Successfully transformed data from SQS message to dictionary")
+    # Adds the grid cell, pass windows and run date if the city was tagged with them
+    for key in OPTIONAL_CITY_KEYS:
+        if key in sqs_message_data:
+            city_data_dict[key] = sqs_message_data[key]
     return city_data_dict
 
 
-def delete_message_from_sqs_queue(
+def transform_city_dictionary_to_sqs_message_data(
+    city_data_dict: dict,
+) -> dict:
+    """
+    Transforms a city dictionary (see _transform_city_message_data_to_dictionary) back
+    into SQS message data so that it can be forwarded to another queue. The grid cell
+    is not kept as it is assigned by the sender.
+    :param city_data_dict: Dictionary containing city, lat, lon and other data
+    :return: City dictionary for an SQS message body
+    """
+    sqs_message_data = {
+        "city": city_data_dict["city"],
+        "region": city_data_dict["region"],
+        "latitude": city_data_dict["lat"],
+        "longitude": city_data_dict["lon"],
+        "country": city_data_dict["country"],
+        "country_code": city_data_dict["country_code"],
+        }
+    for key in ("pass_windows", "run_date"):
+        if key in city_data_dict:
+            sqs_message_data[key] = city_data_dict[key]
+    return sqs_message_data
+
+
+def create_batch_item_failures_response(
+    failed_records: list,
+) -> dict:
+    """
+    Creates a partial batch response so that only the failed messages are retried.
+    Requires ReportBatchItemFailures on the Lambda event source mapping. See
+    https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html for more info.
+    :param failed_records: Failed event['Records'] (see process_city_records_from_sqs_event)
+    :return: Dictionary of batchItemFailures containing the failed message ids
+    """
+    if failed_records:
+        logger.error("Number of SQS messages that failed: %s", len(failed_records))
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": record["messageId"]} for record in failed_records
+            ]
+        }
+
+
+def complete_sqs_event(
     region_env: str,
-    queue_url: str,
-    sqs_message: dict,
+    queue_url_env: str,
+    records: list,
+    failed_records: list,
+    report_batch_item_failures: bool = True,
+) -> dict:
+    """
+    Completes an SQS invoked Lambda function. If report_batch_item_failures is True then
+    the failed messages are returned as a partial batch response and Lambda deletes the
+    rest. Otherwise, the successful messages are deleted with DeleteMessageBatch and an
+    exception is raised so that only the failed (i.e. undeleted) messages are retried.
+    :param region_env: SQS queue region from Lambda function environment variables
+    :param queue_url_env: SQS queue url from Lambda function environment variables
+    :param records: Takes event['Records'] input from SQS invoked lambda function
+    :param failed_records: Failed records (see process_city_records_from_sqs_event)
+    :param report_batch_item_failures: Whether the event source mapping has
+    ReportBatchItemFailures enabled
+    :return: Partial batch response (see create_batch_item_failures_response)
+    """
+    if report_batch_item_failures:
+        return create_batch_item_failures_response(failed_records=failed_records)
+
+    failed_message_ids = {record["messageId"] for record in failed_records}
+    delete_messages_from_sqs_queue(
+        region_env=region_env,
+        queue_url_env=queue_url_env,
+        sqs_messages=[
+            record for record in records if record["messageId"] not in failed_message_ids
+            ],
+        )
+    if failed_records:
+        logger.error("Number of SQS messages that failed: %s", len(failed_records))
+        raise Exception("Failed to process all SQS messages")
+    return create_batch_item_failures_response(failed_records=[])
+
+
+def delete_messages_from_sqs_queue(
+    region_env: str,
+    queue_url_env: str,
+    sqs_messages: list,
 ) -> dict:
     """
-    Deletes message from SQS queue to ensure no double-ups during concurrent invocation.
-    Note: not unit or integration tested!
+    Deletes messages from SQS queue with DeleteMessageBatch (10 entries per call) to
+    ensure no double-ups during concurrent invocation.
     :param region_env: SQS queue region from Lambda function environment variables
-    :param queue_url: SQS queue url from Lambda function environment variables
-    :param sqs_message: boto3 sqs_client.send_message response event['Records]
-    :return: sqs_client.delete_message response
+    :param queue_url_env: SQS queue url from Lambda function environment variables
+    :param sqs_messages: event['Records'] from SQS invoked lambda function
+    :return: Dictionary with the number of messages deleted and failed and the failed
+    entries
     """
+    summary = {"messages_deleted": 0, "messages_failed": 0, "failed_entries": []}
+    if not sqs_messages:
+        return summary
+
     # Gets Lambda environment variables
-    sqs_queue_url = os.environ[queue_url]
+    sqs_queue_url = os.environ[queue_url_env]
 
     # Connects to boto3 SQS client
-    sqs_client = boto3.client("sqs", region_name=os.environ[region_env])
+    sqs_client = get_boto3_client("sqs", region_name=os.environ[region_env])
 
-    # Deletes message from SQS queue
-    response = sqs_client.delete_message(
-        QueueUrl=sqs_queue_url, ReceiptHandle=sqs_message["receiptHandle"]
-        )
+    # Deletes messages from SQS queue. Entry ids only need to be unique within a batch.
+    for batch in _chunk_iterable(sqs_messages, SQS_MAX_BATCH_SIZE):
+        response = sqs_client.delete_message_batch(
+            QueueUrl=sqs_queue_url,
+            Entries=[
+                {"Id": str(count), "ReceiptHandle": message["receiptHandle"]}
+                for count, message in enumerate(batch)
+                ],
+            )
+        summary["messages_deleted"] += len(response.get("Successful", []))
+        summary["messages_failed"] += len(response.get("Failed", []))
+        summary["failed_entries"].extend(response.get("Failed", []))
 
-    logger.info("Successfully deleted SQS message")
-    return response
+    logger.info("Number of SQS messages deleted = %s", summary["messages_deleted"])
+    if summary["messages_failed"]:
+        logger.error(
+            "Number of SQS messages that failed to delete = %s: %s",
+            summary["messages_failed"],
+            json.dumps(summary["failed_entries"]),
+            )
+    return summary
@@ -0,0 +1,32 @@
+from functions.run_context import iter_run_contexts
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def lambda_handler(event, context) -> dict:
+    """
+    Plans a backfill for the backfill step function, which recompacts and re-joins
+    every run date in parallel (Map state). Each date is processed with its own run
+    context (see functions.run_context), so the runs only read and replace their own
+    date partitions and cannot race each other.
+    - {"start_date": "2023-03-01", "end_date": "2023-05-29"}
+    :param event: Step function input
+    :param context: Not used
+    :return: Dictionary containing the run dates (see RunContext.to_dict)
+    """
+    try:
+        start_date, end_date = event["start_date"], event["end_date"]
+    except (KeyError, TypeError):
+        logger.error("Backfill input must contain start_date and end_date: %s", event)
+        raise ValueError("Invalid backfill input")
+
+    run_dates = [
+        run_context.to_dict()
+        for run_context in iter_run_contexts(start_date=start_date, end_date=end_date)
+        ]
+
+    logger.info("Backfilling %s run dates from %s", len(run_dates), start_date)
+    return {"run_dates": run_dates}
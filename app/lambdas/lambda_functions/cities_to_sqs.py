@@ -1,5 +1,13 @@
-from functions.s3 import get_list_from_s3_csv_object
-from functions.sqs import send_city_list_to_sqs_queue
+from functions.batch_writer import create_city_key
+from functions.run_context import RunContext
+from functions.run_tracker import get_city_statuses, get_run_id
+from functions.s3 import (
+    iter_city_records_from_s3_csv_object,
+    iter_city_records_from_s3_csv_shard,
+    plan_s3_csv_object_shards,
+    )
+from functions.sqs import send_cities_to_sqs_queue
+import os
 import logging
 
 # Sets logging level
@@ -9,19 +17,169 @@ logger.setLevel(logging.INFO)
 
 def lambda_handler(event, context):
     """
-    Gets city name, lat, lon and other data from S3 object then sends each location to
-    SQS queue for iss_weather_queue
-    :param event: Not used
+    Gets city name, lat, lon and other data from S3 object then sends the locations to
+    SQS queue for iss_weather_queue. CITIES_PER_MESSAGE cities are packed into each
+    message. If GRID_CELL_DEGREES is set then cities are tagged with their grid cell so
+    that nearby cities share an api call.
+
+    If CITY_SHARDS is > 1 then the step functions fan the city input data out over
+    several invocations instead of sending it all from one:
+    - {"action": "plan_shards"} splits the input data into row-aligned byte ranges and
+      counts the cities (see functions.s3.plan_s3_csv_object_shards)
+    - {"action": "send_shard", "shard": {...}, "plan": {...}} sends the cities of one
+      shard (run in parallel by a Map state)
+    - {"action": "aggregate_shards", "shard_results": [...], "plan": {...}} adds up the
+      shard results and checks that every planned city was sent
+
+    Every city is sent with the run date (see functions.run_context.RunContext
+    .from_event) so that the API Lambda functions write it to the run's date prefix. If
+    the run tracker is used (see RUN_TRACKER_TABLE) then cities that the run has
+    already processed are skipped, so a re-run only sends the missing cities.
+    :param event: Step function input, optionally containing run_date
     :param context: Not used
+    :return: Summary of the number of messages sent and failed
+    """
+    action = (event or {}).get("action", "send_all")
+
+    if action == "plan_shards":
+        return plan_city_shards()
+
+    if action == "aggregate_shards":
+        return aggregate_city_shard_results(
+            shard_results=event["shard_results"], plan=event["plan"]
+            )
+
+    if action == "send_shard":
+        # Cities are read from the shard's byte range as they are sent
+        cities = iter_city_records_from_s3_csv_shard(
+            input_data="LAMBDA_INPUT_DATA",
+            prefix="INPUT_DATA_PREFIX",
+            s3_bucket="S3_BUCKET",
+            shard=event["shard"],
+            header=event["plan"]["header"],
+            etag=event["plan"]["etag"],
+            )
+    elif action == "send_all":
+        # Cities are read from the S3 object as they are sent, so memory use does not
+        # depend on the size of the city input data
+        cities = iter_city_records_from_s3_csv_object(
+            input_data="LAMBDA_INPUT_DATA",
+            prefix="INPUT_DATA_PREFIX",
+            s3_bucket="S3_BUCKET",
+            )
+    else:
+        logger.error("Invalid action: %s", action)
+        raise ValueError("Invalid action")
+
+    run_context = RunContext.from_event(event)
+    city_count = {"cities": 0, "skipped": 0}
+    send_summary = send_cities_to_sqs_queue(
+        region_env="MY_AWS_REGION",
+        cities=_count_cities(
+            cities,
+            city_count,
+            run_context,
+            get_processed_city_keys(run_context),
+            ),
+        queue_url_env="SQS_QUEUE_URL",
+        cities_per_message=int(os.environ.get("CITIES_PER_MESSAGE", "1")),
+        grid_cell_degrees=float(os.environ.get("GRID_CELL_DEGREES", "0")),
+        )
+
+    # Fails the step function task if any city could not be sent to the SQS queue
+    if send_summary["messages_failed"]:
+        logger.error(
+            "Failed to send %s messages to SQS queue", send_summary["messages_failed"]
+            )
+        raise Exception("Failed to send all cities to SQS queue")
+
+    return {
+        "cities": city_count["cities"],
+        "skipped": city_count["skipped"],
+        "messages_sent": send_summary["messages_sent"],
+        "cities_per_message": send_summary["cities_per_message"],
+        "requests": send_summary["requests"],
+        }
+
+
+def plan_city_shards() -> dict:
+    """
+    Splits the city input data into CITY_SHARDS shards (see
+    functions.s3.plan_s3_csv_object_shards). The number of cities is returned as
+    expected_objects, which the step functions use for the "already run today" check.
+    :return: Plan dictionary containing the header, ETag, shards and expected_objects
     """
-    city_data_list = get_list_from_s3_csv_object(
+    plan = plan_s3_csv_object_shards(
         input_data="LAMBDA_INPUT_DATA",
         prefix="INPUT_DATA_PREFIX",
         s3_bucket="S3_BUCKET",
+        shards=int(os.environ.get("CITY_SHARDS", "1")),
         )
+    plan["expected_objects"] = plan["rows"]
+    return plan
 
-    send_city_list_to_sqs_queue(
-        region_env="MY_AWS_REGION",
-        data=city_data_list,
-        queue_url_env="SQS_QUEUE_URL"
+
+def aggregate_city_shard_results(shard_results: list, plan: dict) -> dict:
+    """
+    Adds up the results of the send_shard invocations
+    :param shard_results: List of send_shard results
+    :param plan: Plan from plan_city_shards
+    :return: Summary of the number of cities, messages and requests of all shards
+    """
+    summary = {
+        "shards": len(shard_results),
+        "cities": sum(result["cities"] for result in shard_results),
+        "skipped": sum(result.get("skipped", 0) for result in shard_results),
+        "messages_sent": sum(result["messages_sent"] for result in shard_results),
+        "requests": sum(result["requests"] for result in shard_results),
+        }
+
+    # Fails the step function if any planned city was not sent (or skipped) e.g. if a
+    # row was lost between shards
+    if summary["cities"] + summary["skipped"] != plan["expected_objects"]:
+        logger.error(
+            "Sent %s cities and skipped %s, expected %s",
+            summary["cities"],
+            summary["skipped"],
+            plan["expected_objects"],
+            )
+        raise Exception("Number of cities sent does not match the shard plan")
+
+    logger.info("Sent %s cities from %s shards", summary["cities"], summary["shards"])
+    return summary
+
+
+def get_processed_city_keys(run_context: RunContext) -> set:
+    """
+    Gets the keys of the cities that the run has already processed from the run ledger
+    (see functions.run_tracker.get_city_statuses)
+    :param run_context: Run context
+    :return: Set of city keys, empty if the run tracker is not used
+    """
+    if not os.environ.get("RUN_TRACKER_TABLE"):
+        return set()
+    city_statuses = get_city_statuses(
+        table_env="RUN_TRACKER_TABLE",
+        run_id=get_run_id(os.environ["RUN_TRACKER_PIPELINE"], run_context.run_date),
         )
+    return {
+        city_key for city_key, status in city_statuses.items() if status == "processed"
+        }
+
+
+def _count_cities(
+    cities,
+    city_count: dict,
+    run_context: RunContext,
+    processed_city_keys: set = frozenset(),
+):
+    """
+    Counts the cities as they are sent, skips the cities that have already been
+    processed and adds the run date to the others.
+    """
+    for city in cities:
+        if processed_city_keys and create_city_key(city) in processed_city_keys:
+            city_count["skipped"] += 1
+            continue
+        city_count["cities"] += 1
+        yield city | {"run_date": run_context.iso}
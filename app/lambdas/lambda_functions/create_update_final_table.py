@@ -1,8 +1,8 @@
 import time
 
-from functions.s3 import (
-    get_sql_query_string_from_s3_sql_object
-    )
+from functions.run_context import RunContext
+from functions.s3 import delete_objects_in_s3_prefix
+from functions.sql_templates import get_sql_template
 from functions.athena import (
     execute_athena_query,
     return_results_athena_query
@@ -13,31 +13,33 @@ import logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# S3 prefix of the final table (see the LOCATION of create_final_table.sql)
+FINAL_TABLE_PREFIX = "query-results"
+
 
 def lambda_handler(event, context):
     """
-    Creates the final table if it doesn't exist and inserts new data into final table
-    :param event: Not used
+    Creates the final table if it doesn't exist and inserts the run date's data into
+    the final table (see functions.run_context.RunContext.from_event)
+    :param event: Step function input, optionally containing run_date
     :param context: Not used
     :return: None
     """
+    run_context = RunContext.from_event(event)
     create_final_table_if_not_exists()
-    insert_update_final_table()
+    insert_update_final_table(run_context=run_context)
 
 
 def create_final_table_if_not_exists():
     """
     Creates the final table from joining the silver passes and weather tables
     """
-    # Gets query parameters
-    final_table_name = os.environ["FINAL_TABLE_NAME"]
-    s3_bucket_name = os.environ["S3_BUCKET"]
-
-    # Gets query string from SQL file in S3
-    query_string = get_sql_query_string_from_s3_sql_object(
-        sql_filename="create_final_table.sql",
-        prefix="SQL_LOCATION_PREFIX",
-        s3_bucket="S3_BUCKET",
+    # Gets query from the SQL template
+    query = get_sql_template("create_final_table.sql").render(
+        identifiers={
+            "table": os.environ["FINAL_TABLE_NAME"],
+            "s3_bucket": os.environ["S3_BUCKET"],
+            }
         )
 
     # Executes Athena query
@@ -47,11 +49,7 @@ def create_final_table_if_not_exists():
         catalog_env="DATA_CATALOG_NAME",
         s3_bucket_env="S3_BUCKET",
         query_results_env="QUERY_RESULT_LOCATION",
-        query_str=query_string.format(
-            final_table_name,
-            s3_bucket_name,
-            final_table_name
-            ),
+        query_str=query.query_string,
         )
 
     # Gets query results
@@ -61,20 +59,30 @@ def create_final_table_if_not_exists():
         )
 
 
-def insert_update_final_table():
+def insert_update_final_table(run_context: RunContext = None):
     """
-    Inserts data from silver passes and weather tables into final table
+    Inserts data from silver passes and weather tables into final table. The run
+    date's partition is emptied first, so that re-running or backfilling a date
+    replaces its rows instead of adding duplicates. Only the run date's partition is
+    touched, so several dates can be inserted at the same time.
+    :param run_context: Run context of the inserted date (default today)
     """
-    # Gets query parameters
-    final_table_name = os.environ["FINAL_TABLE_NAME"]
-    passes_raw_table_name = os.environ["PASSES_RAW_TABLE_NAME"]
-    weather_raw_table_name = os.environ["WEATHER_RAW_TABLE_NAME"]
+    run_context = run_context or RunContext.today()
 
-    # Gets query string from SQL file in S3
-    query_string = get_sql_query_string_from_s3_sql_object(
-        sql_filename="insert_update_final_table.sql",
-        prefix="SQL_LOCATION_PREFIX",
-        s3_bucket="S3_BUCKET",
+    # Gets query from the SQL template, with the run date as execution parameters
+    query = get_sql_template("insert_update_final_table.sql").render(
+        parameters=run_context.sql_parameters(),
+        identifiers={
+            "final_table": os.environ["FINAL_TABLE_NAME"],
+            "passes_table": os.environ["PASSES_RAW_TABLE_NAME"],
+            "weather_table": os.environ["WEATHER_RAW_TABLE_NAME"],
+            }
+        )
+
+    # Deletes the run date's rows from the final table
+    delete_objects_in_s3_prefix(
+        s3_bucket_env="S3_BUCKET",
+        prefix=f"{FINAL_TABLE_PREFIX}/{run_context.date_prefix}/",
         )
 
     # Execute Athena query
@@ -84,11 +92,8 @@ def insert_update_final_table():
         catalog_env="DATA_CATALOG_NAME",
         s3_bucket_env="S3_BUCKET",
         query_results_env="QUERY_RESULT_LOCATION",
-        query_str=query_string.format(
-            final_table_name,
-            passes_raw_table_name,
-            weather_raw_table_name
-            ),
+        query_str=query.query_string,
+        parameters=query.parameters
         )
     
     # Gets query results
@@ -1,6 +1,7 @@
 from data_test_functions.data_tests import (
 	data_test_no_duplicates,
 	)
+from functions.run_context import RunContext
 import logging
 
 # Sets logging level
@@ -11,15 +12,17 @@ logger.setLevel(logging.INFO)
 def lambda_handler(event, context):
 	"""
 	Runs a set of data quality test functions on the passes raw table
-	:param event: Not used
+	:param event: Step function input, optionally containing run_date
 	:param context: Not used
 	:return: None, but function calls return PASS or FAIL logged result for each test in
 	CloudWatch
 	"""
+	run_context = RunContext.from_event(event)
 	table_name = 'FINAL_TABLE_NAME'
 	
 	# Checks that there are no duplicates in the final table
 	data_test_no_duplicates(
 		table_name_env=table_name,
-		sql_file='final_data_test_no_duplicates.sql'
+		sql_file='final_data_test_no_duplicates.sql',
+		run_context=run_context
 		)
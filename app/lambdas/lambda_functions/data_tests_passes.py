@@ -1,9 +1,16 @@
+from data_test_functions.data_quality import (
+	distinct_key_check,
+	not_null_check,
+	range_check,
+	uniqueness_check,
+	)
 from data_test_functions.data_tests import (
-	data_test_cities_input_and_output,
-	data_test_no_duplicates,
-	data_test_null_values,
+	get_expected_number_of_cities,
+	run_data_quality_checks,
 	)
+from functions.run_context import RunContext
 import logging
+import os
 import time
 
 # Sets logging level
@@ -13,29 +20,40 @@ logger.setLevel(logging.INFO)
 
 def lambda_handler(event, context):
 	"""
-	Runs a set of data quality test functions on the passes raw table
-	:param event: Not used
+	Runs a set of data quality checks on the passes raw table. The checks are run in a
+	single query, so the run date's partition is only scanned once (see
+	data_test_functions.data_tests.run_data_quality_checks).
+	:param event: Step function input, optionally containing run_date and the
+	expected_objects of the run (default EXPECTED_OBJECT_NUMBER)
 	:param context: Not used
-	:return: None, but function calls return PASS or FAIL logged result for each test in
-	CloudWatch
+	:return: Dictionary of check name and result. Each PASS or FAIL result is also
+	logged in CloudWatch
 	"""
-	table_name = 'PASSES_RAW_TABLE_NAME'
-	
-	# Checks that the number of cities input and then output from the N2YO API
-	# match in the raw table
-	data_test_cities_input_and_output(
-		table_name_env=table_name,
-		sql_file='passes_data_test_cities_input_and_output.sql'
-		)
-	
-	# Checks that there are no duplicates in the raw table
-	data_test_no_duplicates(
-		table_name_env=table_name,
-		sql_file='passes_data_test_no_duplicates.sql'
-		)
+	run_context = RunContext.from_event(event)
 	
-	# Checks that there are no unexpected null values in the raw table
-	data_test_null_values(
-		table_name_env=table_name,
-		sql_file='passes_data_test_null_values.sql'
+	return run_data_quality_checks(
+		table_name_env='PASSES_RAW_TABLE_NAME',
+		table_prefix_env='PASSES_TABLE_PREFIX',
+		checks=[
+			# Checks that the number of cities input and then output from the N2YO API
+			# match in the raw table
+			distinct_key_check(
+				'cities_input_and_output',
+				columns=('city', 'region'),
+				expected=get_expected_number_of_cities(event)
+				),
+			# Checks that there are no duplicates in the raw table
+			uniqueness_check('no_duplicates', columns=('city', 'region', 'startutc')),
+			# Checks that there are no unexpected null values in the raw table
+			not_null_check(
+				'null_values',
+				columns=(
+					'city', 'lat', 'lon', 'region', 'country', 'satid', 'satname',
+					'transactionscount'
+					)
+				),
+			# Checks that the maximum elevations of passes are above the horizon
+			range_check('max_elevation_range', column='maxel', minimum=0, maximum=90),
+			],
+		run_context=run_context
 		)
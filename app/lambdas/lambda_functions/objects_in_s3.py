@@ -1,17 +1,50 @@
-from functions.s3 import count_objects_in_s3_prefix
+import os
+from functions.run_context import RunContext
+from functions.run_tracker import get_processed_city_count, get_run_id
+from functions.s3 import count_objects_in_s3_prefix, count_records_in_s3_manifests
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
 
 
 def lambda_handler(event, context) -> dict:
     """
     Returns number of objects in specified S3 bucket and prefix. This Lambda function
-    is used to check if the pipeline has already been run for that specific day.
-    :param event: Not used
+    is used to check if the pipeline has already been run for the run date (see
+    functions.run_context.RunContext.from_event). If the run tracker is used (see
+    RUN_TRACKER_TABLE) then the number of processed cities is read from the run's
+    summary item with a single GetItem request. Otherwise, or if the run has not been
+    tracked, the S3 prefix is listed instead. In batch and parquet raw
+    writer modes (see RAW_WRITER_MODE) each object holds several cities, so the cities
+    in the manifests are counted instead.
+    :param event: Step function input, optionally containing run_date
     :param context: Not used
-    :return: Number of objects in specified S3 bucket and prefix
+    :return: Number of objects (or cities) in specified S3 bucket and prefix
     """
-    number_of_objects = count_objects_in_s3_prefix(
-        s3_bucket_env="S3_BUCKET",
-        base_prefix_env="BASE_PREFIX"
-        )
+    run_context = RunContext.from_event(event)
+
+    if os.environ.get("RUN_TRACKER_TABLE"):
+        number_of_objects = get_processed_city_count(
+            table_env="RUN_TRACKER_TABLE",
+            run_id=get_run_id(os.environ["RUN_TRACKER_PIPELINE"], run_context.run_date),
+            )
+        if number_of_objects is not None:
+            return {"objects": number_of_objects}
+        logger.info("Run not tracked, counting objects in S3 instead")
+
+    if os.environ.get("RAW_WRITER_MODE", "object") != "object":
+        number_of_objects = count_records_in_s3_manifests(
+            s3_bucket_env="S3_BUCKET",
+            manifest_prefix_env="MANIFEST_PREFIX",
+            run_date=run_context.run_date,
+            )
+    else:
+        number_of_objects = count_objects_in_s3_prefix(
+            s3_bucket_env="S3_BUCKET",
+            base_prefix_env="BASE_PREFIX",
+            run_date=run_context.run_date,
+            )
 
     return {"objects": number_of_objects}
@@ -0,0 +1,207 @@
+import sys
+import os
+import inspect
+
+# Allows lambda_functions module to be found in GitHub Actions
+current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+functions_dir = current_dir.replace("lambda_functions", "")
+sys.path.append(functions_dir)
+
+import configparser
+import time
+from datetime import datetime, timezone
+import logging
+from typing import Iterable
+from functions.batch_writer import (
+    create_city_key,
+    get_raw_writer_mode,
+    put_raw_batch_in_s3,
+    )
+from functions.concurrency import run_concurrently
+from functions.parquet_writer import PASSES_COLUMNS
+from functions.pass_prediction import (
+    get_tle,
+    predict_passes,
+    )
+from functions.run_context import RunContext
+from functions.run_tracker import (
+    get_run_id,
+    record_city_statuses,
+    )
+from functions.s3 import iter_city_records_from_s3_csv_object
+from lambda_functions.sqs_to_passes_api import (
+    get_pass_windows,
+    get_passes_api_parameters_from_config,
+    put_passes_response_in_s3,
+    send_cities_with_passes_to_weather_queue,
+    )
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def lambda_handler(event, context):
+    """
+    Predicts ISS passes over every city from a single TLE (instead of calling the N2YO
+    api once per city) then uploads the data to S3 in the same format as the
+    sqs_to_passes_api.py Lambda function. If WEATHER_QUEUE_URL is set (passes-first
+    weather mode) then only the cities with passes are sent on to the weather queue. If
+    RAW_WRITER_MODE is batch or parquet then all cities are put in a single S3 object.
+    Passes are predicted from the run date (see functions.run_context.RunContext
+    .from_event), or from now if the run date is today.
+    :param event: Step function input, optionally containing run_date
+    :param context: Not used
+    :return: Summary of the number of cities and passes
+    """
+    run_context = RunContext.from_event(event)
+    cities = get_cities_from_city_records(
+        iter_city_records_from_s3_csv_object(
+            input_data="LAMBDA_INPUT_DATA",
+            prefix="INPUT_DATA_PREFIX",
+            s3_bucket="S3_BUCKET",
+            ),
+        run_context=run_context,
+        )
+
+    # Gets the N2YO parameters so that predictions match the api request
+    n2yo_parameters = get_passes_api_parameters_from_config()
+    prediction_parameters = get_pass_prediction_parameters_from_config()
+
+    # Gets the TLE once for all cities
+    tle = get_tle(
+        nor_id=n2yo_parameters["nor_id"],
+        tle_url=prediction_parameters["tle_url"],
+        cache_path=os.environ.get("TLE_CACHE_PATH"),
+        max_age_seconds=prediction_parameters["tle_max_age_seconds"],
+        )
+
+    passes_responses = predict_passes(
+        cities=cities,
+        tle=tle,
+        nor_id=n2yo_parameters["nor_id"],
+        start_utc=get_prediction_start_utc(run_context),
+        days=float(n2yo_parameters["days"]),
+        min_visibility=float(n2yo_parameters["min_vis"]),
+        obs_alt=float(n2yo_parameters["obs_alt"]),
+        step_seconds=prediction_parameters["step_seconds"],
+        sun_max_elevation=prediction_parameters["sun_max_elevation"],
+        standard_magnitude=prediction_parameters["standard_magnitude"],
+        )
+
+    raw_writer_mode = get_raw_writer_mode()
+    if raw_writer_mode != "object":
+        # Puts the raw data rows of all cities in a single S3 object
+        raw_batch = {}
+        for city, response in zip(cities, passes_responses):
+            put_passes_response_in_s3(city, response, raw_batch=raw_batch)
+        put_raw_batch_in_s3(
+            city_rows=raw_batch.get(run_context.run_date, {}),
+            s3_bucket_env="S3_BUCKET",
+            raw_prefix_env="PASSES_RAW_PREFIX",
+            manifest_prefix_env="MANIFEST_PREFIX",
+            api_call_name="iss-passes",
+            compression=os.environ.get("RAW_BATCH_COMPRESSION", "none"),
+            file_format="parquet" if raw_writer_mode == "parquet" else "json",
+            columns=PASSES_COLUMNS,
+            run_date=run_context.run_date,
+            )
+    else:
+        # Puts the raw json file objects in S3 concurrently
+        results = run_concurrently(
+            func=lambda city_and_response: put_passes_response_in_s3(*city_and_response),
+            items=zip(cities, passes_responses),
+            max_concurrency=int(os.environ.get("S3_MAX_CONCURRENCY", "10")),
+            )
+        failed_results = [result for result in results if result.error is not None]
+        if failed_results:
+            logger.error("Failed to put %s cities in S3", len(failed_results))
+            raise Exception("Failed to put all predicted passes in S3")
+
+    # Every city has been processed, so the step function can start the compaction
+    if os.environ.get("RUN_TRACKER_TABLE"):
+        run_id = get_run_id(os.environ["RUN_TRACKER_PIPELINE"], run_context.run_date)
+        record_city_statuses(
+            table_env="RUN_TRACKER_TABLE",
+            run_id=run_id,
+            city_keys=(create_city_key(city) for city in cities),
+            status="processed",
+            )
+
+    # Sends the cities with passes to the weather queue in passes-first mode
+    if os.environ.get("WEATHER_QUEUE_URL"):
+        weather_cities = [
+            city | {"pass_windows": get_pass_windows(response)}
+            for city, response in zip(cities, passes_responses)
+            if "passes" in response
+            ]
+        if weather_cities:
+            send_cities_with_passes_to_weather_queue(weather_cities=weather_cities)
+
+    return {
+        "cities": len(cities),
+        "passes": sum(
+            response["info"]["passescount"] for response in passes_responses
+            ),
+        }
+
+
+def get_cities_from_city_records(
+    city_records: Iterable[dict],
+    run_context: RunContext = None,
+) -> list:
+    """
+    Converts city records (see functions.s3.create_city_records_from_csv_rows) into the
+    city dictionaries used by the passes api Lambda function
+    :param city_records: Iterable of city records
+    :param run_context: Run context that the cities are stamped with (default today)
+    :return: List of dictionaries containing city, lat, lon, region, country,
+    country_code and run_date
+    """
+    run_context = run_context or RunContext.today()
+    return [
+        {
+            "city": city["city"],
+            "lat": city["latitude"],
+            "lon": city["longitude"],
+            "region": city["region"],
+            "country": city["country"],
+            "country_code": city["country_code"],
+            "run_date": run_context.iso,
+            }
+        for city in city_records
+        ]
+
+
+def get_prediction_start_utc(run_context: RunContext) -> int:
+    """
+    Gets the time that passes are predicted from i.e. now for today's run, or midnight
+    UTC of the run date for a past (backfilled) run
+    :param run_context: Run context
+    :return: Unix timestamp
+    """
+    if run_context == RunContext.today():
+        return int(time.time())
+    return int(
+        datetime.combine(run_context.run_date, datetime.min.time(), timezone.utc)
+        .timestamp()
+        )
+
+
+def get_pass_prediction_parameters_from_config() -> dict:
+    """
+    Gets pass prediction parameters from lambdas_config.ini file
+    :return: Pass prediction parameters dictionary
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(rf"{current_dir}/lambdas_config.ini")
+
+    prediction_config = config["pass_prediction_config"]
+    prediction_parameters = {
+        "tle_url": prediction_config["tle_url"],
+        "tle_max_age_seconds": float(prediction_config["tle_max_age_hours"]) * 3600,
+        "step_seconds": int(prediction_config["step_seconds"]),
+        "sun_max_elevation": float(prediction_config["sun_max_elevation"]),
+        "standard_magnitude": float(prediction_config["standard_magnitude"]),
+        }
+    return prediction_parameters
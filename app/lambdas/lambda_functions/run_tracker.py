@@ -0,0 +1,72 @@
+from functions.run_tracker import (
+    DEFAULT_RUN_TIMEOUT_SECONDS,
+    get_city_statuses,
+    get_run_id,
+    get_run_status,
+    start_run,
+    )
+from functions.run_context import RunContext
+import os
+import logging
+
+# Sets logging level
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def lambda_handler(event, context) -> dict:
+    """
+    Tracks the cities processed by a pipeline run so that the step functions can start
+    the Glue compaction as soon as every city has been processed (or has failed),
+    instead of waiting a fixed time. The API Lambda functions add to the counts as
+    their SQS batches complete (see functions.run_tracker.record_sqs_event_progress).
+    - {"action": "start", "expected_objects": 431, "run_date": "2023-05-23"} starts
+      the run of the run date (default today)
+    - {"action": "status", "run_id": "passes/2023-05-23"} gets the run status from the
+      run summary item, which the step functions poll until the run is complete
+    - {"action": "city_statuses", "run_id": "passes/2023-05-23"} gets the number of
+      processed cities and the keys of the failed cities, which a re-run sends again
+    :param event: Step function input
+    :param context: Not used
+    :return: Run status (see functions.run_tracker.get_run_status) or city statuses
+    """
+    action = event.get("action")
+
+    if action == "start":
+        return start_run(
+            table_env="RUN_TRACKER_TABLE",
+            run_id=get_run_id(
+                os.environ["RUN_TRACKER_PIPELINE"], RunContext.from_event(event).run_date
+                ),
+            expected=int(event["expected_objects"]),
+            )
+
+    if action == "status":
+        return get_run_status(
+            table_env="RUN_TRACKER_TABLE",
+            run_id=event["run_id"],
+            timeout_seconds=int(
+                os.environ.get(
+                    "RUN_TRACKER_TIMEOUT_SECONDS", DEFAULT_RUN_TIMEOUT_SECONDS
+                    )
+                ),
+            )
+
+    if action == "city_statuses":
+        city_statuses = get_city_statuses(
+            table_env="RUN_TRACKER_TABLE", run_id=event["run_id"]
+            )
+        return {
+            "run_id": event["run_id"],
+            "processed": sum(
+                status == "processed" for status in city_statuses.values()
+                ),
+            "failed": sorted(
+                city_key
+                for city_key, status in city_statuses.items()
+                if status == "failed"
+                ),
+            }
+
+    logger.error("Invalid action: %s", action)
+    raise ValueError("Invalid action")
@@ -9,39 +9,65 @@ sys.path.append(functions_dir)
 
 
 import configparser
+import functools
 import json
-import io
-import requests
 import logging
-from typing import TypeVar, Generic
+from functions.batch_writer import (
+	create_city_key,
+	get_failed_city_keys,
+	get_raw_writer_mode,
+	put_raw_batch_for_sqs_event
+	)
+from functions.parquet_writer import PASSES_COLUMNS
 from functions.sqs import (
-	delete_message_from_sqs_queue,
-	transform_city_sqs_message_response_to_dictionary,
+	complete_sqs_event,
+	process_city_records_from_sqs_event,
+	send_cities_to_sqs_queue,
+	transform_city_dictionary_to_sqs_message_data,
+	)
+from functions.http_client import (
+	http_get,
+	is_auth_error
 	)
 from functions.s3 import (
 	put_object_in_s3_bucket
 	)
+from functions.serialization import create_ndjson_bytes
 from functions.other import (
 	create_s3_object_name_for_api_data_export,
 	)
+from functions.run_context import RunContext
+from functions.run_tracker import record_sqs_event_progress
+from functions.rate_limiter import (
+	TokenBucket,
+	get_rate_limiter
+	)
 from functions.secrets_manager import (
+	call_with_secret_refresh,
 	get_secret_from_secrets_manager
 	)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-StringIO = TypeVar('StringIO')
 
 
 def lambda_handler(event, context):
 	"""
 	Takes city location data from SQS queue, sends to N2YO api to get ISS passes over
-	the city then uploads data to S3
+	the cities then uploads data to S3. The cities in the batch are processed
+	concurrently (see API_MAX_CONCURRENCY and API_CONCURRENCY_MODE). If
+	WEATHER_QUEUE_URL is set (passes-first weather mode) then only the cities with
+	passes in successful messages are sent on to the weather queue. If RAW_WRITER_MODE is batch or parquet
+	then the cities in the batch are put in a single S3 object (see
+	functions.batch_writer).
 	:param event: SQS message with payload consisting of city name, lat, lon, etc.
 	from cities_to_sqs.py Lambda function
 	:param context: Not used
+	:return: Partial batch response containing the failed messages
 	"""
-	# Get N2YO api key from Secrets Manager
+	logger.info('Event metadata: %s', json.dumps(event))
+
+	# Get N2YO api key from Secrets Manager (cached across warm invocations)
 	passes_api_key_secret = get_secret_from_secrets_manager(
 		region_env='MY_AWS_REGION',
 		secret_name='n2yo_api_key'
@@ -50,52 +76,226 @@ def lambda_handler(event, context):
 	# Gets N2YO api parameters for input into the call_passes_api function
 	n2yo_parameters = get_passes_api_parameters_from_config()
 
-	for msg in event['Records']:
-		logger.info('Event metadata: %s', json.dumps(event))
+	# Gets the rate limiter shared by all N2YO requests (see RATE_LIMIT_BACKEND)
+	rate_limiter = get_passes_rate_limiter_from_config()
+
+	# Collects the cities with passes for the weather queue in passes-first mode
+	weather_cities = [] if os.environ.get('WEATHER_QUEUE_URL') else None
+
+	# Collects the raw data rows of every city in batch and parquet raw writer modes
+	raw_batch = {} if get_raw_writer_mode() != 'object' else None
+
+	# Processes every city in the batch concurrently. Messages can contain a single
+	# city or be packed with multiple cities.
+	failed_records = process_city_records_from_sqs_event(
+		records=event['Records'],
+		process_city=functools.partial(
+			process_city_passes,
+			n2yo_parameters=n2yo_parameters,
+			api_key=passes_api_key_secret,
+			rate_limiter=rate_limiter,
+			weather_cities=weather_cities,
+			raw_batch=raw_batch
+			),
+		max_concurrency=int(os.environ.get('API_MAX_CONCURRENCY', '10')),
+		mode=os.environ.get('API_CONCURRENCY_MODE', 'thread')
+		)
+
+	# Sends the cities with passes to the weather queue before the batch is completed,
+	# so that the batch is retried if they could not be sent
+	if weather_cities:
+		send_cities_with_passes_to_weather_queue(
+			weather_cities=weather_cities,
+			failed_records=failed_records
+			)
 
-		# Parses SQS event input to Lambda to dictionary
-		city_data_input_dict = transform_city_sqs_message_response_to_dictionary(
-			record=msg
+	# Puts the successful cities in a single S3 object in batch and parquet raw writer
+	# modes (one object per run date)
+	for run_date, city_rows in (raw_batch or {}).items():
+		put_raw_batch_for_sqs_event(
+			city_rows=city_rows,
+			failed_records=failed_records,
+			raw_prefix_env='PASSES_RAW_PREFIX',
+			api_call_name='iss-passes',
+			columns=PASSES_COLUMNS,
+			run_date=run_date
 			)
 
-		# Calls N2YO api
-		passes_response_json = call_passes_api(
+	# Adds the processed cities to the run tracker
+	record_sqs_event_progress(records=event['Records'], failed_records=failed_records)
+	
+	# Returns the failed messages so that only they are retried
+	return complete_sqs_event(
+		region_env='MY_AWS_REGION',
+		queue_url_env='SQS_QUEUE_URL',
+		records=event['Records'],
+		failed_records=failed_records,
+		report_batch_item_failures=os.environ.get(
+			'SQS_REPORT_BATCH_ITEM_FAILURES', 'true'
+			).lower() == 'true'
+		)
+
+
+def process_city_passes(
+	city_data_input_dict: dict,
+	n2yo_parameters: dict,
+	api_key: str,
+	rate_limiter: TokenBucket = None,
+	weather_cities: list = None,
+	raw_batch: dict = None
+	) -> str:
+	"""
+	Calls N2YO api for a single city, transforms the response and puts the raw json
+	file object in S3
+	:param city_data_input_dict: contains city, lat, lon and other data
+	:param n2yo_parameters: see lambdas_config.ini
+	:param api_key: string from AWS Secrets Manager
+	:param rate_limiter: Optional rate limiter that paces N2YO requests
+	:param weather_cities: Optional list that the city and its pass windows are
+	appended to if the city has passes (passes-first weather mode)
+	:param raw_batch: Optional dictionary that the raw data rows are added to (by run
+	date) instead of being put in S3 (batch and parquet raw writer modes)
+	:return: S3 object key of the raw json file, or None in batch and parquet raw
+	writer modes
+	"""
+	# Calls N2YO api, refreshing the api key and retrying once if it is rejected
+	passes_response_json = call_with_secret_refresh(
+		func=lambda secret: call_passes_api(
 			city_input_data=city_data_input_dict,
 			n2yo_parameters=n2yo_parameters,
-			api_key=passes_api_key_secret
-			)
+			api_key=secret,
+			rate_limiter=rate_limiter
+			),
+		secret=api_key,
+		region_env='MY_AWS_REGION',
+		secret_name='n2yo_api_key',
+		is_auth_error=is_auth_error
+		)
+
+	logger.info('Example of N2YO API response: %s', passes_response_json)
+	s3_object_key = put_passes_response_in_s3(
+		city_data_input_dict=city_data_input_dict,
+		passes_response_json=passes_response_json,
+		raw_batch=raw_batch
+		)
+
+	# Collects the city and its pass windows for the weather queue
+	pass_windows = get_pass_windows(passes_response_json)
+	if weather_cities is not None and pass_windows:
+		weather_cities.append(city_data_input_dict | {'pass_windows': pass_windows})
+	return s3_object_key
+
+
+def get_pass_windows(passes_response_json: dict) -> list:
+	"""
+	Gets the start and end times of each pass from an N2YO visualpasses response
+	:param passes_response_json: N2YO visualpasses shaped response
+	:return: List of [startUTC, endUTC] unix times. Empty if there are no passes.
+	"""
+	return [
+		[row['startUTC'], row['endUTC']]
+		for row in passes_response_json.get('passes', [])
+		]
+
+
+def send_cities_with_passes_to_weather_queue(
+	weather_cities: list,
+	failed_records: list = None
+	) -> dict:
+	"""
+	Sends cities and their pass windows to the weather queue (passes-first weather
+	mode), using the CITIES_PER_MESSAGE and GRID_CELL_DEGREES Lambda environment
+	variables if set. Cities of failed records are left out, as the records are retried
+	and their cities will be sent by a later invocation, which would otherwise send
+	them to the weather queue twice.
+	:param weather_cities: City dictionaries containing pass_windows
+	:param failed_records: Failed event['Records'] (see
+	functions.sqs.process_city_records_from_sqs_event)
+	:return: Summary of messages sent and failed
+	"""
+	failed_city_keys = get_failed_city_keys(failed_records or [])
+	weather_cities = [
+		city_data_dict for city_data_dict in weather_cities
+		if (
+			RunContext.from_city(city_data_dict).run_date,
+			create_city_key(city_data_dict)
+			) not in failed_city_keys
+		]
+	if not weather_cities:
+		logger.info('No cities with passes to send to weather queue')
+		return {'messages_sent': 0, 'messages_failed': 0, 'requests': 0, 'failed_entries': []}
+	
+	send_summary = send_cities_to_sqs_queue(
+		region_env='MY_AWS_REGION',
+		cities=[
+			transform_city_dictionary_to_sqs_message_data(city_data_dict)
+			for city_data_dict in weather_cities
+			],
+		queue_url_env='WEATHER_QUEUE_URL',
+		cities_per_message=int(os.environ.get('CITIES_PER_MESSAGE', '1')),
+		grid_cell_degrees=float(os.environ.get('GRID_CELL_DEGREES', '0'))
+		)
 
-		# Transforms N2YO api response to raw json format for uploading to S3
-		passes_response_dict, passes_response_stringio = \
-			transform_passes_from_api_response(
-				city_data_input_dict=city_data_input_dict,
-				passes_response_json=passes_response_json
-				)
-
-		# Deletes message from SQS queue
-		delete_message_from_sqs_queue(
-			region_env='MY_AWS_REGION',
-			queue_url='SQS_QUEUE_URL',
-			sqs_message=msg
+	if send_summary['messages_failed']:
+		logger.error(
+			'Failed to send %s messages to weather queue', send_summary['messages_failed']
 			)
+		raise Exception('Failed to send all cities with passes to weather queue')
+
+	logger.info('Sent %s cities with passes to weather queue', len(weather_cities))
+	return send_summary
 
-		# Generates a unique key for the raw json file
-		s3_object_key = create_s3_object_name_for_api_data_export(
-			s3_bucket_prefix=os.environ['PASSES_RAW_PREFIX'],
-			city_name=city_data_input_dict['city'],
-			region=city_data_input_dict['region'],
-			country_code=city_data_input_dict['country_code'],
-			api_call_name='iss-passes'
+
+def put_passes_response_in_s3(
+	city_data_input_dict: dict,
+	passes_response_json: dict,
+	raw_batch: dict = None
+	) -> str:
+	"""
+	Transforms an N2YO visualpasses response (from the api or the local pass
+	prediction engine) and puts the raw json file object in S3
+	:param city_data_input_dict: contains city, lat, lon and other data
+	:param passes_response_json: N2YO visualpasses shaped response
+	:param raw_batch: Optional dictionary that the raw data rows are added to (by run
+	date) instead of being put in S3 (batch and parquet raw writer modes)
+	:return: S3 object key of the raw json file, or None in batch and parquet raw
+	writer modes
+	"""
+	# Adds the raw data rows to the batch, which is put in S3 by the handler
+	if raw_batch is not None:
+		city_rows = raw_batch.setdefault(
+			RunContext.from_city(city_data_input_dict).run_date, {}
 			)
+		city_rows[create_city_key(city_data_input_dict)] = create_passes_rows(
+			city_data_input_dict=city_data_input_dict,
+			passes_response_json=passes_response_json
+			)
+		return None
 
-		# Puts the raw json file object in S3
-		put_object_in_s3_bucket(
-			s3_bucket='S3_BUCKET',
-			body=passes_response_stringio,
-			s3_key=s3_object_key
+	# Transforms N2YO api response to raw json format for uploading to S3
+	passes_response_dict, passes_response_body = \
+		transform_passes_from_api_response(
+			city_data_input_dict=city_data_input_dict,
+			passes_response_json=passes_response_json
 			)
 
-		logger.info('Example of N2YO API response: %s', passes_response_json)
+	# Generates a unique key for the raw json file
+	s3_object_key = create_s3_object_name_for_api_data_export(
+		s3_bucket_prefix=os.environ['PASSES_RAW_PREFIX'],
+		city_name=city_data_input_dict['city'],
+		region=city_data_input_dict['region'],
+		country_code=city_data_input_dict['country_code'],
+		api_call_name='iss-passes',
+		run_date=RunContext.from_city(city_data_input_dict).run_date
+		)
+
+	# Puts the raw json file object in S3
+	put_object_in_s3_bucket(
+		s3_bucket='S3_BUCKET',
+		body=passes_response_body,
+		s3_key=s3_object_key
+		)
+	return s3_object_key
 
 
 def get_passes_api_parameters_from_config():
@@ -117,19 +317,43 @@ def get_passes_api_parameters_from_config():
 	return n2yo_parameters
 
 
+def get_passes_rate_limiter_from_config() -> TokenBucket:
+	"""
+	Gets the N2YO rate limiter using the requests_per_hour limit in the
+	lambdas_config.ini file
+	:return: Rate limiter shared by all N2YO requests
+	"""
+	config = configparser.ConfigParser()
+	config.read(rf'{current_dir}/lambdas_config.ini')
+
+	return get_rate_limiter(
+		name='n2yo',
+		capacity=float(config['n2yo_config']['requests_per_hour']),
+		period_seconds=3600
+		)
+
+
 def call_passes_api(
 	city_input_data: dict,
 	n2yo_parameters: dict,
-	api_key: str
+	api_key: str,
+	rate_limiter: TokenBucket = None
 	) -> dict:
 	"""
-	Calls N2YO api to get ISS passes over input (i.e. lat, lon) location
+	Calls N2YO api to get ISS passes over input (i.e. lat, lon) location using the
+	shared HTTP session (keep-alive, timeouts and retries on 429 and 5xx responses)
 	:param city_input_data: contains lat, lon and other data
 	:param n2yo_parameters: see lambdas_config.ini
 	:param api_key: string from AWS Secrets Manager
+	:param rate_limiter: Optional rate limiter that paces N2YO requests. It is synced
+	with the transactionscount that N2YO reports for the last 60 minutes.
 	:return: N2YO api response based on parameters
 	"""
-	passes_api_response = requests.get(
+	# Waits for a token so that the N2YO hourly limit is not exceeded
+	if rate_limiter is not None:
+		rate_limiter.acquire()
+
+	passes_api_response = http_get(
 		f'https://api.n2yo.com/rest/v1/satellite/visualpasses/'
 		f'{n2yo_parameters["nor_id"]}/'
 		f'{city_input_data["lat"]}/{city_input_data["lon"]}/'
@@ -137,54 +361,59 @@ def call_passes_api(
 		f'{n2yo_parameters["days"]}/{n2yo_parameters["min_vis"]}&apiKey={api_key}'
 		)
 	passes_response_json = passes_api_response.json()
+
+	# Syncs the rate limiter with the transactions used by all workers
+	transactions_count = passes_response_json.get('info', {}).get('transactionscount')
+	if rate_limiter is not None and transactions_count is not None:
+		rate_limiter.observe_usage(transactions_count)
 	return passes_response_json
 
 
 def transform_passes_from_api_response(
 	city_data_input_dict: dict,
 	passes_response_json: dict
-	) -> [dict, Generic[StringIO]]:
+	) -> [dict, bytes]:
+	"""
+	Transforms N2YO api response into desired raw data json lines output
+	:param city_data_input_dict: Dictionary of city data to be appended to api
+	json response data
+	:param passes_response_json: json response data from api
+	:return: A dictionary of the last pass data and the json lines body
+	"""
+	passes_rows = create_passes_rows(
+		city_data_input_dict=city_data_input_dict,
+		passes_response_json=passes_response_json
+		)
+
+	return passes_rows[-1], create_ndjson_bytes(rows=passes_rows)
+
+
+def create_passes_rows(
+	city_data_input_dict: dict,
+	passes_response_json: dict
+	) -> list:
 	"""
-	Transforms N2YO api response into desired raw data json output
+	Creates the raw data rows of an N2YO api response i.e. one row per pass, or a
+	single row without pass data if there are no ISS passes over the location
 	:param city_data_input_dict: Dictionary of city data to be appended to api
 	json response data
 	:param passes_response_json: json response data from api
-	:return: A dictionary of pass data and a bytes stream
-	"""
-	passes_response_io = io.StringIO()
-
-	# Try outputs dictionary based on whether there are ISS passes over a location
-	# Except outputs dictionary even if there are no ISS passes over location
-	try:
-		# Add city name then concatenate 'hourly' and 'passes' arrays from response
-		for row in passes_response_json['passes']:
-			conc_passes_data = {
-								   'city': city_data_input_dict['city'],
-								   'lat': city_data_input_dict['lat'],
-								   'lon': city_data_input_dict['lon'],
-								   'region': city_data_input_dict['region'],
-								   'country': city_data_input_dict['country']
-								   } | passes_response_json['info'] | row
-
-			# Print lines to file (i.e. without commas and brackets) so that Athena
-			# can parse the json file
-			# TODO check if still required using current method of updating table
-			print(conc_passes_data, file=passes_response_io)
-
-		return conc_passes_data, passes_response_io.getvalue()
-
-	except KeyError:
-		# For cities without any passes - Add city name (column index 0)
-		conc_passes_data = {
-						   'city': city_data_input_dict['city'],
-						   'lat': city_data_input_dict['lat'],
-						   'lon': city_data_input_dict['lon'],
-						   'region': city_data_input_dict['region'],
-						   'country': city_data_input_dict['country']
-						   } | passes_response_json['info']
-
-		# Print lines to file (i.e. without commas and brackets) so that Athena can
-		# parse the json file
-		print(conc_passes_data, file=passes_response_io)
-
-	return conc_passes_data, passes_response_io.getvalue()
+	:return: List of pass data dictionaries
+	"""
+	city_data = {
+		'city': city_data_input_dict['city'],
+		'lat': city_data_input_dict['lat'],
+		'lon': city_data_input_dict['lon'],
+		'region': city_data_input_dict['region'],
+		'country': city_data_input_dict['country']
+		}
+
+	# For cities without any passes
+	if 'passes' not in passes_response_json:
+		return [city_data | passes_response_json['info']]
+
+	# Add city name then concatenate 'info' and 'passes' arrays from response
+	return [
+		city_data | passes_response_json['info'] | row
+		for row in passes_response_json['passes']
+		]
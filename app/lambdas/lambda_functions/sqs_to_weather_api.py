@@ -8,40 +8,65 @@ functions_dir = current_dir.replace('lambda_functions', '')
 sys.path.append(functions_dir)
 
 import configparser
+import functools
 import json
-import io
-import requests
 import logging
-from typing import TypeVar, Generic
+from typing import Iterator
+from functions.batch_writer import (
+    create_city_key,
+    get_raw_writer_mode,
+    put_raw_batch_for_sqs_event
+    )
+from functions.parquet_writer import WEATHER_COLUMNS
 from functions.sqs import (
-    delete_message_from_sqs_queue,
-    transform_city_sqs_message_response_to_dictionary,
+    complete_sqs_event,
+    process_city_records_from_sqs_event,
+    )
+from functions.http_client import (
+    http_get,
+    is_auth_error
     )
 from functions.s3 import (
     put_object_in_s3_bucket
     )
+from functions.serialization import (
+    dumps_json,
+    join_ndjson_lines
+    )
 from functions.other import (
     create_s3_object_name_for_api_data_export,
     )
+from functions.run_context import RunContext
+from functions.run_tracker import record_sqs_event_progress
+from functions.rate_limiter import (
+    TokenBucket,
+    get_rate_limiter
+    )
 from functions.secrets_manager import (
+    call_with_secret_refresh,
     get_secret_from_secrets_manager
     )
 
 # Sets logging level
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-StringIO = TypeVar("StringIO")
 
 
 def lambda_handler(event, context):
     """
     Takes city location data from SQS queue, sends to OpenWeather api to get ISS weather over
-    the city then uploads data to S3
+    the cities then uploads data to S3. The cities in the batch are processed
+    concurrently (see API_MAX_CONCURRENCY and API_CONCURRENCY_MODE). If
+    RAW_WRITER_MODE is batch or parquet then the cities in the batch are put in a single
+    S3 object (see functions.batch_writer).
     :param event: SQS message with payload consisting of city name, lat, lon, etc.
     from cities_to_sqs.py Lambda function
     :param context: Not used
+    :return: Partial batch response containing the failed messages
     """
-    # Get OpenWeather api key from Secrets Manager
+    logger.info("Event metadata: %s", json.dumps(event))
+
+    # Get OpenWeather api key from Secrets Manager (cached across warm invocations)
     weather_api_key_secret = get_secret_from_secrets_manager(
         region_env="MY_AWS_REGION", secret_name="openweather_api_key"
     )
@@ -49,56 +74,210 @@ def lambda_handler(event, context):
     # Gets OpenWeather api parameters for input into the call_passes_api function
     openweather_parameters = get_weather_api_parameters_from_config()
 
-    for msg in event["Records"]:
-        logger.info("Event metadata: %s", json.dumps(event))
+    # Gets the rate limiter shared by all OpenWeather requests (see RATE_LIMIT_BACKEND)
+    rate_limiter = get_weather_rate_limiter_from_config()
 
-        # Parses SQS event input to Lambda to dictionary
-        city_data_input_dict = transform_city_sqs_message_response_to_dictionary(
-            record=msg
-            )
+    # Collects the raw data rows of every city in batch and parquet raw writer modes
+    raw_batch = {} if get_raw_writer_mode() != "object" else None
 
-        # Calls OpenWeather api
-        weather_response_json = call_weather_api(
-            city_input_data=city_data_input_dict,
+    # Processes every city in the batch concurrently. Messages can contain a single
+    # city or be packed with multiple cities. Cities in the same grid cell share an api
+    # call (see GRID_CELL_DEGREES in cities_to_sqs.py).
+    failed_records = process_city_records_from_sqs_event(
+        records=event["Records"],
+        process_city=functools.partial(
+            process_city_weather,
             openweather_parameters=openweather_parameters,
             api_key=weather_api_key_secret,
+            rate_limiter=rate_limiter,
+            raw_batch=raw_batch,
+            ),
+        process_cell=functools.partial(
+            process_cell_weather,
+            openweather_parameters=openweather_parameters,
+            api_key=weather_api_key_secret,
+            rate_limiter=rate_limiter,
+            raw_batch=raw_batch,
+            ),
+        max_concurrency=int(os.environ.get("API_MAX_CONCURRENCY", "10")),
+        mode=os.environ.get("API_CONCURRENCY_MODE", "thread"),
+        )
+
+    # Puts the successful cities in a single S3 object in batch and parquet raw
+    # writer modes (one object per run date)
+    for run_date, city_rows in (raw_batch or {}).items():
+        put_raw_batch_for_sqs_event(
+            city_rows=city_rows,
+            failed_records=failed_records,
+            raw_prefix_env="WEATHER_RAW_PREFIX",
+            api_call_name="iss-weather",
+            columns=WEATHER_COLUMNS,
+            run_date=run_date,
             )
 
-        # Transforms openweather api response to raw json format for uploading to S3
-        weather_response_dict, weather_response_stringio = \
-            transform_weather_from_api_response(
-                city_data_input_dict=city_data_input_dict,
-                weather_response_json=weather_response_json,
-                )
+    # Adds the processed cities to the run tracker
+    record_sqs_event_progress(records=event["Records"], failed_records=failed_records)
+
+    # Returns the failed messages so that only they are retried
+    return complete_sqs_event(
+        region_env="MY_AWS_REGION",
+        queue_url_env="SQS_QUEUE_URL",
+        records=event["Records"],
+        failed_records=failed_records,
+        report_batch_item_failures=os.environ.get(
+            "SQS_REPORT_BATCH_ITEM_FAILURES", "true"
+            ).lower() == "true",
+        )
+
+
+def process_city_weather(
+    city_data_input_dict: dict,
+    openweather_parameters: dict,
+    api_key: str,
+    rate_limiter: TokenBucket = None,
+    raw_batch: dict = None,
+) -> str:
+    """
+    Calls OpenWeather api for a single city, transforms the response and puts the raw
+    json file object in S3
+    :param city_data_input_dict: contains city, lat, lon and other data
+    :param openweather_parameters: see lambdas_config.ini
+    :param api_key: string from AWS Secrets Manager
+    :param rate_limiter: Optional rate limiter that paces OpenWeather requests
+    :param raw_batch: Optional dictionary that the raw data rows are added to (by run
+    date) instead of being put in S3 (batch and parquet raw writer modes)
+    :return: S3 object key of the raw json file
+    """
+    # Calls OpenWeather api
+    weather_response_json = call_weather_api_with_key_refresh(
+        city_input_data=city_data_input_dict,
+        openweather_parameters=openweather_parameters,
+        api_key=api_key,
+        rate_limiter=rate_limiter,
+        )
+
+    logger.info(
+        "Example of OpenWeather API response: %s",
+        weather_response_json["hourly"][0],
+        )
+    return put_weather_response_in_s3(
+        city_data_input_dict=city_data_input_dict,
+        weather_response_json=weather_response_json,
+        raw_batch=raw_batch,
+        )
+
+
+def process_cell_weather(
+    cell_cities: list,
+    openweather_parameters: dict,
+    api_key: str,
+    rate_limiter: TokenBucket = None,
+    raw_batch: dict = None,
+) -> list:
+    """
+    Calls OpenWeather api once for the centre of a grid cell, then fans the response
+    out to every city in the cell and puts a raw json file object in S3 per city. The
+    location in each city's data is the city's own location rather than the cell
+    centre.
+    :param cell_cities: City dictionaries in the same grid cell (see functions.spatial)
+    :param openweather_parameters: see lambdas_config.ini
+    :param api_key: string from AWS Secrets Manager
+    :param rate_limiter: Optional rate limiter that paces OpenWeather requests
+    :param raw_batch: Optional dictionary that the raw data rows are added to (by run
+    date) instead of being put in S3 (batch and parquet raw writer modes)
+    :return: S3 object keys of the raw json files
+    """
+    cell = cell_cities[0]["cell"]
 
-        # Deletes message from SQS queue
-        delete_message_from_sqs_queue(
-            region_env="MY_AWS_REGION",
-            queue_url="SQS_QUEUE_URL",
-            sqs_message=msg
+    # Calls OpenWeather api once for the cell
+    weather_response_json = call_weather_api_with_key_refresh(
+        city_input_data={"lat": cell["latitude"], "lon": cell["longitude"]},
+        openweather_parameters=openweather_parameters,
+        api_key=api_key,
+        rate_limiter=rate_limiter,
+        )
+    logger.info(
+        "Fanning out OpenWeather API response for grid cell %s to %s cities",
+        cell["id"],
+        len(cell_cities),
+        )
+
+    return [
+        put_weather_response_in_s3(
+            city_data_input_dict=city_data_input_dict,
+            weather_response_json=weather_response_json | {
+                "lat": float(city_data_input_dict["lat"]),
+                "lon": float(city_data_input_dict["lon"]),
+                },
+            raw_batch=raw_batch,
             )
+        for city_data_input_dict in cell_cities
+        ]
 
-        # Generates a unique key for the raw json file
-        s3_object_key = create_s3_object_name_for_api_data_export(
-            s3_bucket_prefix=os.environ["WEATHER_RAW_PREFIX"],
-            city_name=city_data_input_dict["city"],
-            region=city_data_input_dict["region"],
-            country_code=city_data_input_dict["country_code"],
-            api_call_name="iss-weather",
+
+def put_weather_response_in_s3(
+    city_data_input_dict: dict,
+    weather_response_json: dict,
+    raw_batch: dict = None,
+) -> str:
+    """
+    Transforms an OpenWeather api response and puts the raw json file object in S3. If
+    the city has pass windows (passes-first weather mode) then only the hours of the
+    passes are kept.
+    :param city_data_input_dict: contains city, lat, lon and other data
+    :param weather_response_json: OpenWeather api response
+    :param raw_batch: Optional dictionary that the raw data rows are added to (by run
+    date) instead of being put in S3 (batch and parquet raw writer modes)
+    :return: S3 object key of the raw json file, or None if no hours were kept or in
+    batch and parquet raw writer modes
+    """
+    if "pass_windows" in city_data_input_dict:
+        weather_response_json = filter_hourly_weather_to_pass_windows(
+            weather_response_json=weather_response_json,
+            pass_windows=city_data_input_dict["pass_windows"],
             )
+        if not weather_response_json["hourly"]:
+            logger.warning(
+                "No weather hours in pass windows for: %s", city_data_input_dict["city"]
+                )
+            return None
 
-        # Puts the raw json file object in S3
-        put_object_in_s3_bucket(
-            s3_bucket="S3_BUCKET",
-            body=weather_response_stringio,
-            s3_key=s3_object_key
+    # Adds the raw data rows to the batch, which is put in S3 by the handler
+    if raw_batch is not None:
+        city_rows = raw_batch.setdefault(
+            RunContext.from_city(city_data_input_dict).run_date, {}
             )
+        city_rows[create_city_key(city_data_input_dict)] = create_weather_rows(
+            city_data_input_dict=city_data_input_dict,
+            weather_response_json=weather_response_json,
+            )
+        return None
 
-        logger.info(
-            "Example of OpenWeather API response: %s",
-            weather_response_json["hourly"][0],
+    # Transforms openweather api response to raw json format for uploading to S3
+    weather_response_dict, weather_response_body = \
+        transform_weather_from_api_response(
+            city_data_input_dict=city_data_input_dict,
+            weather_response_json=weather_response_json,
             )
 
+    # Generates a unique key for the raw json file
+    s3_object_key = create_s3_object_name_for_api_data_export(
+        s3_bucket_prefix=os.environ["WEATHER_RAW_PREFIX"],
+        city_name=city_data_input_dict["city"],
+        region=city_data_input_dict["region"],
+        country_code=city_data_input_dict["country_code"],
+        api_call_name="iss-weather",
+        run_date=RunContext.from_city(city_data_input_dict).run_date,
+        )
+
+    # Puts the raw json file object in S3
+    put_object_in_s3_bucket(
+        s3_bucket="S3_BUCKET",
+        body=weather_response_body,
+        s3_key=s3_object_key
+        )
+    return s3_object_key
+
 
 def get_weather_api_parameters_from_config():
     """
@@ -117,17 +296,71 @@ def get_weather_api_parameters_from_config():
     return openweather_parameters
 
 
+def get_weather_rate_limiter_from_config() -> TokenBucket:
+    """
+    Gets the OpenWeather rate limiter using the requests_per_minute limit in the
+    lambdas_config.ini file
+    :return: Rate limiter shared by all OpenWeather requests
+    """
+    config = configparser.ConfigParser()
+    config.read(rf"{current_dir}/lambdas_config.ini")
+
+    return get_rate_limiter(
+        name="openweather",
+        capacity=float(config["openweather_config"]["requests_per_minute"]),
+        period_seconds=60,
+        )
+
+
+def call_weather_api_with_key_refresh(
+    city_input_data: dict,
+    openweather_parameters: dict,
+    api_key: str,
+    rate_limiter: TokenBucket = None,
+) -> dict:
+    """
+    Calls OpenWeather api (see call_weather_api). If the api key is rejected then it is
+    refreshed from Secrets Manager and the call is retried once.
+    :param city_input_data: contains lat, lon and other data
+    :param openweather_parameters: see lambdas_config.ini
+    :param api_key: string from AWS Secrets Manager
+    :param rate_limiter: Optional rate limiter that paces OpenWeather requests
+    :return: OpenWeather api response based on parameters
+    """
+    return call_with_secret_refresh(
+        func=lambda secret: call_weather_api(
+            city_input_data=city_input_data,
+            openweather_parameters=openweather_parameters,
+            api_key=secret,
+            rate_limiter=rate_limiter,
+            ),
+        secret=api_key,
+        region_env="MY_AWS_REGION",
+        secret_name="openweather_api_key",
+        is_auth_error=is_auth_error,
+        )
+
+
 def call_weather_api(
-    city_input_data: dict, openweather_parameters: dict, api_key: str
+    city_input_data: dict,
+    openweather_parameters: dict,
+    api_key: str,
+    rate_limiter: TokenBucket = None,
 ) -> dict:
     """
-    Calls OpenWeather api to get ISS weather over input (i.e. lat, lon) location
+    Calls OpenWeather api to get ISS weather over input (i.e. lat, lon) location using
+    the shared HTTP session (keep-alive, timeouts and retries on 429 and 5xx responses)
     :param city_input_data: contains lat, lon and other data
     :param openweather_parameters:
     :param api_key: string from AWS Secrets Manager
+    :param rate_limiter: Optional rate limiter that paces OpenWeather requests
     :return: OpenWeather api response based on parameters
     """
-    weather_api_response = requests.get(
+    # Waits for a token so that the OpenWeather per minute limit is not exceeded
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+
+    weather_api_response = http_get(
         f'https://api.openweathermap.org/data/2.5/onecall?lat={city_input_data["lat"]}&'
         f'lon={city_input_data["lon"]}&exclude={openweather_parameters["exclude"]}&'
         f'units={openweather_parameters["units"]}&appid={api_key}'
@@ -136,33 +369,141 @@ def call_weather_api(
     return weather_response_json
 
 
+def filter_hourly_weather_to_pass_windows(
+    weather_response_json: dict, pass_windows: list
+) -> dict:
+    """
+    Keeps only the hourly weather rows that overlap an ISS pass window
+    :param weather_response_json: OpenWeather api response
+    :param pass_windows: List of [startUTC, endUTC] unix times
+    :return: Copy of the response with the filtered hourly rows
+    """
+    hourly = [
+        row
+        for row in weather_response_json["hourly"]
+        if any(row["dt"] <= end and start < row["dt"] + 3600 for start, end in pass_windows)
+        ]
+    return weather_response_json | {"hourly": hourly}
+
+
 def transform_weather_from_api_response(
     city_data_input_dict: dict, weather_response_json: dict
-) -> [dict, Generic[StringIO]]:
-    """
-    Transforms OpenWeather api response into desired raw data json output
-    :param city_data_input_dict:
-    :param weather_response_json:
-    :return: TODO
-    """
-    weather_response_io = io.StringIO()
-
-    # Add city name then concatenate 'hourly' and 'weather' arrays from response
-    for rows in weather_response_json["hourly"]:
-        conc_weather_data = {
-                            "city": city_data_input_dict["city"],
-                            "lat": city_data_input_dict["lat"],
-                            "lon": city_data_input_dict["lon"],
-                            "region": city_data_input_dict["region"],
-                            "country": city_data_input_dict["country"],
-                            } | weather_response_json | rows | rows["weather"][0]
-
-        # Delete 'weather' array as has already been concatenated
-        del conc_weather_data["hourly"]
-        del conc_weather_data["weather"]
-
-        # Print lines to file (i.e. without commas and brackets) so that Athena can
-        # parse the json file
-        print(conc_weather_data, file=weather_response_io)
-
-    return conc_weather_data, weather_response_io.getvalue()
+) -> [dict, bytes]:
+    """
+    Transforms OpenWeather api response into desired raw data json lines output
+    :param city_data_input_dict: Dictionary of city data to be appended to api json
+    response data
+    :param weather_response_json: OpenWeather api response
+    :return: A dictionary of the last hour of weather data and the json lines body
+    """
+    weather_response_body = join_ndjson_lines(
+        iter_weather_json_lines(
+            city_data_input_dict=city_data_input_dict,
+            weather_response_json=weather_response_json,
+            )
+        )
+
+    conc_weather_data = None
+    if weather_response_json["hourly"]:
+        conc_weather_data = _create_weather_row_header(
+            city_data_input_dict, weather_response_json
+            ) | dict(_iter_hour_items(weather_response_json["hourly"][-1]))
+
+    return conc_weather_data, weather_response_body
+
+
+def create_weather_rows(
+    city_data_input_dict: dict, weather_response_json: dict
+) -> list:
+    """
+    Creates the raw data rows of an OpenWeather api response i.e. one row per hour
+    :param city_data_input_dict: Dictionary of city data to be appended to api json
+    response data
+    :param weather_response_json: OpenWeather api response
+    :return: List of hourly weather dictionaries
+    """
+    return list(
+        iter_weather_rows(
+            city_data_input_dict=city_data_input_dict,
+            weather_response_json=weather_response_json,
+            )
+        )
+
+
+def iter_weather_rows(
+    city_data_input_dict: dict, weather_response_json: dict
+) -> Iterator[dict]:
+    """
+    Lazily creates the raw data rows of an OpenWeather api response. The fields that
+    are the same for every hour are projected once, so each row only copies the small
+    header and its own hour instead of the whole response.
+    :param city_data_input_dict: Dictionary of city data to be appended to api json
+    response data
+    :param weather_response_json: OpenWeather api response
+    :return: Iterator of hourly weather dictionaries
+    """
+    header = _create_weather_row_header(city_data_input_dict, weather_response_json)
+    for hour in weather_response_json["hourly"]:
+        conc_weather_data = header.copy()
+        conc_weather_data.update(_iter_hour_items(hour))
+        yield conc_weather_data
+
+
+def iter_weather_json_lines(
+    city_data_input_dict: dict, weather_response_json: dict
+) -> Iterator[bytes]:
+    """
+    Serializes the raw data rows of an OpenWeather api response to json lines one hour
+    at a time. The header fields are serialized once and joined to each hour, and
+    rows are only created as dictionaries if an hour repeats a header field.
+    :param city_data_input_dict: Dictionary of city data to be appended to api json
+    response data
+    :param weather_response_json: OpenWeather api response
+    :return: Iterator of json lines, each ending in a newline
+    """
+    header = _create_weather_row_header(city_data_input_dict, weather_response_json)
+
+    # Serializes the header without the closing bracket i.e. b'{"city":"Perth",...'
+    header_json = dumps_json(header)[:-1]
+
+    for hour in weather_response_json["hourly"]:
+        hour_data = dict(_iter_hour_items(hour))
+        if hour_data and header.keys().isdisjoint(hour_data):
+            # Joins the hour without its opening bracket to the header
+            yield b"".join(
+                (header_json, b",", memoryview(dumps_json(hour_data))[1:], b"\n")
+                )
+        else:
+            # Repeated fields overwrite the earlier value, as in a dictionary
+            yield dumps_json(header | hour_data) + b"\n"
+
+
+def _create_weather_row_header(
+    city_data_input_dict: dict, weather_response_json: dict
+) -> dict:
+    """
+    Creates the fields that are the same for every hour i.e. the city data followed by
+    the OpenWeather response fields other than hourly.
+    """
+    header = {
+        "city": city_data_input_dict["city"],
+        "lat": city_data_input_dict["lat"],
+        "lon": city_data_input_dict["lon"],
+        "region": city_data_input_dict["region"],
+        "country": city_data_input_dict["country"],
+        }
+    for key, value in weather_response_json.items():
+        if key != "hourly":
+            header[key] = value
+    return header
+
+
+def _iter_hour_items(hour: dict) -> Iterator[tuple]:
+    """
+    Yields the fields of an hour, with the 'weather' array replaced by the fields of
+    its first element.
+    """
+    for key, value in hour.items():
+        if key != "weather":
+            yield key, value
+    yield from hour["weather"][0].items()
@@ -1,4 +1,4 @@
-CREATE EXTERNAL TABLE IF NOT EXISTS {} (
+CREATE EXTERNAL TABLE IF NOT EXISTS {table} (
   city string,
   lat double,
   lon double,
@@ -49,4 +49,4 @@ STORED AS INPUTFORMAT
 OUTPUTFORMAT
   'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat'
 LOCATION
-  's3://{}/query-results/'
+  's3://{s3_bucket}/query-results/'
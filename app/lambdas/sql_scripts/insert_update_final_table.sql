@@ -1,4 +1,4 @@
-INSERT INTO {}
+INSERT INTO {final_table}
 	SELECT
 		P.city
 		, P.lat
@@ -40,13 +40,13 @@ INSERT INTO {}
 		, W.year
 		, W.month
 		, W.day
-	FROM {} AS P
-	INNER JOIN {} AS W
+	FROM {passes_table} AS P
+	INNER JOIN {weather_table} AS W
 		ON date_format(from_unixtime(P.startutc), '%Y-%m-%d %H')
 			= date_format(from_unixtime(W.dt), '%Y-%m-%d %H')
 		AND P.city = W.city
 		AND P.region= W.region
 		AND P.country = W.country
-	WHERE W.year = date_format(CURRENT_TIMESTAMP, '%Y')
-		AND W.month = date_format(CURRENT_TIMESTAMP, '%m')
-		AND W.day = date_format(CURRENT_TIMESTAMP, '%d');
+	WHERE W.year = {year}
+		AND W.month = {month}
+		AND W.day = {day};
@@ -0,0 +1,6 @@
+SELECT COUNT(DISTINCT(city, region))
+FROM {table}
+WHERE passescount > 0
+    AND day = {day}
+    AND month = {month}
+    AND year = {year}
@@ -0,0 +1,19 @@
+#!/bin/bash
+# Runs the Python benchmarks in tests/benchmarks offline, so no AWS credentials are
+# required. AWS calls are either mocked with moto or not made at all. Benchmarks that
+# compare a deployed stack (benchmark_glue_compaction) are run in their --local mode;
+# run them directly with AWS credentials for the deployed comparison. Requires pip
+# install of the requirements and moto to run script.
+cd ..
+echo "Running benchmarks
+"
+for benchmark in tests/benchmarks/benchmark_*.py; do
+  module=$(echo "${benchmark%.py}" | tr '/' '.')
+  args=()
+  if [ "$module" = "tests.benchmarks.benchmark_glue_compaction" ]; then
+    args=(--local)
+  fi
+  echo "$module ${args[*]}"
+  python -m "$module" "${args[@]}"
+  echo
+done
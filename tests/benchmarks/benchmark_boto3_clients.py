@@ -0,0 +1,83 @@
+"""
+Benchmarks the per-record overhead of creating a new boto3 client for every helper call
+(before) against the cached client registry in functions/clients.py (after). Simulates
+the S3 put and SQS delete made for each record of a 10 record SQS batch in the
+sqs_to_*_api Lambda functions. AWS calls are mocked with moto so that only the client
+overhead is measured.
+
+Run from the project root with:
+    python -m tests.benchmarks.benchmark_boto3_clients
+"""
+import os
+import statistics
+import time
+import boto3
+from moto import mock_s3, mock_sqs
+from app.lambdas.functions.clients import (
+	get_boto3_client,
+	reset_boto3_clients,
+	)
+
+AWS_DEFAULT_REGION = 'ap-southeast-2'
+BATCH_SIZE = 10
+NUM_BATCHES = 20
+
+
+def process_record_before(record_num: int, queue_url: str, receipt_handle: str):
+	# Mimics the original helpers, which call boto3.client() on every invocation
+	s3_client = boto3.client('s3')
+	s3_client.put_object(Bucket='benchmark', Key=f'{record_num}.json', Body=b'{}')
+	sqs_client = boto3.client('sqs', region_name=AWS_DEFAULT_REGION)
+	sqs_client.delete_message(QueueUrl=queue_url, ReceiptHandle=receipt_handle)
+
+
+def process_record_after(record_num: int, queue_url: str, receipt_handle: str):
+	# Uses the module scope client registry
+	s3_client = get_boto3_client('s3')
+	s3_client.put_object(Bucket='benchmark', Key=f'{record_num}.json', Body=b'{}')
+	sqs_client = get_boto3_client('sqs', region_name=AWS_DEFAULT_REGION)
+	sqs_client.delete_message(QueueUrl=queue_url, ReceiptHandle=receipt_handle)
+
+
+def time_per_record(process_record, queue_url: str, receipt_handle: str) -> list:
+	# Returns the wall time in milliseconds of each simulated record
+	timings = []
+	for record_num in range(BATCH_SIZE * NUM_BATCHES):
+		start = time.perf_counter()
+		process_record(record_num, queue_url, receipt_handle)
+		timings.append((time.perf_counter() - start) * 1000)
+	return timings
+
+
+def main():
+	os.environ.setdefault('AWS_DEFAULT_REGION', AWS_DEFAULT_REGION)
+	with mock_s3(), mock_sqs():
+		s3 = boto3.client('s3', region_name='us-east-1')
+		s3.create_bucket(Bucket='benchmark')
+		sqs = boto3.client('sqs', region_name=AWS_DEFAULT_REGION)
+		queue_url = sqs.create_queue(QueueName='benchmark')['QueueUrl']
+		sqs.send_message(QueueUrl=queue_url, MessageBody='{}')
+		receipt_handle = sqs.receive_message(QueueUrl=queue_url)['Messages'][0][
+			'ReceiptHandle']
+
+		reset_boto3_clients()
+		results = {
+			'before (boto3.client per call)': time_per_record(
+				process_record_before, queue_url, receipt_handle
+				),
+			'after (cached client registry)': time_per_record(
+				process_record_after, queue_url, receipt_handle
+				),
+			}
+
+	print(f'Records per run: {BATCH_SIZE * NUM_BATCHES}')
+	for name, timings in results.items():
+		print(
+			f'{name}: mean {statistics.mean(timings):.2f} ms/record, '
+			f'median {statistics.median(timings):.2f} ms/record, '
+			f'first {timings[0]:.2f} ms'
+			)
+
+
+if __name__ == '__main__':
+	main()
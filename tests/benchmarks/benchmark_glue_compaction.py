@@ -0,0 +1,140 @@
+"""
+Benchmarks the end-to-end latency of the passes and weather step functions with the
+Glue compaction jobs (RawWriterMode object or batch) against without them
+(RawWriterMode parquet, where the Lambda functions write Parquet straight into the
+_compacted prefix).
+
+The Glue jobs cannot run locally, so the step function executions of a deployed stack
+are compared. Executions are grouped by whether they entered a Glue compaction state
+(G-*), and the execution time and the time spent in each group's compaction step are
+reported. Run the pipeline for a few days in each RawWriterMode first.
+
+The Lambda side of the comparison (writing Parquet for every city instead of the raw
+json lines of functions.serialization) is measured locally with --local. One of the
+two modes must be given.
+
+Run from the project root with:
+    python -m tests.benchmarks.benchmark_glue_compaction <state machine arn> [...]
+    python -m tests.benchmarks.benchmark_glue_compaction --local
+"""
+import statistics
+import sys
+import time
+import boto3
+from app.lambdas.functions.parquet_writer import PASSES_COLUMNS, create_parquet_bytes
+from app.lambdas.functions.serialization import create_ndjson_bytes
+
+NUM_CITIES = 431
+PASSES_PER_CITY = 4
+NUM_RUNS = 20
+MAX_EXECUTIONS = 30
+USAGE = (
+	'Usage: python -m tests.benchmarks.benchmark_glue_compaction '
+	'<state machine arn> [...] | --local'
+	)
+
+
+def get_execution_timings(state_machine_arn: str) -> dict:
+	# Returns the execution times in seconds of successful executions, grouped by
+	# whether the Glue compaction job ran, and the time spent in the compaction step
+	sfn_client = boto3.client('stepfunctions')
+	timings = {'with glue': [], 'without glue': [], 'glue step': []}
+	executions = sfn_client.list_executions(
+		stateMachineArn=state_machine_arn,
+		statusFilter='SUCCEEDED',
+		maxResults=MAX_EXECUTIONS
+		)['executions']
+
+	for execution in executions:
+		events = sfn_client.get_execution_history(
+			executionArn=execution['executionArn'],
+			maxResults=1000
+			)['events']
+		glue_entered = glue_exited = None
+		for event in events:
+			name = event.get('stateEnteredEventDetails', {}).get('name', '')
+			if name.startswith('G-'):
+				glue_entered = event['timestamp']
+			name = event.get('stateExitedEventDetails', {}).get('name', '')
+			if name.startswith('G-'):
+				glue_exited = event['timestamp']
+
+		duration = (execution['stopDate'] - execution['startDate']).total_seconds()
+		if glue_entered is None:
+			timings['without glue'].append(duration)
+		else:
+			timings['with glue'].append(duration)
+			timings['glue step'].append((glue_exited - glue_entered).total_seconds())
+	return timings
+
+
+def create_passes_rows() -> dict:
+	# Mocks the raw data rows of a day of N2YO responses
+	return {
+		f'AUS-Region-City {city}': [
+			{
+				'city': f'City {city}', 'lat': '-31.95', 'lon': '115.86',
+				'region': 'Region', 'country': 'Australia', 'satid': 25544,
+				'satname': 'SPACE STATION', 'transactionscount': city, 'passescount': 4,
+				'startAz': 311.2, 'startAzCompass': 'NW', 'startEl': 10.1,
+				'startUTC': 1684800000 + num, 'maxAz': 40.3, 'maxAzCompass': 'NE',
+				'maxEl': 45.3, 'maxUTC': 1684800300 + num, 'endAz': 130.4,
+				'endAzCompass': 'SE', 'endEl': 10.2, 'endUTC': 1684800600 + num,
+				'mag': -2.3, 'duration': 600, 'startVisibility': 1684800010 + num
+				}
+			for num in range(PASSES_PER_CITY)
+			]
+		for city in range(NUM_CITIES)
+		}
+
+
+def time_local_writers() -> dict:
+	# Returns the wall time in milliseconds of serialising a day of passes rows
+	city_rows = create_passes_rows()
+	rows = [row for city_key in sorted(city_rows) for row in city_rows[city_key]]
+	writers = {
+		'json lines': lambda: create_ndjson_bytes(rows=rows),
+		'json lines (gzip)': lambda: create_ndjson_bytes(rows=rows, compression='gzip'),
+		'parquet (snappy)': lambda: create_parquet_bytes(rows=rows, columns=PASSES_COLUMNS),
+		}
+
+	timings = {}
+	for name, writer in writers.items():
+		timings[name] = []
+		for _ in range(NUM_RUNS):
+			start = time.perf_counter()
+			body = writer()
+			timings[name].append((time.perf_counter() - start) * 1000)
+		timings[name].append(len(body))
+	return timings
+
+
+def main():
+	if not sys.argv[1:] or ('--local' in sys.argv[1:] and sys.argv[1:] != ['--local']):
+		sys.exit(USAGE)
+
+	if sys.argv[1:] == ['--local']:
+		print(f'Cities: {NUM_CITIES}, passes per city: {PASSES_PER_CITY}')
+		for name, timings in time_local_writers().items():
+			size = timings.pop()
+			print(
+				f'{name}: median {statistics.median(timings):.1f} ms, '
+				f'size {size / 1024:.0f} KiB'
+				)
+		return
+
+	for state_machine_arn in sys.argv[1:]:
+		print(state_machine_arn)
+		for name, timings in get_execution_timings(state_machine_arn).items():
+			if timings:
+				print(
+					f'  {name}: {len(timings)} executions, '
+					f'median {statistics.median(timings):.0f} s, '
+					f'max {max(timings):.0f} s'
+					)
+			else:
+				print(f'  {name}: no executions')
+
+
+if __name__ == '__main__':
+	main()
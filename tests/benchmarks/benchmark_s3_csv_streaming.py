@@ -0,0 +1,92 @@
+"""
+Benchmarks the memory used to read the city input data csv object from S3. Compares
+reading the whole response body before parsing it (before) against
+s3.iter_city_records_from_s3_csv_object, which parses the cities as the body is read
+(after), for csv objects of increasing size. Reports the peak memory allocated by
+tracemalloc while the object is read, which should stay about the same for every size
+after the change. AWS calls are mocked with moto.
+
+Run from the project root with:
+    python -m tests.benchmarks.benchmark_s3_csv_streaming
+"""
+import csv
+import io
+import os
+import tracemalloc
+import boto3
+from moto import mock_s3
+from app.lambdas.functions.clients import (
+	get_boto3_client,
+	reset_boto3_clients,
+	)
+from app.lambdas.functions.s3 import iter_city_records_from_s3_csv_object
+
+AWS_DEFAULT_REGION = 'ap-southeast-2'
+HEADER = 'city,region,latitude,longitude,country,country_code\n'
+ROW = 'Perth,Western Australia,-31.9522,115.8589,Australia,AUS\n'
+ROW_COUNTS = (10_000, 50_000, 250_000)
+
+
+def read_cities_before(body) -> int:
+	# Mimics reading the whole csv object into memory before the rows are parsed
+	content = body.read().decode('utf-8-sig')
+	return sum(1 for _ in csv.DictReader(io.StringIO(content, newline='')))
+
+
+def read_cities_after(city_records) -> int:
+	# Parses the cities as the response body is read
+	return sum(1 for _ in city_records)
+
+
+def get_peak_allocation(func, argument) -> int:
+	# Returns the peak memory in bytes allocated while the function runs
+	tracemalloc.start()
+	try:
+		func(argument)
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+def get_body() -> object:
+	# Gets the response body without reading it
+	return get_boto3_client('s3').get_object(
+		Bucket=os.environ['S3_BUCKET'],
+		Key=f"{os.environ['S3_PREFIX']}/{os.environ['LAMBDA_INPUT_DATA_NAME']}"
+		)['Body']
+
+
+def get_city_records() -> object:
+	# Gets the city records iterator, the body is only read as it is iterated
+	return iter_city_records_from_s3_csv_object(
+		input_data='LAMBDA_INPUT_DATA_NAME',
+		prefix='S3_PREFIX',
+		s3_bucket='S3_BUCKET'
+		)
+
+
+def main():
+	os.environ.setdefault('AWS_DEFAULT_REGION', AWS_DEFAULT_REGION)
+	os.environ['LAMBDA_INPUT_DATA_NAME'] = 'benchmark.csv'
+	os.environ['S3_PREFIX'] = 'benchmark'
+	os.environ['S3_BUCKET'] = 'benchmark'
+	with mock_s3():
+		reset_boto3_clients()
+		s3 = boto3.client('s3', region_name='us-east-1')
+		s3.create_bucket(Bucket='benchmark')
+		for row_count in ROW_COUNTS:
+			content = (HEADER + ROW * row_count).encode('utf-8')
+			s3.put_object(Bucket='benchmark', Key='benchmark/benchmark.csv', Body=content)
+			print(f'{row_count} cities ({len(content) / 1024:.0f} KiB):')
+			# The object is got before tracemalloc starts, so moto's copy of the
+			# object is not counted
+			for name, func, argument in (
+				('before (whole body)', read_cities_before, get_body()),
+				('after (streamed body)', read_cities_after, get_city_records()),
+				):
+				print(f'  {name}: peak {get_peak_allocation(func, argument) / 1024:.1f} KiB')
+	reset_boto3_clients()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,98 @@
+"""
+Benchmarks the weather rows of one city's 48 hour OpenWeather response. Compares the
+previous implementation, which merged the whole api response into every row and printed
+the dictionaries (before), against the json lines of
+sqs_to_weather_api.transform_weather_from_api_response (after). Reports the best wall
+time of repeated runs and the peak memory allocated by tracemalloc. Makes no AWS calls.
+
+Run from the project root with:
+    python -m tests.benchmarks.benchmark_weather_rows
+"""
+import copy
+import io
+import json
+import timeit
+import tracemalloc
+from app.lambdas.lambda_functions.sqs_to_weather_api import (
+	transform_weather_from_api_response,
+	)
+
+MOCK_DATA_FILE = 'tests/unit/test_data/test_sqs_to_weather_api_mock_data.json'
+HOURS = 48
+REPEATS = 15
+NUMBER = 20
+
+
+def load_weather_response() -> tuple:
+	# Replicates the mocked hour of the unit test data to a full 48 hour response
+	with open(MOCK_DATA_FILE, 'r') as f:
+		mock_data = json.load(f)
+	city_data = mock_data['mocked_sqs_location_data']
+	weather_response_json = copy.deepcopy(mock_data['expected_weather_api_output'])
+	first_hour = weather_response_json['hourly'][0]
+	weather_response_json['hourly'] = []
+	for i in range(HOURS):
+		hour = copy.deepcopy(first_hour)
+		hour['dt'] = first_hour['dt'] + i * 3600
+		weather_response_json['hourly'].append(hour)
+	return city_data, weather_response_json
+
+
+def transform_before(city_data: dict, weather_response_json: dict) -> tuple:
+	# Previous implementation of transform_weather_from_api_response
+	weather_response_io = io.StringIO()
+	for rows in weather_response_json['hourly']:
+		conc_weather_data = {
+			'city': city_data['city'],
+			'lat': city_data['lat'],
+			'lon': city_data['lon'],
+			'region': city_data['region'],
+			'country': city_data['country'],
+			} | weather_response_json | rows | rows['weather'][0]
+		del conc_weather_data['hourly']
+		del conc_weather_data['weather']
+		print(conc_weather_data, file=weather_response_io)
+	return conc_weather_data, weather_response_io.getvalue()
+
+
+def get_peak_allocation(func) -> int:
+	# Returns the peak memory in bytes allocated while the function runs
+	tracemalloc.start()
+	try:
+		func()
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+def get_best_times(funcs: dict) -> dict:
+	# Alternates between the functions so that they all see the same machine noise
+	best_times = dict.fromkeys(funcs, float('inf'))
+	for _ in range(REPEATS):
+		for name, func in funcs.items():
+			best_times[name] = min(best_times[name], timeit.timeit(func, number=NUMBER))
+	return best_times
+
+
+def main():
+	city_data, weather_response_json = load_weather_response()
+	funcs = {
+		'before (merged dictionaries)': lambda: transform_before(
+			city_data, weather_response_json
+			),
+		'after (json lines)': lambda: transform_weather_from_api_response(
+			city_data, weather_response_json
+			),
+		}
+	best_times = get_best_times(funcs)
+
+	print(f'Hours per response: {HOURS}')
+	for name, func in funcs.items():
+		print(
+			f'{name}: best {best_times[name] / NUMBER * 1000:.3f} ms/response, '
+			f'peak {get_peak_allocation(func) / 1024:.1f} KiB'
+			)
+
+
+if __name__ == '__main__':
+	main()
@@ -1,8 +1,20 @@
 import unittest
 from unittest import mock
-from moto import (mock_athena)
+from decimal import Decimal
+from moto import (mock_athena, mock_s3)
+from moto.athena.models import QueryResults, athena_backends
+from moto.core import DEFAULT_ACCOUNT_ID
+import boto3
+from botocore.stub import Stubber
+from app.lambdas.functions.clients import get_boto3_client, reset_boto3_clients
 from app.lambdas.functions.athena import (
-	execute_athena_query
+	AthenaQueryError,
+	execute_athena_query,
+	get_athena_query_cache_key,
+	read_athena_query_result,
+	run_athena_queries,
+	start_athena_query,
+	wait_for_athena_queries
 	)
 
 # Sets default AWS region
@@ -25,6 +37,7 @@ class TestExecuteAthenaQuery(unittest.TestCase):
 	
 	def setUp(self):
 		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
 		self.mock_athena.start()
 	
 	def tearDown(self):
@@ -61,6 +74,387 @@ class TestExecuteAthenaQuery(unittest.TestCase):
 		self.assertEqual(type(test_func), type(mock_query_execution_response))
 
 
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	"os.environ",
+	{
+		"AWS_DEFAULT_REGION": f"{AWS_DEFAULT_REGION}",
+		"CATALOG": "testing_catalog",
+		"GLUE_DB": "testing_db",
+		"QUERY_RESULTS": "testing_query",
+		"S3_BUCKET": "testing",
+		},
+	)
+class TestRunAthenaQueries(unittest.TestCase):
+	# Tests the run_athena_queries and wait_for_athena_queries functions
+	mock_athena = mock_athena()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_athena.start()
+		self.athena_kwargs = {
+			"catalog_env": "CATALOG",
+			"database_env": "GLUE_DB",
+			"query_results_env": "QUERY_RESULTS",
+			"region_env": "AWS_DEFAULT_REGION",
+			"s3_bucket_env": "S3_BUCKET",
+			}
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_athena.stop()
+	
+	def test_executions_are_returned_in_query_order(self):
+		# Tests that every query is submitted and waited on together
+		query_strs = [f"SELECT {i}" for i in range(3)]
+		
+		# Calls function to be tested
+		test_func = run_athena_queries(query_strs=query_strs, **self.athena_kwargs)
+		athena = boto3.client("athena", region_name=AWS_DEFAULT_REGION)
+		queries = [
+			athena.get_query_execution(QueryExecutionId=execution.query_id)
+			["QueryExecution"]["Query"]
+			for execution in test_func
+			]
+		
+		# Runs assertions
+		self.assertEqual(queries, query_strs)
+		self.assertEqual({execution.state for execution in test_func}, {"SUCCEEDED"})
+	
+	def test_cancelled_query_raises_athena_query_error(self):
+		# Tests that a query that did not succeed raises an error containing its id
+		query_id = start_athena_query(
+			query_str="SELECT 1", **self.athena_kwargs
+			)["QueryExecutionId"]
+		boto3.client("athena", region_name=AWS_DEFAULT_REGION).stop_query_execution(
+			QueryExecutionId=query_id
+			)
+		
+		# Calls function to be tested
+		with self.assertRaises(AthenaQueryError) as error:
+			wait_for_athena_queries(
+				query_ids=[query_id],
+				region_env="AWS_DEFAULT_REGION",
+				initial_delay_seconds=0
+				)
+		
+		# Runs assertions
+		self.assertEqual(list(error.exception.failed), [query_id])
+
+
+# Mocked result columns of a query (ResultSetMetadata.ColumnInfo)
+MOCK_COLUMN_INFO = [
+	{"Name": "city", "Type": "varchar"},
+	{"Name": "passes", "Type": "bigint"},
+	{"Name": "temp", "Type": "double"},
+	{"Name": "cloud", "Type": "decimal"},
+	{"Name": "visible", "Type": "boolean"},
+	]
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	"os.environ",
+	{
+		"AWS_DEFAULT_REGION": f"{AWS_DEFAULT_REGION}",
+		"CATALOG": "testing_catalog",
+		"GLUE_DB": "testing_db",
+		"QUERY_RESULTS": "testing_query",
+		"S3_BUCKET": "testing",
+		},
+	)
+class TestReadAthenaQueryResult(unittest.TestCase):
+	# Tests the read_athena_query_result function
+	mock_athena = mock_athena()
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_athena.start()
+		self.mock_s3.start()
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+		self.mock_athena.stop()
+	
+	@staticmethod
+	def start_query(rows: list) -> str:
+		# Starts a query with the mocked result rows and returns the query id
+		athena_backends[DEFAULT_ACCOUNT_ID][AWS_DEFAULT_REGION].query_results_queue.append(
+			QueryResults(rows=rows, column_info=MOCK_COLUMN_INFO)
+			)
+		return start_athena_query(
+			catalog_env="CATALOG",
+			database_env="GLUE_DB",
+			query_results_env="QUERY_RESULTS",
+			query_str="SELECT * FROM db",
+			region_env="AWS_DEFAULT_REGION",
+			s3_bucket_env="S3_BUCKET",
+			)["QueryExecutionId"]
+	
+	def test_rows_are_decoded_by_column_type(self):
+		# Tests that the header row is skipped and values are decoded by column type
+		rows = [
+			{"Data": [{"VarCharValue": info["Name"]} for info in MOCK_COLUMN_INFO]},
+			{"Data": [
+				{"VarCharValue": "Perth"},
+				{"VarCharValue": "3"},
+				{"VarCharValue": "21.5"},
+				{"VarCharValue": "0.25"},
+				{"VarCharValue": "true"},
+				]},
+			{"Data": [{"VarCharValue": "Sydney"}, {}, {}, {}, {"VarCharValue": "false"}]},
+			]
+		query_id = self.start_query(rows)
+		
+		# Calls function to be tested
+		test_func = read_athena_query_result(
+			query_id=query_id, region_env="AWS_DEFAULT_REGION"
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			test_func.rows,
+			[
+				("Perth", 3, 21.5, Decimal("0.25"), True),
+				("Sydney", None, None, None, False),
+				]
+			)
+		self.assertEqual(test_func.to_columns()["passes"], [3, None])
+		self.assertEqual(test_func.scalar(), "Perth")
+	
+	def test_rows_are_read_from_s3_csv_result_object(self):
+		# Tests that rows are read from the csv object in the query result location
+		query_id = self.start_query([])
+		s3 = boto3.client("s3", region_name=AWS_DEFAULT_REGION)
+		s3.create_bucket(
+			Bucket="testing",
+			CreateBucketConfiguration={"LocationConstraint": AWS_DEFAULT_REGION}
+			)
+		s3.put_object(
+			Bucket="testing",
+			Key=f"testing_query/{query_id}.csv",
+			Body=(
+				'"city","passes","temp","cloud","visible"\n'
+				'"Perth","3","21.5","0.25","true"\n'
+				'"","","","","false"\n'
+				)
+			)
+		
+		# Calls function to be tested
+		test_func = read_athena_query_result(
+			query_id=query_id, region_env="AWS_DEFAULT_REGION", from_s3=True
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			test_func.rows,
+			[
+				("Perth", 3, 21.5, Decimal("0.25"), True),
+				("", None, None, None, False),
+				]
+			)
+	
+	def test_empty_result_has_no_scalar(self):
+		# Tests that a query without rows raises an error when a single value is read
+		query_id = self.start_query([])
+		
+		# Calls function to be tested
+		test_func = read_athena_query_result(
+			query_id=query_id, region_env="AWS_DEFAULT_REGION"
+			)
+		
+		# Runs assertions
+		self.assertEqual(test_func.rows, [])
+		with self.assertRaises(ValueError):
+			test_func.scalar()
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	"os.environ",
+	{
+		"AWS_DEFAULT_REGION": f"{AWS_DEFAULT_REGION}",
+		"ATHENA_CACHE_PREFIX": "athena_cache",
+		"CATALOG": "testing_catalog",
+		"GLUE_DB": "testing_db",
+		"QUERY_RESULTS": "testing_query",
+		"S3_BUCKET": "testing",
+		},
+	)
+class TestRunAthenaQueriesCache(unittest.TestCase):
+	# Tests the query result cache of the run_athena_queries function
+	mock_athena = mock_athena()
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_athena.start()
+		self.mock_s3.start()
+		self.s3 = boto3.client("s3", region_name=AWS_DEFAULT_REGION)
+		self.s3.create_bucket(
+			Bucket="testing",
+			CreateBucketConfiguration={"LocationConstraint": AWS_DEFAULT_REGION}
+			)
+		self.s3.put_object(
+			Bucket="testing", Key="passes_raw_compacted/day=23/part-0.parquet", Body="1"
+			)
+		self.athena_kwargs = {
+			"catalog_env": "CATALOG",
+			"database_env": "GLUE_DB",
+			"query_results_env": "QUERY_RESULTS",
+			"region_env": "AWS_DEFAULT_REGION",
+			"s3_bucket_env": "S3_BUCKET",
+			}
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+		self.mock_athena.stop()
+	
+	def run_queries(self, query_strs: list) -> list:
+		# Runs the queries with the first query cached on the mocked partition
+		return run_athena_queries(
+			query_strs=query_strs,
+			cache_prefixes=["passes_raw_compacted/day=23/", None],
+			**self.athena_kwargs
+			)
+	
+	def test_identical_query_of_unchanged_partition_is_reused(self):
+		# Tests that only the cached query reuses the results of the first run, even if
+		# its whitespace differs
+		first_run = self.run_queries(["SELECT 1 FROM passes;", "SELECT 2"])
+		
+		# Calls function to be tested
+		test_func = self.run_queries(["SELECT 1\n    FROM passes", "SELECT 2"])
+		
+		# Runs assertions
+		self.assertEqual(test_func[0].query_id, first_run[0].query_id)
+		self.assertTrue(test_func[0].cached)
+		self.assertNotEqual(test_func[1].query_id, first_run[1].query_id)
+		self.assertFalse(test_func[1].cached)
+	
+	def test_changed_partition_is_queried_again(self):
+		# Tests that the cache is missed once an object in the partition is replaced
+		first_run = self.run_queries(["SELECT 1 FROM passes", "SELECT 2"])
+		self.s3.put_object(
+			Bucket="testing", Key="passes_raw_compacted/day=23/part-0.parquet", Body="2"
+			)
+		
+		# Calls function to be tested
+		test_func = self.run_queries(["SELECT 1 FROM passes", "SELECT 2"])
+		
+		# Runs assertions
+		self.assertNotEqual(test_func[0].query_id, first_run[0].query_id)
+		self.assertFalse(test_func[0].cached)
+	
+	@mock.patch.dict("os.environ", {"ATHENA_RESULT_REUSE_MAX_AGE_MINUTES": "60"})
+	def test_cached_queries_do_not_reuse_athena_results(self):
+		# Tests that Athena result reuse, which ignores data changes, is only used for
+		# queries that are not in the snapshot cache
+		athena_client = get_boto3_client("athena", region_name=AWS_DEFAULT_REGION)
+		with mock.patch.object(
+			athena_client,
+			"start_query_execution",
+			wraps=athena_client.start_query_execution
+			) as start_query_execution:
+			# Calls function to be tested
+			self.run_queries(["SELECT 1 FROM passes", "SELECT 2"])
+		
+		# Runs assertions
+		cached_kwargs, uncached_kwargs = (
+			call.kwargs for call in start_query_execution.call_args_list
+			)
+		self.assertNotIn("ResultReuseConfiguration", cached_kwargs)
+		self.assertEqual(
+			uncached_kwargs["ResultReuseConfiguration"],
+			{"ResultReuseByAgeConfiguration": {"Enabled": True, "MaxAgeInMinutes": 60}}
+			)
+	
+	def test_cache_key_depends_on_query_and_snapshot(self):
+		# Tests that formatting does not change the cache key but the query and the
+		# snapshot do
+		self.assertEqual(
+			get_athena_query_cache_key("SELECT  1;", "a"),
+			get_athena_query_cache_key("SELECT 1", "a")
+			)
+		self.assertNotEqual(
+			get_athena_query_cache_key("SELECT 1", "a"),
+			get_athena_query_cache_key("SELECT 1", "b")
+			)
+		self.assertNotEqual(
+			get_athena_query_cache_key("SELECT 1", "a"),
+			get_athena_query_cache_key("SELECT 2", "a")
+			)
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	"os.environ",
+	{
+		"AWS_DEFAULT_REGION": f"{AWS_DEFAULT_REGION}",
+		"AWS_ACCESS_KEY_ID": "testing",
+		"AWS_SECRET_ACCESS_KEY": "testing",
+		"CATALOG": "testing_catalog",
+		"GLUE_DB": "testing_db",
+		"QUERY_RESULTS": "testing_query",
+		"S3_BUCKET": "testing",
+		},
+	)
+class TestStartAthenaQuery(unittest.TestCase):
+	# Tests the start_athena_query function
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		reset_boto3_clients()
+	
+	def test_execution_parameters_are_sent_as_a_list(self):
+		# Tests that execution parameters are sent in the shape that boto3 accepts
+		athena_client = get_boto3_client("athena", region_name=AWS_DEFAULT_REGION)
+		with Stubber(athena_client) as stubber:
+			stubber.add_response(
+				"start_query_execution",
+				{"QueryExecutionId": "561cc857-8cf6-4911-ac98-b75d314b8d28"},
+				{
+					"QueryString": "SELECT * FROM db WHERE day = ? AND year = ?",
+					"QueryExecutionContext": {
+						"Database": "testing_db",
+						"Catalog": "testing_catalog",
+						},
+					"ResultConfiguration": {
+						"OutputLocation": "s3://testing/testing_query/"
+						},
+					"ExecutionParameters": ["'23'", "'2023'"],
+					}
+				)
+			
+			# Calls function to be tested
+			test_func = start_athena_query(
+				catalog_env="CATALOG",
+				database_env="GLUE_DB",
+				query_results_env="QUERY_RESULTS",
+				query_str="SELECT * FROM db WHERE day = ? AND year = ?",
+				region_env="AWS_DEFAULT_REGION",
+				s3_bucket_env="S3_BUCKET",
+				parameters=["'23'", "'2023'"]
+				)
+			
+			# Runs assertions
+			stubber.assert_no_pending_responses()
+		self.assertEqual(
+			test_func["QueryExecutionId"], "561cc857-8cf6-4911-ac98-b75d314b8d28"
+			)
+
+
 if __name__ == '__main__':
 	unittest.main()
 	
\ No newline at end of file
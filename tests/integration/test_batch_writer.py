@@ -0,0 +1,128 @@
+import gzip
+import io
+import unittest
+from unittest import mock
+from moto import mock_s3
+import boto3
+try:
+	import pyarrow.parquet as pq
+except ImportError:
+	pq = None
+from app.lambdas.functions.batch_writer import put_raw_batch_in_s3
+from app.lambdas.functions.clients import reset_boto3_clients
+from app.lambdas.functions.parquet_writer import PASSES_COLUMNS
+from app.lambdas.functions.s3 import count_records_in_s3_manifests
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'S3_BUCKET': 'testing',
+		'PASSES_RAW_PREFIX': 'iss_passes_raw_json',
+		'MANIFEST_PREFIX': 'iss_passes_raw_json_manifests'
+		}
+	)
+class TestPutRawBatchInS3(unittest.TestCase):
+	# Tests the put_raw_batch_in_s3 and count_records_in_s3_manifests functions
+	mock_s3 = mock_s3()
+	city_rows = {
+		'AUS-Western Australia-Perth': [{'city': 'Perth', 'lat': '-31.9', 'startUTC': 1}],
+		'AUS-New South Wales-Sydney': [
+			{'city': 'Sydney', 'lat': '-33.8', 'startUTC': 2},
+			{'city': 'Sydney', 'lat': '-33.8', 'startUTC': 3}
+			]
+		}
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_s3.start()
+		s3 = boto3.client('s3', region_name='us-east-1')
+		s3.create_bucket(Bucket='testing')
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+	
+	def put_batch(self, city_rows, file_format='json'):
+		# Calls function to be tested
+		return put_raw_batch_in_s3(
+			city_rows=city_rows,
+			s3_bucket_env='S3_BUCKET',
+			raw_prefix_env='PASSES_RAW_PREFIX',
+			manifest_prefix_env='MANIFEST_PREFIX',
+			api_call_name='iss-passes',
+			compression='gzip',
+			file_format=file_format,
+			columns=PASSES_COLUMNS
+			)
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that all cities are put in one gzip compressed object
+		test_func = self.put_batch(self.city_rows)
+		
+		# Gets the batch object
+		s3 = boto3.client('s3', region_name='us-east-1')
+		content_object = s3.get_object(Bucket='testing', Key=test_func)
+		body = gzip.decompress(content_object['Body'].read()).decode('utf-8')
+		
+		# Runs assertions
+		self.assertTrue(test_func.startswith('iss_passes_raw_json/year='))
+		self.assertTrue(test_func.endswith('-utc.json.gz'))
+		self.assertEqual(
+			body.splitlines()[0], '{"city":"Sydney","lat":"-33.8","startUTC":2}'
+			)
+		self.assertEqual(len(body.splitlines()), 3)
+		self.assertEqual(
+			count_records_in_s3_manifests(
+				s3_bucket_env='S3_BUCKET', manifest_prefix_env='MANIFEST_PREFIX'
+				),
+			2
+			)
+	
+	def test_retried_batch_is_idempotent(self):
+		# Tests that a retried batch overwrites its object and manifest
+		first_key = self.put_batch(self.city_rows)
+		second_key = self.put_batch(dict(reversed(self.city_rows.items())))
+		self.put_batch({'AUS-Victoria-Melbourne': [{'city': 'Melbourne'}]})
+		
+		# Lists the batch objects
+		s3 = boto3.client('s3', region_name='us-east-1')
+		objects = s3.list_objects_v2(Bucket='testing', Prefix='iss_passes_raw_json/')
+		
+		# Runs assertions
+		self.assertEqual(first_key, second_key)
+		self.assertEqual(objects['KeyCount'], 2)
+		self.assertEqual(
+			count_records_in_s3_manifests(
+				s3_bucket_env='S3_BUCKET', manifest_prefix_env='MANIFEST_PREFIX'
+				),
+			3
+			)
+
+	
+	@unittest.skipUnless(pq is not None, 'pyarrow is required to write Parquet')
+	def test_parquet_is_put_in_compacted_prefix(self):
+		# Tests that Parquet batch objects are typed and put in the compacted prefix
+		test_func = self.put_batch(self.city_rows, file_format='parquet')
+		
+		# Reads the Parquet batch object
+		s3 = boto3.client('s3', region_name='us-east-1')
+		content_object = s3.get_object(Bucket='testing', Key=test_func)
+		table = pq.read_table(io.BytesIO(content_object['Body'].read()))
+		
+		# Runs assertions
+		self.assertTrue(test_func.startswith('iss_passes_raw_json_compacted/year='))
+		self.assertTrue(test_func.endswith('-utc.parquet'))
+		self.assertEqual(table.column_names, [name for name, _ in PASSES_COLUMNS])
+		self.assertEqual(table.column('lat').to_pylist(), [-33.8, -33.8, -31.9])
+		self.assertEqual(str(table.schema.field('startUTC').type), 'int32')
+		self.assertEqual(
+			count_records_in_s3_manifests(
+				s3_bucket_env='S3_BUCKET', manifest_prefix_env='MANIFEST_PREFIX'
+				),
+			2
+			)
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
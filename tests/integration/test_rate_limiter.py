@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+from moto import mock_dynamodb
+import boto3
+from app.lambdas.functions.clients import get_boto3_client, reset_boto3_clients
+from app.lambdas.functions.rate_limiter import (
+	DynamoDBRateLimitBackend,
+	RateLimitExceeded,
+	TokenBucket,
+	)
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'AWS_DEFAULT_REGION': 'us-east-1',
+		'RATE_LIMIT_TABLE': 'rate_limits'
+		}
+	)
+class TestDynamoDBRateLimitBackend(unittest.TestCase):
+	# Tests the DynamoDBRateLimitBackend class
+	mock_dynamodb = mock_dynamodb()
+
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_dynamodb.start()
+		dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+		dynamodb.create_table(
+			TableName='rate_limits',
+			AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}],
+			KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}],
+			BillingMode='PAY_PER_REQUEST'
+			)
+
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_dynamodb.stop()
+
+	def create_bucket(self, backend=None):
+		# Creates a token bucket stored in DynamoDB with a fixed clock
+		return TokenBucket(
+			name='n2yo',
+			capacity=10,
+			period_seconds=3600,
+			backend=backend or DynamoDBRateLimitBackend(table_env='RATE_LIMIT_TABLE'),
+			clock=lambda: 1000.0
+			)
+
+	def get_stored_tokens(self) -> float:
+		# Gets the number of tokens stored in DynamoDB
+		dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+		item = dynamodb.get_item(
+			TableName='rate_limits', Key={'name': {'S': 'n2yo'}}
+			)['Item']
+		return float(item['tokens']['N'])
+
+	def test_state_is_shared_through_dynamodb(self):
+		# Tests that buckets in different workers share the state stored in DynamoDB
+		self.create_bucket().acquire()
+		self.create_bucket().observe_usage(4)
+		self.create_bucket().acquire()
+
+		# Runs assertions
+		self.assertEqual(self.get_stored_tokens(), 5.0)
+
+	def test_conflicting_update_is_retried_with_new_state(self):
+		# Tests that a worker whose cached state is out of date does not overwrite the
+		# tokens taken by another worker
+		first = self.create_bucket()
+		second = self.create_bucket()
+		first.acquire()
+		second.acquire()
+
+		# Calls function to be tested
+		with mock.patch('app.lambdas.functions.rate_limiter.time.sleep'):
+			first.acquire()
+
+		# Runs assertions
+		self.assertEqual(self.get_stored_tokens(), 7.0)
+
+	def test_unchanged_state_is_not_written(self):
+		# Tests that usage that does not remove any tokens is not written, so warm
+		# updates only make one request when the state changes
+		bucket = self.create_bucket()
+		bucket.acquire()
+		dynamodb_client = get_boto3_client('dynamodb')
+		with mock.patch.object(
+				dynamodb_client, 'put_item', wraps=dynamodb_client.put_item
+				) as put_item, mock.patch.object(
+				dynamodb_client, 'get_item', wraps=dynamodb_client.get_item
+				) as get_item:
+			# Calls function to be tested
+			bucket.observe_usage(1)
+			bucket.acquire()
+
+		# Runs assertions
+		self.assertEqual(put_item.call_count, 1)
+		self.assertEqual(get_item.call_count, 0)
+		self.assertEqual(self.get_stored_tokens(), 8.0)
+
+	def test_too_many_conflicts_raise_rate_limit_exceeded(self):
+		# Tests that the record is failed if the bucket cannot be updated
+		backend = DynamoDBRateLimitBackend(table_env='RATE_LIMIT_TABLE', max_attempts=2)
+		error = {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': ''}}
+		dynamodb_client = get_boto3_client('dynamodb')
+		with mock.patch.object(
+				dynamodb_client,
+				'put_item',
+				side_effect=dynamodb_client.exceptions.ConditionalCheckFailedException(
+					error, 'PutItem'
+					)
+				), mock.patch('app.lambdas.functions.rate_limiter.time.sleep'):
+			# Runs assertions
+			with self.assertRaises(RateLimitExceeded):
+				self.create_bucket(backend).acquire()
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
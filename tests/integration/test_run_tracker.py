@@ -0,0 +1,376 @@
+import json
+import unittest
+from datetime import date
+from unittest import mock
+from moto import (mock_dynamodb)
+import boto3
+from app.lambdas.functions.clients import get_boto3_client, reset_boto3_clients
+from app.lambdas.functions.run_tracker import (
+	get_city_statuses,
+	get_processed_city_count,
+	get_run_id,
+	get_run_status,
+	record_city_statuses,
+	record_sqs_event_progress,
+	start_run
+	)
+
+# Sets default region
+AWS_DEFAULT_REGION = 'ap-southeast-2'
+
+# Mocked city in an SQS message body
+CITY = {
+	'city': 'Perth', 'region': 'Western Australia', 'country': 'Australia',
+	'country_code': 'AUS', 'latitude': '-31.9522', 'longitude': '115.8589'
+	}
+
+
+def create_sqs_record(message_id: str, cities: int, receive_count: int = 1) -> dict:
+	# Creates an SQS record containing a packed message of cities
+	return {
+		'messageId': message_id,
+		'body': json.dumps({
+			'version': 2,
+			'cities': [CITY | {'city': f'{message_id}-{i}'} for i in range(cities)]
+			}),
+		'attributes': {'ApproximateReceiveCount': str(receive_count)}
+		}
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'AWS_DEFAULT_REGION': f'{AWS_DEFAULT_REGION}',
+		'RUN_TRACKER_TABLE': 'runs',
+		'RUN_TRACKER_PIPELINE': 'passes',
+		'SQS_MAX_RECEIVE_COUNT': '3'
+		}
+	)
+class TestRunTracker(unittest.TestCase):
+	# Tests the run tracker functions
+	mock_dynamodb = mock_dynamodb()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_dynamodb.start()
+		dynamodb = boto3.client('dynamodb', region_name=AWS_DEFAULT_REGION)
+		dynamodb.create_table(
+			TableName='runs',
+			AttributeDefinitions=[
+				{'AttributeName': 'run_id', 'AttributeType': 'S'},
+				{'AttributeName': 'item', 'AttributeType': 'S'}
+				],
+			KeySchema=[
+				{'AttributeName': 'run_id', 'KeyType': 'HASH'},
+				{'AttributeName': 'item', 'KeyType': 'RANGE'}
+				],
+			BillingMode='PAY_PER_REQUEST'
+			)
+		self.run_id = get_run_id('passes')
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_dynamodb.stop()
+	
+	def record_cities(self, city_keys: list, status: str) -> None:
+		# Puts the status of cities of the run in the run ledger
+		record_city_statuses(
+			table_env='RUN_TRACKER_TABLE',
+			run_id=self.run_id,
+			city_keys=city_keys,
+			status=status
+			)
+	
+	def test_run_id_contains_pipeline_and_date(self):
+		# Tests that the run id is unique per pipeline and day
+		self.assertEqual(get_run_id('weather', date(2023, 5, 23)), 'weather/2023-05-23')
+	
+	def test_run_completes_when_processed_plus_failed_equals_expected(self):
+		# Tests that the run is only complete once every city is processed or failed
+		# Calls functions to be tested
+		started = start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=5)
+		self.record_cities(['a', 'b', 'c'], 'processed')
+		partial = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		self.record_cities(['d'], 'processed')
+		self.record_cities(['e'], 'failed')
+		complete = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		
+		# Runs assertions
+		self.assertFalse(started['complete'])
+		self.assertEqual((partial['processed'], partial['failed']), (3, 0))
+		self.assertFalse(partial['complete'])
+		self.assertEqual((complete['processed'], complete['failed']), (4, 1))
+		self.assertTrue(complete['complete'])
+		self.assertFalse(complete['timed_out'])
+	
+	def test_failed_city_that_is_processed_moves_between_counts(self):
+		# Tests that a failed city that is processed later is no longer counted as failed
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=5)
+		self.record_cities(['a', 'b'], 'failed')
+		
+		# Calls function to be tested
+		self.record_cities(['a'], 'processed')
+		self.record_cities(['a'], 'failed')
+		result = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		
+		# Runs assertions
+		self.assertEqual((result['processed'], result['failed']), (1, 1))
+	
+	def test_processed_city_count_is_read_with_a_single_request(self):
+		# Tests that the already-run check does not read the city items
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=200)
+		self.record_cities([f'AUS-WA-{i}' for i in range(150)], 'processed')
+		dynamodb_client = get_boto3_client('dynamodb')
+		with mock.patch.object(
+				dynamodb_client, 'get_item', wraps=dynamodb_client.get_item
+				) as get_item, mock.patch.object(
+				dynamodb_client, 'query', wraps=dynamodb_client.query
+				) as query:
+			# Calls function to be tested
+			result = get_processed_city_count(
+				table_env='RUN_TRACKER_TABLE', run_id=self.run_id
+				)
+		
+		# Runs assertions
+		self.assertEqual(result, 150)
+		self.assertEqual(get_item.call_count, 1)
+		query.assert_not_called()
+	
+	def test_run_status_is_read_with_a_single_request(self):
+		# Tests that polling the run status does not read the city items, so each poll
+		# of the step functions costs the same however many cities the run has
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=200)
+		self.record_cities([f'AUS-WA-{i}' for i in range(150)], 'processed')
+		dynamodb_client = get_boto3_client('dynamodb')
+		with mock.patch.object(
+				dynamodb_client, 'get_item', wraps=dynamodb_client.get_item
+				) as get_item, mock.patch.object(
+				dynamodb_client, 'query', wraps=dynamodb_client.query
+				) as query:
+			# Calls functions to be tested
+			result = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+			processed = get_processed_city_count(
+				table_env='RUN_TRACKER_TABLE', run_id=self.run_id
+				)
+		
+		# Runs assertions
+		self.assertEqual((result['processed'], processed), (150, 150))
+		self.assertEqual(get_item.call_count, 2)
+		query.assert_not_called()
+	
+	def test_cancelled_transaction_is_retried_with_new_state(self):
+		# Tests that cities recorded by a concurrent worker are not counted twice
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=5)
+		dynamodb_client = get_boto3_client('dynamodb')
+		transact_write_items = dynamodb_client.transact_write_items
+		error = {'Error': {'Code': 'TransactionCanceledException', 'Message': ''}}
+		
+		def concurrent_transact_write_items(**kwargs):
+			# Writes the first transaction (as another worker) and then cancels it
+			response = transact_write_items(**kwargs)
+			if mock_transact_write_items.call_count == 1:
+				raise dynamodb_client.exceptions.TransactionCanceledException(
+					error, 'TransactWriteItems'
+					)
+			return response
+		
+		with mock.patch.object(
+				dynamodb_client,
+				'transact_write_items',
+				side_effect=concurrent_transact_write_items
+				) as mock_transact_write_items, mock.patch(
+				'app.lambdas.functions.run_tracker.time.sleep'
+				):
+			# Calls function to be tested
+			changed = record_city_statuses(
+				table_env='RUN_TRACKER_TABLE', run_id=self.run_id,
+				city_keys=['a', 'b', 'c'], status='processed'
+				)
+		result = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		
+		# Runs assertions
+		self.assertEqual(changed, 0)
+		self.assertEqual(mock_transact_write_items.call_count, 1)
+		self.assertEqual(result['processed'], 3)
+	
+	def test_restarting_run_keeps_processed_and_resets_failed(self):
+		# Tests that re-running the pipeline on the same day only waits for the missing
+		# and failed cities
+		with mock.patch(
+				'app.lambdas.functions.run_tracker.time.time', return_value=1684800000
+				):
+			start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=5)
+			self.record_cities(['a', 'b', 'c'], 'processed')
+			self.record_cities(['d', 'e'], 'failed')
+		
+		# Calls function to be tested
+		started = start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=5)
+		result = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		
+		# Runs assertions
+		self.assertEqual(started['processed'], 3)
+		self.assertEqual((result['processed'], result['failed']), (3, 0))
+		self.assertFalse(result['complete'])
+	
+	def test_processed_city_count_is_none_until_run_starts(self):
+		# Tests that the already-run check can tell an untracked run from an empty run
+		self.assertIsNone(
+			get_processed_city_count(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+			)
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=5)
+		self.record_cities(['a', 'b'], 'processed')
+		
+		# Calls function to be tested
+		result = get_processed_city_count(
+			table_env='RUN_TRACKER_TABLE', run_id=self.run_id
+			)
+		
+		# Runs assertions
+		self.assertEqual(result, 2)
+	
+	def test_city_statuses_are_put_in_batches(self):
+		# Tests that more than one BatchWriteItem request of city statuses is put and
+		# that a later status of a city replaces the earlier one
+		city_keys = [f'AUS-WA-{i}' for i in range(60)]
+		
+		# Calls functions to be tested
+		put = record_city_statuses(
+			table_env='RUN_TRACKER_TABLE', run_id=self.run_id,
+			city_keys=city_keys + city_keys[:5], status='failed'
+			)
+		record_city_statuses(
+			table_env='RUN_TRACKER_TABLE', run_id=self.run_id,
+			city_keys=city_keys[:50], status='processed'
+			)
+		result = get_city_statuses(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		
+		# Runs assertions
+		self.assertEqual(put, 60)
+		self.assertEqual(len(result), 60)
+		self.assertEqual(list(result.values()).count('processed'), 50)
+		self.assertEqual(result['AUS-WA-59'], 'failed')
+	
+	def test_invalid_city_status_raises_value_error(self):
+		# Tests that only known city statuses are put
+		with self.assertRaises(ValueError):
+			record_city_statuses(
+				table_env='RUN_TRACKER_TABLE', run_id=self.run_id,
+				city_keys=['AUS-WA-Perth'], status='missing'
+				)
+	
+	def test_incomplete_run_times_out(self):
+		# Tests that a run that has stopped making progress times out
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=5)
+		
+		# Calls function to be tested
+		result = get_run_status(
+			table_env='RUN_TRACKER_TABLE', run_id=self.run_id, timeout_seconds=-1
+			)
+		
+		# Runs assertions
+		self.assertTrue(result['timed_out'])
+	
+	def test_missing_run_raises_value_error(self):
+		# Tests that the status of a run that was not started raises an error
+		with self.assertRaises(ValueError):
+			get_run_status(table_env='RUN_TRACKER_TABLE', run_id='passes/2000-01-01')
+	
+	def test_sqs_event_progress_counts_failed_cities_on_last_receive(self):
+		# Tests that failed cities are only counted once SQS will not retry them
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=10)
+		records = [
+			create_sqs_record('processed', cities=4),
+			create_sqs_record('retried', cities=3, receive_count=1),
+			create_sqs_record('dead_lettered', cities=2, receive_count=3),
+			{'messageId': 'invalid', 'body': 'not json',
+			 'attributes': {'ApproximateReceiveCount': '3'}}
+			]
+		failed_records = [
+			record for record in records if record['messageId'] != 'processed'
+			]
+		
+		# Calls function to be tested
+		progress = record_sqs_event_progress(
+			records=records, failed_records=failed_records
+			)
+		result = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		city_statuses = get_city_statuses(
+			table_env='RUN_TRACKER_TABLE', run_id=self.run_id
+			)
+		
+		# Runs assertions
+		self.assertEqual(progress, {'processed': 4, 'failed': 3})
+		self.assertEqual((result['processed'], result['failed']), (4, 3))
+		self.assertFalse(result['complete'])
+		self.assertEqual(
+			city_statuses, {
+				'AUS-Western Australia-processed-0': 'processed',
+				'AUS-Western Australia-processed-1': 'processed',
+				'AUS-Western Australia-processed-2': 'processed',
+				'AUS-Western Australia-processed-3': 'processed',
+				'AUS-Western Australia-dead_lettered-0': 'failed',
+				'AUS-Western Australia-dead_lettered-1': 'failed',
+				'message-invalid': 'failed'
+				}
+			)
+	
+	def test_redelivered_sqs_event_is_not_counted_twice(self):
+		# Tests that recording the same SQS messages again (e.g. after a redelivery)
+		# does not change the counts of the run
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=10)
+		records = [
+			create_sqs_record('processed', cities=4),
+			create_sqs_record('dead_lettered', cities=2, receive_count=3)
+			]
+		failed_records = records[1:]
+		record_sqs_event_progress(records=records, failed_records=failed_records)
+		
+		# Calls function to be tested
+		record_sqs_event_progress(records=records, failed_records=failed_records)
+		record_sqs_event_progress(records=records[:1], failed_records=[])
+		result = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		
+		# Runs assertions
+		self.assertEqual((result['processed'], result['failed']), (4, 2))
+	
+	def test_sqs_event_progress_is_recorded_in_run_of_city_run_date(self):
+		# Tests that cities of a backfilled date do not count towards today's run
+		backfill_run_id = get_run_id('passes', date(2023, 5, 23))
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=self.run_id, expected=1)
+		start_run(table_env='RUN_TRACKER_TABLE', run_id=backfill_run_id, expected=2)
+		record = create_sqs_record('backfill', cities=2)
+		record['body'] = json.dumps({
+			'version': 2,
+			'cities': [
+				CITY | {'city': f'backfill-{i}', 'run_date': '2023-05-23'}
+				for i in range(2)
+				]
+			})
+		
+		# Calls function to be tested
+		record_sqs_event_progress(
+			records=[record, create_sqs_record('today', cities=1)], failed_records=[]
+			)
+		today = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=self.run_id)
+		backfill = get_run_status(table_env='RUN_TRACKER_TABLE', run_id=backfill_run_id)
+		
+		# Runs assertions
+		self.assertEqual(today['processed'], 1)
+		self.assertEqual(backfill['processed'], 2)
+		self.assertTrue(backfill['complete'])
+	
+	def test_sqs_event_progress_is_skipped_without_table(self):
+		# Tests that the API Lambda functions work without the run tracker
+		with mock.patch.dict('os.environ', {'RUN_TRACKER_TABLE': ''}):
+			# Calls function to be tested
+			result = record_sqs_event_progress(
+				records=[create_sqs_record('processed', cities=1)], failed_records=[]
+				)
+		
+		# Runs assertions
+		self.assertIsNone(result)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -3,13 +3,22 @@ import unittest
 from unittest import mock
 from moto import mock_s3
 import boto3
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
 import csv
 import os
+from datetime import date
+from app.lambdas.functions.clients import reset_boto3_clients
 from app.lambdas.functions.s3 import (
 	get_list_from_s3_csv_object,
+	iter_city_records_from_s3_csv_object,
+	iter_city_records_from_s3_csv_shard,
+	plan_s3_csv_object_shards,
 	get_sql_query_string_from_s3_sql_object,
 	put_object_in_s3_bucket,
 	count_objects_in_s3_prefix,
+	delete_objects_in_s3_prefix,
+	get_s3_prefix_snapshot,
 	)
 
 
@@ -28,6 +37,7 @@ class TestGetListFromS3CsvObject(unittest.TestCase):
 	
 	def setUp(self):
 		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
 		bucket_name = 'testing'
 		self.mock_s3.start()
 		s3 = boto3.client('s3', region_name='us-east-1')
@@ -103,6 +113,200 @@ class TestGetListFromS3CsvObject(unittest.TestCase):
 				)
 
 
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'LAMBDA_INPUT_DATA_NAME': 'testing.csv',
+		'S3_PREFIX': 'testing',
+		'S3_BUCKET': 'testing'
+		}
+	)
+class TestIterCityRecordsFromS3CsvObject(unittest.TestCase):
+	# Tests the iter_city_records_from_s3_csv_object function
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_s3.start()
+		self.s3 = boto3.client('s3', region_name='us-east-1')
+		self.s3.create_bucket(Bucket='testing')
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+	
+	def put_csv(self, content: bytes):
+		# Mocks object to be returned in tested function
+		self.s3.put_object(Bucket='testing', Key='testing/testing.csv', Body=content)
+	
+	def iter_city_records(self):
+		# Calls function to be tested
+		return iter_city_records_from_s3_csv_object(
+			input_data='LAMBDA_INPUT_DATA_NAME',
+			prefix='S3_PREFIX',
+			s3_bucket='S3_BUCKET'
+			)
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that the BOM is removed and columns are mapped from the header row
+		self.put_csv(
+			'\ufeffcountry,country_code,city,region,latitude,longitude\r\n'
+			'Australia,AUS,Perth,Western Australia,-31.9522,115.8589\r\n'
+			'\r\n'
+			'Côte d\'Ivoire,CIV,"Abidjan, Plateau",Abidjan,5.3252,-4.0197\r\n'.encode('utf-8')
+			)
+		
+		# Calls function to be tested
+		test_func = list(self.iter_city_records())
+		
+		# Runs assertions
+		self.assertEqual(
+			test_func, [
+				{
+					'city': 'Perth', 'region': 'Western Australia', 'latitude': '-31.9522',
+					'longitude': '115.8589', 'country': 'Australia', 'country_code': 'AUS'
+					},
+				{
+					'city': 'Abidjan, Plateau', 'region': 'Abidjan', 'latitude': '5.3252',
+					'longitude': '-4.0197', 'country': 'Côte d\'Ivoire', 'country_code': 'CIV'
+					}
+				]
+			)
+	
+	def test_error_for_missing_column(self):
+		# Tests that an error is raised before any city is read
+		self.put_csv(b'city,region,latitude,longitude,country\nPerth,WA,-31.9,115.8,AU\n')
+		
+		# Runs assertions
+		with self.assertRaises(ValueError):
+			self.iter_city_records()
+	
+	def test_body_is_read_incrementally(self):
+		# Tests that the cities are read one at a time from the response body
+		row = 'Perth,Western Australia,-31.9522,115.8589,Australia,AUS\n'
+		content = ('city,region,latitude,longitude,country,country_code\n' + row * 5000)
+		self.put_csv(content.encode('utf-8'))
+		
+		with mock.patch.object(
+			StreamingBody, 'read', autospec=True, side_effect=StreamingBody.read
+			) as mock_read:
+			# Calls function to be tested
+			city_records = self.iter_city_records()
+			first_city = next(city_records)
+			first_city_reads = mock_read.call_count
+			city_count = 1 + sum(1 for _ in city_records)
+		
+		# Runs assertions
+		self.assertEqual(first_city['city'], 'Perth')
+		self.assertEqual(city_count, 5000)
+		self.assertLess(first_city_reads, mock_read.call_count)
+		for read_call in mock_read.call_args_list:
+			read_size = read_call.args[1]
+			self.assertIsNotNone(read_size)
+			self.assertLess(read_size, len(content))
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'LAMBDA_INPUT_DATA_NAME': 'testing.csv',
+		'S3_PREFIX': 'testing',
+		'S3_BUCKET': 'testing'
+		}
+	)
+class TestPlanS3CsvObjectShards(unittest.TestCase):
+	# Tests the plan_s3_csv_object_shards function
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_s3.start()
+		self.s3 = boto3.client('s3', region_name='us-east-1')
+		self.s3.create_bucket(Bucket='testing')
+		
+		# Mocks object to be returned in tested function
+		rows = [
+			f'City {num},Region,-31.{num},115.{num},Australia,AUS\r\n'
+			for num in range(23)
+			]
+		rows.insert(7, '\r\n')
+		self.content = (
+			'\ufeffcity,region,latitude,longitude,country,country_code\r\n' + ''.join(rows)
+			).encode('utf-8')
+		self.s3.put_object(Bucket='testing', Key='testing/testing.csv', Body=self.content)
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+	
+	def plan_shards(self, shards):
+		# Calls function to be tested. A small chunk size splits lines across chunks.
+		return plan_s3_csv_object_shards(
+			input_data='LAMBDA_INPUT_DATA_NAME',
+			prefix='S3_PREFIX',
+			s3_bucket='S3_BUCKET',
+			shards=shards,
+			chunk_size=16
+			)
+	
+	def read_shard(self, plan, shard):
+		# Reads the cities of a shard
+		return list(
+			iter_city_records_from_s3_csv_shard(
+				input_data='LAMBDA_INPUT_DATA_NAME',
+				prefix='S3_PREFIX',
+				s3_bucket='S3_BUCKET',
+				shard=shard,
+				header=plan['header'],
+				etag=plan['etag']
+				)
+			)
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that the shards cover every city exactly once
+		test_func = self.plan_shards(shards=4)
+		all_cities = list(
+			iter_city_records_from_s3_csv_object(
+				input_data='LAMBDA_INPUT_DATA_NAME',
+				prefix='S3_PREFIX',
+				s3_bucket='S3_BUCKET'
+				)
+			)
+		shard_cities = [self.read_shard(test_func, shard) for shard in test_func['shards']]
+		
+		# Runs assertions
+		self.assertEqual(test_func['rows'], 23)
+		self.assertEqual(len(test_func['shards']), 4)
+		self.assertEqual(test_func['shards'][-1]['end'], len(self.content))
+		self.assertEqual(
+			[shard['rows'] for shard in test_func['shards']],
+			[len(cities) for cities in shard_cities]
+			)
+		self.assertEqual([city for cities in shard_cities for city in cities], all_cities)
+		for shard, next_shard in zip(test_func['shards'], test_func['shards'][1:]):
+			self.assertEqual(shard['end'], next_shard['start'])
+			self.assertEqual(self.content[shard['end'] - 1:shard['end']], b'\n')
+	
+	def test_empty_shards_are_left_out(self):
+		# Tests that there are no more shards than rows
+		test_func = self.plan_shards(shards=100)
+		
+		# Runs assertions
+		self.assertEqual(len(test_func['shards']), 23)
+		self.assertTrue(all(shard['rows'] == 1 for shard in test_func['shards']))
+	
+	def test_error_for_changed_object(self):
+		# Tests that a shard cannot be read if the object changed after planning
+		test_func = self.plan_shards(shards=2)
+		self.s3.put_object(Bucket='testing', Key='testing/testing.csv', Body=b'changed')
+		
+		# Runs assertions
+		with self.assertRaises(ClientError):
+			self.read_shard(test_func, test_func['shards'][0])
+
+
 # Patches Lambda environment variables into the tess class
 @mock.patch.dict(
 	'os.environ', {
@@ -116,6 +320,7 @@ class TestGetSqlQueryStringFromS3Object(unittest.TestCase):
 	
 	def setUp(self):
 		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
 		bucket_name = 'testing'
 		self.mock_s3.start()
 		s3 = boto3.client('s3', region_name='us-east-1')
@@ -198,6 +403,7 @@ class TestPutObjectInS3Bucket(unittest.TestCase):
 
 	def setUp(self):
 		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
 		bucket_name = 'testing'
 		self.mock_s3.start()
 		s3 = boto3.client('s3', region_name='us-east-1')
@@ -252,6 +458,149 @@ class TestPutObjectInS3Bucket(unittest.TestCase):
 		f" {actual_date_format}")
 
 
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'S3_BUCKET': 'testing',
+		'BASE_PREFIX': 'raw'
+		}
+	)
+class TestCountObjectsInS3Prefix(unittest.TestCase):
+	# Tests the count_objects_in_s3_prefix function
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_s3.start()
+		self.s3 = boto3.client('s3', region_name='us-east-1')
+		self.s3.create_bucket(Bucket='testing')
+		self.prefix = date.today().strftime('raw/year=%Y/month=%m/day=%d')
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+	
+	def test_objects_are_counted_across_pages(self):
+		# Tests that every page of a prefix with more than 1000 objects is counted
+		for i in range(1001):
+			self.s3.put_object(Bucket='testing', Key=f'{self.prefix}/{i}.json', Body=b'')
+		# Objects in other days and sub-prefixes are not counted
+		self.s3.put_object(Bucket='testing', Key=f'{self.prefix}/sub/0.json', Body=b'')
+		self.s3.put_object(Bucket='testing', Key='raw/year=2000/0.json', Body=b'')
+		
+		# Calls function to be tested
+		result = count_objects_in_s3_prefix(
+			s3_bucket_env='S3_BUCKET', base_prefix_env='BASE_PREFIX'
+			)
+		
+		# Runs assertions
+		self.assertEqual(result, 1001)
+	
+	def test_empty_prefix_returns_zero(self):
+		# Tests that a prefix without objects is counted as 0
+		result = count_objects_in_s3_prefix(
+			s3_bucket_env='S3_BUCKET', base_prefix_env='BASE_PREFIX'
+			)
+		
+		# Runs assertions
+		self.assertEqual(result, 0)
+	
+	def test_objects_of_run_date_are_counted(self):
+		# Tests that a backfilled run date is counted instead of today
+		self.s3.put_object(
+			Bucket='testing', Key='raw/year=2023/month=05/day=23/0.json', Body=b''
+			)
+		
+		# Calls function to be tested
+		result = count_objects_in_s3_prefix(
+			s3_bucket_env='S3_BUCKET', base_prefix_env='BASE_PREFIX',
+			run_date=date(2023, 5, 23)
+			)
+		
+		# Runs assertions
+		self.assertEqual(result, 1)
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict('os.environ', {'S3_BUCKET': 'testing'})
+class TestDeleteObjectsInS3Prefix(unittest.TestCase):
+	# Tests the delete_objects_in_s3_prefix function
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_s3.start()
+		self.s3 = boto3.client('s3', region_name='us-east-1')
+		self.s3.create_bucket(Bucket='testing')
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+	
+	def test_only_objects_in_prefix_are_deleted(self):
+		# Tests that more than one DeleteObjects request is made and that other dates
+		# are kept
+		prefix = 'query-results/year=2023/month=05/day=23/'
+		for i in range(1001):
+			self.s3.put_object(Bucket='testing', Key=f'{prefix}{i}.parquet', Body=b'')
+		self.s3.put_object(
+			Bucket='testing', Key='query-results/year=2023/month=05/day=24/0.parquet',
+			Body=b''
+			)
+		
+		# Calls function to be tested
+		result = delete_objects_in_s3_prefix(s3_bucket_env='S3_BUCKET', prefix=prefix)
+		remaining = self.s3.list_objects_v2(Bucket='testing')['Contents']
+		
+		# Runs assertions
+		self.assertEqual(result, 1001)
+		self.assertEqual(
+			[content['Key'] for content in remaining],
+			['query-results/year=2023/month=05/day=24/0.parquet']
+			)
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict('os.environ', {'S3_BUCKET': 'testing'})
+class TestGetS3PrefixSnapshot(unittest.TestCase):
+	# Tests the get_s3_prefix_snapshot function
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_s3.start()
+		self.s3 = boto3.client('s3', region_name='us-east-1')
+		self.s3.create_bucket(Bucket='testing')
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+	
+	def test_snapshot_changes_only_when_prefix_objects_change(self):
+		# Tests that objects in other prefixes do not change the snapshot
+		prefix = 'passes_raw_compacted/year=2023/month=05/day=23/'
+		self.s3.put_object(Bucket='testing', Key=f'{prefix}0.parquet', Body=b'a')
+		
+		# Calls function to be tested
+		first = get_s3_prefix_snapshot(s3_bucket_env='S3_BUCKET', prefix=prefix)
+		self.s3.put_object(
+			Bucket='testing',
+			Key='passes_raw_compacted/year=2023/month=05/day=24/0.parquet',
+			Body=b'b'
+			)
+		unchanged = get_s3_prefix_snapshot(s3_bucket_env='S3_BUCKET', prefix=prefix)
+		self.s3.put_object(Bucket='testing', Key=f'{prefix}0.parquet', Body=b'c')
+		changed = get_s3_prefix_snapshot(s3_bucket_env='S3_BUCKET', prefix=prefix)
+		
+		# Runs assertions
+		self.assertEqual(first, unchanged)
+		self.assertNotEqual(first, changed)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
 	
\ No newline at end of file
@@ -3,7 +3,10 @@ import unittest
 from unittest import mock
 from moto import (mock_secretsmanager)
 import boto3
+from app.lambdas.functions.clients import reset_boto3_clients
 from app.lambdas.functions.secrets_manager import (
+	call_with_secret_refresh,
+	clear_secret_cache,
 	get_secret_from_secrets_manager
 	)
 
@@ -22,6 +25,8 @@ class TestGetSecretFromSecretsManager(unittest.TestCase):
 	
 	def setUp(self):
 		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		clear_secret_cache()
 		self.mock_secretsmanager.start()
 	
 	def tearDown(self):
@@ -54,5 +59,113 @@ class TestGetSecretFromSecretsManager(unittest.TestCase):
 		self.assertEqual(test_func, secret_value)
 
 
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'AWS_DEFAULT_REGION': f'{AWS_DEFAULT_REGION}',
+		'SECRET_CACHE_TTL_SECONDS': '300'
+		}
+	)
+class TestSecretCache(unittest.TestCase):
+	# Tests the module scope secret cache
+	mock_secretsmanager = mock_secretsmanager()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		clear_secret_cache()
+		self.mock_secretsmanager.start()
+		self.secrets_client = boto3.client('secretsmanager', region_name=AWS_DEFAULT_REGION)
+		self.secrets_client.create_secret(
+			Name='TEST_SECRET',
+			SecretString=json.dumps({'test_key': 'old_secret'})
+			)
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_secretsmanager.stop()
+	
+	def rotate_secret(self):
+		# Mocks rotation of the secret
+		self.secrets_client.put_secret_value(
+			SecretId='TEST_SECRET',
+			SecretString=json.dumps({'test_key': 'new_secret'})
+			)
+	
+	def get_secret(self, **kwargs):
+		# Calls function to be tested
+		return get_secret_from_secrets_manager(
+			region_env='AWS_DEFAULT_REGION',
+			secret_name='TEST_SECRET',
+			**kwargs
+			)
+	
+	def test_secret_is_cached_until_ttl_expires(self):
+		# Tests that the cached secret is returned until the ttl expires
+		with mock.patch(
+				'app.lambdas.functions.secrets_manager.monotonic', return_value=1000.0
+				):
+			first_secret = self.get_secret()
+		self.rotate_secret()
+		with mock.patch(
+				'app.lambdas.functions.secrets_manager.monotonic', return_value=1299.0
+				):
+			cached_secret = self.get_secret()
+		with mock.patch(
+				'app.lambdas.functions.secrets_manager.monotonic', return_value=1300.0
+				):
+			expired_secret = self.get_secret()
+		
+		# Runs assertions
+		self.assertEqual(first_secret, 'old_secret')
+		self.assertEqual(cached_secret, 'old_secret')
+		self.assertEqual(expired_secret, 'new_secret')
+	
+	def test_force_refresh_bypasses_cache(self):
+		# Tests that force_refresh gets the rotated secret before the ttl expires
+		self.get_secret()
+		self.rotate_secret()
+		
+		# Runs assertions
+		self.assertEqual(self.get_secret(force_refresh=True), 'new_secret')
+		self.assertEqual(self.get_secret(), 'new_secret')
+	
+	@mock.patch.dict('os.environ', {'SECRET_CACHE_TTL_SECONDS': '0'})
+	def test_zero_ttl_disables_cache(self):
+		# Tests that a ttl of 0 gets the secret every time
+		self.get_secret()
+		self.rotate_secret()
+		
+		# Runs assertions
+		self.assertEqual(self.get_secret(), 'new_secret')
+	
+	def test_auth_error_refreshes_secret(self):
+		# Tests that the call is retried once with the rotated secret after an auth error
+		stale_secret = self.get_secret()
+		self.rotate_secret()
+		used_secrets = []
+		
+		def call_api(secret):
+			# Mocks an api that rejects the old secret
+			used_secrets.append(secret)
+			if secret != 'new_secret':
+				raise PermissionError('Unauthorized')
+			return 'response'
+		
+		# Calls function to be tested
+		test_func = call_with_secret_refresh(
+			func=call_api,
+			secret=stale_secret,
+			region_env='AWS_DEFAULT_REGION',
+			secret_name='TEST_SECRET',
+			is_auth_error=lambda error: isinstance(error, PermissionError)
+			)
+		
+		# Runs assertions
+		self.assertEqual(test_func, 'response')
+		self.assertEqual(used_secrets, ['old_secret', 'new_secret'])
+		self.assertEqual(self.get_secret(), 'new_secret')
+
+
 if __name__ == '__main__':
 	unittest.main(verbosity=2)
@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+from moto import mock_s3
+import boto3
+from app.lambdas.functions.clients import reset_boto3_clients
+from app.lambdas.functions.sql_templates import (
+	SQL_TEMPLATES,
+	clear_sql_override_cache,
+	get_sql_template
+	)
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'S3_BUCKET': 'testing',
+		'SQL_OVERRIDE_PREFIX': 'sql_scripts',
+		'SQL_OVERRIDE_TTL_SECONDS': '0'
+		}
+	)
+class TestGetSqlTemplateOverride(unittest.TestCase):
+	# Tests the S3 override of the get_sql_template function
+	mock_s3 = mock_s3()
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		clear_sql_override_cache()
+		self.mock_s3.start()
+		self.s3 = boto3.client('s3', region_name='us-east-1')
+		self.s3.create_bucket(Bucket='testing')
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_s3.stop()
+		clear_sql_override_cache()
+	
+	def test_override_is_reused_until_its_etag_changes(self):
+		# Tests that an unchanged override is not compiled again and a changed one is
+		sql_file = 'final_data_test_no_duplicates.sql'
+		self.s3.put_object(
+			Bucket='testing', Key=f'sql_scripts/{sql_file}', Body=b'SELECT 1 FROM {table}'
+			)
+		
+		# Calls function to be tested
+		first = get_sql_template(sql_file)
+		unchanged = get_sql_template(sql_file)
+		self.s3.put_object(
+			Bucket='testing', Key=f'sql_scripts/{sql_file}', Body=b'SELECT 2 FROM {table}'
+			)
+		changed = get_sql_template(sql_file)
+		
+		# Runs assertions
+		self.assertEqual(
+			first.render(identifiers={'table': 't'}).query_string, 'SELECT 1 FROM t'
+			)
+		self.assertIs(unchanged, first)
+		self.assertEqual(
+			changed.render(identifiers={'table': 't'}).query_string, 'SELECT 2 FROM t'
+			)
+	
+	def test_bundled_template_is_used_without_override(self):
+		# Tests that templates that are not overridden come from the deployment package
+		sql_file = 'passes_data_test_cities_with_passes.sql'
+		
+		# Calls function to be tested
+		test_func = get_sql_template(sql_file)
+		
+		# Runs assertions
+		self.assertIs(test_func, SQL_TEMPLATES[sql_file])
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
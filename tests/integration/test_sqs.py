@@ -4,8 +4,12 @@ from unittest import mock
 from moto import (mock_sqs)
 import boto3
 import os
+from app.lambdas.functions.clients import reset_boto3_clients
 from app.lambdas.functions.sqs import (
-	send_city_list_to_sqs_queue
+	SQS_MAX_BATCH_BYTES,
+	delete_messages_from_sqs_queue,
+	send_city_list_to_sqs_queue,
+	send_messages_to_sqs_queue_in_batches
 	)
 
 # Sets default region
@@ -25,6 +29,7 @@ class TestSendCityListToSqsQueue(unittest.TestCase):
 	
 	def setUp(self):
 		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
 		self.mock_sqs.start()
 		sqs = boto3.client('sqs', region_name=AWS_DEFAULT_REGION)
 		self.queue_url = sqs.create_queue(QueueName=self.queue_name)
@@ -77,6 +82,151 @@ class TestSendCityListToSqsQueue(unittest.TestCase):
 			self.assertIn(mocked_data_dict['latitude'], message_body['latitude'])
 			self.assertIn(mocked_data_dict['longitude'], message_body['longitude'])
 
+	def test_all_cities_sent_in_batches(self):
+		# Tests that every row is sent with SendMessageBatch and summarised
+		with mock.patch.dict(
+			'os.environ', {
+				'QUEUE_URL': f'{self.queue_url["QueueUrl"]}'
+				}
+			):
+			# Mocks Lambda environmental variables
+			QUEUE_URL = os.environ['QUEUE_URL']
+			
+			# Mocks 25 cities to be sent to SQS queue (i.e. 3 batches)
+			mocked_data = [
+				['city', 'region', 'country', 'country_code', 'latitude', 'longitude']
+				] + [
+				[f'City {num}', 'Region', 'Australia', 'AUS', '-31.9', '115.8']
+				for num in range(25)
+				]
+			
+			# Calls function to be tested
+			test_func = send_city_list_to_sqs_queue(
+				region_env='AWS_DEFAULT_REGION',
+				data=mocked_data,
+				queue_url_env='QUEUE_URL'
+				)
+			
+			# Mocks receiving of all messages for assertion
+			sqs = boto3.client('sqs', region_name=AWS_DEFAULT_REGION)
+			received_cities = set()
+			while True:
+				received_message = sqs.receive_message(
+					QueueUrl=QUEUE_URL,
+					MaxNumberOfMessages=10
+					)
+				if not received_message.get('Messages'):
+					break
+				for message in received_message['Messages']:
+					received_cities.add(json.loads(message['Body'])['city'])
+					sqs.delete_message(
+						QueueUrl=QUEUE_URL,
+						ReceiptHandle=message['ReceiptHandle']
+						)
+			
+			# Runs assertions
+			self.assertEqual(test_func['messages_sent'], 25)
+			self.assertEqual(test_func['messages_failed'], 0)
+			self.assertEqual(test_func['requests'], 3)
+			self.assertEqual(received_cities, {row[0] for row in mocked_data[1:]})
+
+	
+	def test_max_size_batches_are_sent(self):
+		# Tests that batches are split by the total size of their message bodies, i.e. 10
+		# messages of exactly 256 KiB in total fit in one request while 4 messages of
+		# 100 KiB need 2 requests
+		sqs = boto3.client('sqs', region_name=AWS_DEFAULT_REGION)
+		queue_url = self.queue_url['QueueUrl']
+		max_size_bodies = ['a' * (SQS_MAX_BATCH_BYTES // 10)] * 9
+		max_size_bodies.append('a' * (SQS_MAX_BATCH_BYTES - sum(map(len, max_size_bodies))))
+		large_bodies = ['b' * 102_400] * 4
+		
+		with mock.patch.dict('os.environ', {'QUEUE_URL': queue_url}):
+			# Calls function to be tested
+			max_size_summary = send_messages_to_sqs_queue_in_batches(
+				region_env='AWS_DEFAULT_REGION',
+				message_bodies=iter(max_size_bodies),
+				queue_url_env='QUEUE_URL'
+				)
+			large_summary = send_messages_to_sqs_queue_in_batches(
+				region_env='AWS_DEFAULT_REGION',
+				message_bodies=iter(large_bodies),
+				queue_url_env='QUEUE_URL'
+				)
+		attributes = sqs.get_queue_attributes(
+			QueueUrl=queue_url,
+			AttributeNames=['ApproximateNumberOfMessages']
+			)['Attributes']
+		
+		# Runs assertions
+		self.assertEqual(sum(map(len, max_size_bodies)), SQS_MAX_BATCH_BYTES)
+		self.assertEqual(max_size_summary['messages_sent'], 10)
+		self.assertEqual(max_size_summary['messages_failed'], 0)
+		self.assertEqual(max_size_summary['requests'], 1)
+		self.assertEqual(large_summary['messages_sent'], 4)
+		self.assertEqual(large_summary['messages_failed'], 0)
+		self.assertEqual(large_summary['requests'], 2)
+		self.assertEqual(attributes['ApproximateNumberOfMessages'], '14')
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'AWS_DEFAULT_REGION': f'{AWS_DEFAULT_REGION}'
+		}
+	)
+class TestDeleteMessagesFromSqsQueue(unittest.TestCase):
+	# Tests the delete_messages_from_sqs_queue function
+	mock_sqs = mock_sqs()
+	queue_name = 'testing-queue'
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+		self.mock_sqs.start()
+		sqs = boto3.client('sqs', region_name=AWS_DEFAULT_REGION)
+		self.queue_url = sqs.create_queue(QueueName=self.queue_name)['QueueUrl']
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.mock_sqs.stop()
+	
+	def test_all_messages_deleted_in_batches(self):
+		# Tests that 15 received messages are deleted with 2 DeleteMessageBatch calls
+		sqs = boto3.client('sqs', region_name=AWS_DEFAULT_REGION)
+		for num in range(15):
+			sqs.send_message(QueueUrl=self.queue_url, MessageBody=f'City {num}')
+		
+		# Mocks the event['Records'] of the received messages
+		records = []
+		while len(records) < 15:
+			received_message = sqs.receive_message(
+				QueueUrl=self.queue_url,
+				MaxNumberOfMessages=10
+				)
+			records.extend(
+				{'messageId': message['MessageId'], 'receiptHandle': message['ReceiptHandle']}
+				for message in received_message['Messages']
+				)
+		
+		with mock.patch.dict('os.environ', {'QUEUE_URL': self.queue_url}):
+			# Calls function to be tested
+			test_func = delete_messages_from_sqs_queue(
+				region_env='AWS_DEFAULT_REGION',
+				queue_url_env='QUEUE_URL',
+				sqs_messages=records
+				)
+		attributes = sqs.get_queue_attributes(
+			QueueUrl=self.queue_url,
+			AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+			)['Attributes']
+		
+		# Runs assertions
+		self.assertEqual(test_func['messages_deleted'], 15)
+		self.assertEqual(test_func['messages_failed'], 0)
+		self.assertEqual(attributes['ApproximateNumberOfMessages'], '0')
+		self.assertEqual(attributes['ApproximateNumberOfMessagesNotVisible'], '0')
+
 
 if __name__ == '__main__':
 	unittest.main(verbosity=2)
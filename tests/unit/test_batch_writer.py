@@ -0,0 +1,71 @@
+import json
+import unittest
+from unittest import mock
+from app.lambdas.functions.batch_writer import (
+	create_city_key,
+	put_raw_batch_for_sqs_event
+	)
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict('os.environ', {'RAW_BATCH_COMPRESSION': 'gzip'})
+class TestPutRawBatchForSqsEvent(unittest.TestCase):
+	# Tests the put_raw_batch_for_sqs_event function
+	cities = [
+		{
+			'city': f'City {num}', 'region': 'Region', 'country': 'Australia',
+			'country_code': 'AUS', 'latitude': '-31.9', 'longitude': '115.8'
+			}
+		for num in range(3)
+		]
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that the cities of failed records are not put in the batch object
+		city_rows = {
+			create_city_key(city): [{'city': city['city']}]
+			for city in self.cities
+			}
+		failed_records = [
+			{'messageId': 'two', 'body': json.dumps(self.cities[1])},
+			{'messageId': 'invalid', 'body': 'not json'}
+			]
+		with mock.patch(
+				'app.lambdas.functions.batch_writer.put_raw_batch_in_s3',
+				return_value='key'
+				) as mocked_put:
+			# Calls function to be tested
+			test_func = put_raw_batch_for_sqs_event(
+				city_rows=city_rows,
+				failed_records=failed_records,
+				raw_prefix_env='PASSES_RAW_PREFIX',
+				api_call_name='iss-passes'
+				)
+		
+		# Runs assertions
+		self.assertEqual(test_func, 'key')
+		self.assertEqual(
+			list(mocked_put.call_args.kwargs['city_rows']),
+			['AUS-Region-City 0', 'AUS-Region-City 2']
+			)
+		self.assertEqual(mocked_put.call_args.kwargs['compression'], 'gzip')
+	
+	def test_no_object_for_all_failed_records(self):
+		# Tests that nothing is put in S3 if every record failed
+		with mock.patch(
+				'app.lambdas.functions.batch_writer.put_raw_batch_in_s3'
+				) as mocked_put:
+			# Calls function to be tested
+			test_func = put_raw_batch_for_sqs_event(
+				city_rows={create_city_key(self.cities[0]): [{'city': 'City 0'}]},
+				failed_records=[{'messageId': 'one', 'body': json.dumps(self.cities[0])}],
+				raw_prefix_env='PASSES_RAW_PREFIX',
+				api_call_name='iss-passes'
+				)
+		
+		# Runs assertions
+		self.assertIsNone(test_func)
+		mocked_put.assert_not_called()
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+from app.lambdas.functions.clients import (
+	get_boto3_client,
+	reset_boto3_clients,
+	)
+
+# Sets default AWS region
+AWS_DEFAULT_REGION = 'ap-southeast-2'
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict(
+	'os.environ', {
+		'AWS_DEFAULT_REGION': f'{AWS_DEFAULT_REGION}',
+		'AWS_ACCESS_KEY_ID': 'testing',
+		'AWS_SECRET_ACCESS_KEY': 'testing',
+		'BOTO3_MAX_POOL_CONNECTIONS': '25',
+		}
+	)
+class TestGetBoto3Client(unittest.TestCase):
+	# Tests the get_boto3_client function
+
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_boto3_clients()
+
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		reset_boto3_clients()
+
+	def test_client_is_reused(self):
+		# Tests that the same client is returned for the same service and region
+		self.assertIs(get_boto3_client('s3'), get_boto3_client('s3'))
+		self.assertIs(
+			get_boto3_client('sqs', region_name='us-east-1'),
+			get_boto3_client('sqs', region_name='us-east-1')
+			)
+
+	def test_default_region_shares_client(self):
+		# Tests that the default region and the explicit default region share a client
+		self.assertIs(
+			get_boto3_client('s3'),
+			get_boto3_client('s3', region_name=AWS_DEFAULT_REGION)
+			)
+
+	def test_client_is_keyed_by_service_and_region(self):
+		# Tests that different services and regions get different clients
+		s3_client = get_boto3_client('s3', region_name='us-east-1')
+
+		# Runs assertions
+		self.assertIsNot(s3_client, get_boto3_client('s3', region_name='us-west-2'))
+		self.assertIsNot(s3_client, get_boto3_client('sqs', region_name='us-east-1'))
+		self.assertEqual(s3_client.meta.region_name, 'us-east-1')
+
+	def test_max_pool_connections_is_configurable(self):
+		# Tests that the connection pool size is read from the environment variable
+		s3_client = get_boto3_client('s3')
+
+		# Runs assertions
+		self.assertEqual(s3_client.meta.config.max_pool_connections, 25)
+
+	def test_reset_creates_new_client(self):
+		# Tests that the test hook clears the registry
+		s3_client = get_boto3_client('s3')
+		reset_boto3_clients()
+
+		# Runs assertions
+		self.assertIsNot(s3_client, get_boto3_client('s3'))
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,75 @@
+import threading
+import time
+import unittest
+from app.lambdas.functions.concurrency import (
+	run_concurrently,
+	)
+
+
+def square_or_raise(item):
+	# Mocks a task that fails for negative items
+	if item < 0:
+		raise ValueError('negative item')
+	time.sleep(0.01)
+	return item * item
+
+
+class TestRunConcurrently(unittest.TestCase):
+	# Tests the run_concurrently function
+	
+	def test_results_are_ordered_and_errors_isolated(self):
+		# Tests that every mode returns results in order with errors per item
+		items = [1, -2, 3, 4]
+		for mode in ('thread', 'asyncio', 'sequential'):
+			with self.subTest(mode=mode):
+				# Calls function to be tested
+				test_func = run_concurrently(
+					func=square_or_raise,
+					items=items,
+					max_concurrency=4,
+					mode=mode
+					)
+				
+				# Runs assertions
+				self.assertEqual([result.item for result in test_func], items)
+				self.assertEqual(
+					[result.result for result in test_func], [1, None, 9, 16]
+					)
+				self.assertIsInstance(test_func[1].error, ValueError)
+	
+	def test_concurrency_limit_is_respected(self):
+		# Tests that no more than max_concurrency items are in progress at once
+		lock = threading.Lock()
+		in_progress = [0]
+		max_in_progress = [0]
+		
+		def track_concurrency(item):
+			with lock:
+				in_progress[0] += 1
+				max_in_progress[0] = max(max_in_progress[0], in_progress[0])
+			time.sleep(0.02)
+			with lock:
+				in_progress[0] -= 1
+		
+		for mode in ('thread', 'asyncio'):
+			with self.subTest(mode=mode):
+				max_in_progress[0] = 0
+				run_concurrently(
+					func=track_concurrency,
+					items=range(12),
+					max_concurrency=3,
+					mode=mode
+					)
+				
+				# Runs assertions
+				self.assertLessEqual(max_in_progress[0], 3)
+				self.assertGreater(max_in_progress[0], 1)
+	
+	def test_error_for_invalid_mode(self):
+		# Tests that an error is raised for an unknown execution mode
+		with self.assertRaises(ValueError):
+			run_concurrently(func=square_or_raise, items=[1], mode='process')
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
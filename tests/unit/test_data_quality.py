@@ -0,0 +1,81 @@
+import unittest
+from app.lambdas.data_test_functions.data_quality import (
+	compile_data_quality_query,
+	distinct_key_check,
+	not_null_check,
+	range_check,
+	row_count_check,
+	uniqueness_check
+	)
+from app.lambdas.functions.sql_templates import SqlTemplate
+
+
+class TestCompileDataQualityQuery(unittest.TestCase):
+	# Tests the compile_data_quality_query function
+	
+	def test_checks_are_compiled_into_one_query(self):
+		# Tests that every check is a column of a single aggregate query of the run
+		# date's partition
+		checks = [
+			row_count_check('row_count'),
+			distinct_key_check('cities', columns=('city', 'region'), expected=5),
+			uniqueness_check('no_duplicates', columns=('city', 'region', 'dt')),
+			not_null_check('null_values', columns=('city', 'temp')),
+			range_check('humidity_range', column='humidity', minimum=0, maximum=100),
+			]
+		
+		# Calls function to be tested
+		template = SqlTemplate.compile('data_quality', compile_data_quality_query(checks))
+		test_func = template.render(
+			parameters={'year': '2023', 'month': '05', 'day': '23'},
+			identifiers={'table': 'weather'}
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			test_func.query_string,
+			"SELECT\n"
+			"    COUNT(*) AS row_count\n"
+			"    , COUNT(DISTINCT (city, region)) AS cities\n"
+			"    , COUNT(*) - COUNT(DISTINCT (city, region, dt)) AS no_duplicates\n"
+			"    , COUNT_IF(city IS NULL OR temp IS NULL) AS null_values\n"
+			"    , COUNT_IF(humidity < 0.0 OR humidity > 100.0) AS humidity_range\n"
+			"FROM weather\n"
+			"WHERE day = ?\n"
+			"    AND month = ?\n"
+			"    AND year = ?"
+			)
+		self.assertEqual(test_func.parameters, ["'23'", "'05'", "'2023'"])
+	
+	def test_invalid_checks_raise_value_error(self):
+		# Tests that duplicate names, unsafe identifiers and unbounded ranges are
+		# rejected
+		with self.assertRaises(ValueError):
+			compile_data_quality_query([row_count_check('a'), row_count_check('a')])
+		with self.assertRaises(ValueError):
+			not_null_check('nulls', columns=('city; DROP TABLE weather',))
+		with self.assertRaises(ValueError):
+			range_check('humidity_range', column='humidity')
+
+
+class TestDataQualityCheck(unittest.TestCase):
+	# Tests the DataQualityCheck class
+	
+	def test_metric_is_evaluated_against_bounds(self):
+		# Tests the PASS and FAIL results of each kind of check
+		cities = distinct_key_check('cities', columns=('city',), expected=5)
+		duplicates = uniqueness_check('no_duplicates', columns=('city',))
+		
+		# Runs assertions
+		self.assertTrue(cities.evaluate(5))
+		self.assertFalse(cities.evaluate(4))
+		self.assertTrue(duplicates.evaluate(0))
+		self.assertFalse(duplicates.evaluate(2))
+		self.assertFalse(row_count_check('row_count').evaluate(0))
+		self.assertFalse(duplicates.evaluate(None))
+		self.assertEqual(cities.expectation, '= 5')
+		self.assertEqual(duplicates.expectation, '<= 0')
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,130 @@
+import unittest
+from unittest import mock
+import requests
+from app.lambdas.functions.http_client import (
+	JitteredRetry,
+	get_http_session,
+	http_get,
+	is_auth_error,
+	redact_api_keys,
+	reset_http_session,
+	)
+
+
+class TestGetHttpSession(unittest.TestCase):
+	# Tests the get_http_session function
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_http_session()
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		reset_http_session()
+	
+	def test_session_is_reused(self):
+		# Tests that the same session is returned on each call
+		self.assertIs(get_http_session(), get_http_session())
+	
+	def test_retries_rate_limits_and_server_errors(self):
+		# Tests that the session retries 429 and 5xx responses with jittered backoff
+		retry = get_http_session().get_adapter('https://api.n2yo.com').max_retries
+		
+		# Runs assertions
+		self.assertIsInstance(retry, JitteredRetry)
+		self.assertTrue({429, 500, 503}.issubset(retry.status_forcelist))
+		self.assertTrue(retry.respect_retry_after_header)
+
+
+class TestJitteredRetry(unittest.TestCase):
+	# Tests the JitteredRetry class
+	
+	def test_backoff_is_jittered_below_exponential_backoff(self):
+		# Tests that the backoff is between 0 and the exponential backoff
+		retry = JitteredRetry(total=5, backoff_factor=1).increment(
+			method='GET', url='/'
+			).increment(method='GET', url='/').increment(method='GET', url='/')
+		exponential_backoff = super(JitteredRetry, retry).get_backoff_time()
+		backoffs = {retry.get_backoff_time() for _ in range(20)}
+		
+		# Runs assertions
+		self.assertGreater(exponential_backoff, 0)
+		self.assertTrue(all(0 <= backoff <= exponential_backoff for backoff in backoffs))
+		self.assertGreater(len(backoffs), 1)
+
+
+@mock.patch.dict(
+	'os.environ', {
+		'HTTP_CONNECT_TIMEOUT': '2',
+		'HTTP_READ_TIMEOUT': '10',
+		}
+	)
+class TestHttpGet(unittest.TestCase):
+	# Tests the http_get function
+	url = 'https://api.n2yo.com/rest/v1/satellite/visualpasses/25544&apiKey=secret'
+	
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_http_session()
+	
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		reset_http_session()
+	
+	def test_timeouts_are_passed_to_request(self):
+		# Tests that connect and read timeouts are read from environment variables
+		response = requests.Response()
+		response.status_code = 200
+		with mock.patch.object(
+			get_http_session(), 'get', return_value=response
+			) as mocked_get:
+			# Calls function to be tested
+			test_func = http_get(self.url)
+		
+		# Runs assertions
+		self.assertIs(test_func, response)
+		self.assertEqual(mocked_get.call_args.kwargs['timeout'], (2.0, 10.0))
+	
+	def test_error_message_does_not_contain_api_key(self):
+		# Tests that an error response raises without leaking the api key
+		response = requests.Response()
+		response.status_code = 500
+		response.url = self.url
+		with mock.patch.object(get_http_session(), 'get', return_value=response):
+			# Runs assertions
+			with self.assertRaises(requests.HTTPError) as error:
+				http_get(self.url)
+		self.assertNotIn('secret', str(error.exception))
+		self.assertIs(error.exception.response, response)
+
+
+class TestIsAuthError(unittest.TestCase):
+	# Tests the is_auth_error function
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that only 401 and 403 responses are authentication errors
+		for status_code, expected in ((401, True), (403, True), (429, False), (500, False)):
+			with self.subTest(status_code=status_code):
+				response = requests.Response()
+				response.status_code = status_code
+				
+				# Runs assertions
+				self.assertEqual(
+					is_auth_error(requests.HTTPError(response=response)), expected
+					)
+		self.assertFalse(is_auth_error(ValueError('Unauthorized')))
+
+
+class TestRedactApiKeys(unittest.TestCase):
+	# Tests the redact_api_keys function
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that N2YO and OpenWeather api keys are redacted
+		self.assertEqual(
+			redact_api_keys('a/b&apiKey=secret and lat=1&appid=secret&units=metric'),
+			'a/b&apiKey=*** and lat=1&appid=***&units=metric'
+			)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -61,6 +61,24 @@ class TestCreateS3ObjectNameForApiDataExport(unittest.TestCase):
 		
 		# Runs assertions
 		self.assertEqual(test_func, expected_object_name)
+	
+	def test_run_date_is_used_for_prefix_and_filename(self):
+		# Tests that an explicit run date (e.g. a backfill) is used instead of today
+		expected_object_name = 's3-bucket/year=2023/month=05/day=03/' \
+							   'api_call_name-CC-region-2023_05_03-City-utc.json'
+		
+		# Calls function to be tested
+		test_func = create_s3_object_name_for_api_data_export(
+			s3_bucket_prefix='s3-bucket',
+			city_name='City',
+			region='region',
+			country_code='CC',
+			api_call_name='api_call_name',
+			run_date=datetime.date(2023, 5, 3)
+			)
+		
+		# Runs assertions
+		self.assertEqual(test_func, expected_object_name)
 
 
 if __name__ == '__main__':
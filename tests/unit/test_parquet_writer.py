@@ -0,0 +1,61 @@
+import io
+import unittest
+try:
+	import pyarrow.parquet as pq
+except ImportError:
+	pq = None
+from app.lambdas.functions.parquet_writer import (
+	PASSES_COLUMNS,
+	WEATHER_COLUMNS,
+	create_parquet_bytes
+	)
+
+
+@unittest.skipUnless(pq is not None, 'pyarrow is required to write Parquet')
+class TestCreateParquetBytes(unittest.TestCase):
+	# Tests the create_parquet_bytes function
+	
+	def read_rows(self, rows, columns):
+		# Calls function to be tested and reads the Parquet file
+		test_func = create_parquet_bytes(rows=rows, columns=columns)
+		return pq.read_table(io.BytesIO(test_func))
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that weather values are converted to the Glue schema types
+		table = self.read_rows(
+			rows=[
+				{
+					'city': 'Perth', 'lat': -31.95, 'lon': 115.86, 'dt': 1684800000,
+					'temp': 18, 'pressure': 1015.0, 'wind_gust': 'gusty', 'id': 500,
+					'rain': {'1h': 1}, 'lat_lon': 'dropped'
+					},
+				{'city': 'Sydney', 'pressure': 1015.5, 'dt': 2 ** 31, 'snow': 'none'}
+				],
+			columns=WEATHER_COLUMNS
+			)
+		rows = table.to_pylist()
+		
+		# Runs assertions
+		self.assertEqual(table.column_names, [name for name, _ in WEATHER_COLUMNS])
+		self.assertEqual(rows[0]['temp'], 18.0)
+		self.assertEqual(rows[0]['pressure'], 1015)
+		self.assertIsNone(rows[0]['wind_gust'])
+		self.assertEqual(rows[0]['rain'], {'1h': 1.0})
+		self.assertIsNone(rows[1]['pressure'])
+		self.assertIsNone(rows[1]['dt'])
+		self.assertIsNone(rows[1]['snow'])
+	
+	def test_schema_matches_glue_types(self):
+		# Tests that the column types match the Glue IntegerType, DoubleType and
+		# StringType columns
+		table = self.read_rows(rows=[{'city': 'Perth', 'lat': '-31.95'}], columns=PASSES_COLUMNS)
+		
+		# Runs assertions
+		self.assertEqual(str(table.schema.field('satid').type), 'int32')
+		self.assertEqual(str(table.schema.field('lat').type), 'double')
+		self.assertEqual(str(table.schema.field('startAzCompass').type), 'string')
+		self.assertEqual(table.column('lat').to_pylist(), [-31.95])
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
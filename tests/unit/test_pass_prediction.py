@@ -0,0 +1,191 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from app.lambdas.functions import pass_prediction
+from app.lambdas.functions.pass_prediction import (
+	azimuth_to_compass,
+	get_tle,
+	parse_tle,
+	predict_passes,
+	)
+from app.lambdas.lambda_functions.sqs_to_passes_api import (
+	transform_passes_from_api_response
+	)
+
+# ISS TLE with an epoch of 2019-12-09 16:38 UTC
+TLE_TEXT = (
+	'ISS (ZARYA)\n'
+	'1 25544U 98067A   19343.69339541  .00001764  00000-0  38792-4 0  9991\n'
+	'2 25544  51.6439 211.2001 0007417  17.6667  85.6398 15.50103472202482\n'
+	)
+TLE_START_UTC = 1575849600
+
+# Columns of the passes raw table
+PASSES_COLUMNS = [
+	'city', 'lat', 'lon', 'region', 'country', 'satid', 'satname', 'transactionscount',
+	'passescount', 'startAz', 'startAzCompass', 'startEl', 'startUTC', 'maxAz',
+	'maxAzCompass', 'maxEl', 'maxUTC', 'endAz', 'endAzCompass', 'endEl', 'endUTC',
+	'mag', 'duration', 'startVisibility'
+	]
+
+CITIES = [
+	{
+		'city': 'Perth', 'lat': '-31.9522', 'lon': '115.8589',
+		'region': 'Western Australia', 'country': 'Australia', 'country_code': 'AUS'
+		},
+	{
+		'city': 'London', 'lat': '51.5072', 'lon': '-0.1276',
+		'region': 'England', 'country': 'United Kingdom', 'country_code': 'GBR'
+		},
+	{
+		'city': 'Longyearbyen', 'lat': '78.2232', 'lon': '15.6267',
+		'region': 'Svalbard', 'country': 'Norway', 'country_code': 'NOR'
+		},
+	]
+
+
+class TestParseTle(unittest.TestCase):
+	# Tests the parse_tle function
+
+	def test_three_line_tle(self):
+		# Tests that the satellite name is read from the first line
+		name, line1, line2 = parse_tle(TLE_TEXT)
+
+		# Runs assertions
+		self.assertEqual(name, 'ISS (ZARYA)')
+		self.assertTrue(line1.startswith('1 25544U'))
+		self.assertTrue(line2.startswith('2 25544 '))
+
+	def test_two_line_tle_uses_default_name(self):
+		# Tests that the default name is used if the TLE has no name line
+		name, _, _ = parse_tle(
+			'\n'.join(TLE_TEXT.splitlines()[1:]), default_name='25544'
+			)
+
+		# Runs assertions
+		self.assertEqual(name, '25544')
+
+	def test_invalid_tle_raises(self):
+		# Tests that a ValueError is raised for text that is not a TLE
+		with self.assertRaises(ValueError):
+			parse_tle('No GP data found')
+
+
+class TestGetTle(unittest.TestCase):
+	# Tests the get_tle function
+
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.cache_path = os.path.join(self.temp_dir.name, 'tle.txt')
+
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		self.temp_dir.cleanup()
+
+	@mock.patch.object(pass_prediction, 'http_get')
+	def test_tle_is_downloaded_once(self, mock_http_get):
+		# Tests that the TLE is downloaded then read from the cache file
+		mock_http_get.return_value = mock.Mock(text=TLE_TEXT)
+
+		# Calls function to be tested
+		first_tle = get_tle('25544', tle_url='https://testing/{nor_id}', cache_path=self.cache_path)
+		second_tle = get_tle('25544', tle_url='https://testing/{nor_id}', cache_path=self.cache_path)
+
+		# Runs assertions
+		mock_http_get.assert_called_once_with('https://testing/25544')
+		self.assertEqual(first_tle, second_tle)
+
+	@mock.patch.object(pass_prediction, 'http_get')
+	def test_stale_cache_is_refreshed(self, mock_http_get):
+		# Tests that the TLE is downloaded again when the cache file is too old
+		mock_http_get.return_value = mock.Mock(text=TLE_TEXT)
+		with open(self.cache_path, 'w') as cache_file:
+			cache_file.write('stale')
+
+		# Calls function to be tested
+		tle = get_tle('25544', cache_path=self.cache_path, max_age_seconds=0)
+
+		# Runs assertions
+		mock_http_get.assert_called_once()
+		self.assertEqual(tle[0], 'ISS (ZARYA)')
+
+
+class TestAzimuthToCompass(unittest.TestCase):
+	# Tests the azimuth_to_compass function
+
+	def test_compass_points(self):
+		# Tests azimuths on and either side of the compass point boundaries
+		for azimuth, compass in (
+				(0, 'N'), (11.24, 'N'), (11.25, 'NNE'), (90, 'E'), (200, 'SSW'),
+				(348.75, 'N'), (359.9, 'N')
+				):
+			with self.subTest(azimuth=azimuth):
+				self.assertEqual(azimuth_to_compass(azimuth), compass)
+
+
+@unittest.skipUnless(
+	pass_prediction.np is not None and pass_prediction.Satrec is not None,
+	'numpy and sgp4 are required for pass prediction'
+	)
+class TestPredictPasses(unittest.TestCase):
+	# Tests the predict_passes function
+
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		self.responses = predict_passes(
+			cities=CITIES,
+			tle=parse_tle(TLE_TEXT),
+			nor_id='25544',
+			start_utc=TLE_START_UTC,
+			days=1,
+			min_visibility=60,
+			city_chunk_size=2
+			)
+
+	def test_response_per_city(self):
+		# Tests that there is one N2YO shaped response per city
+		self.assertEqual(len(self.responses), len(CITIES))
+		for response in self.responses:
+			self.assertEqual(response['info']['satid'], 25544)
+			self.assertEqual(response['info']['satname'], 'ISS (ZARYA)')
+			self.assertEqual(
+				response['info']['passescount'], len(response.get('passes', []))
+				)
+
+	def test_passes_are_consistent(self):
+		# Tests that every pass is visible for at least min_visibility seconds
+		passes = [row for response in self.responses for row in response.get('passes', [])]
+		self.assertTrue(passes)
+		for row in passes:
+			self.assertLessEqual(row['startUTC'], row['maxUTC'])
+			self.assertLessEqual(row['maxUTC'], row['endUTC'])
+			self.assertGreaterEqual(row['duration'], 60)
+			self.assertEqual(row['duration'], row['endUTC'] - row['startUTC'])
+			self.assertGreaterEqual(row['maxEl'], max(row['startEl'], row['endEl']))
+			self.assertTrue(0 < row['maxEl'] <= 90)
+			self.assertEqual(row['maxAzCompass'], azimuth_to_compass(row['maxAz']))
+
+	def test_no_passes_above_inclination(self):
+		# Tests that the ISS (51.6 degree inclination) is never high over the Arctic
+		for row in self.responses[2].get('passes', []):
+			self.assertLess(row['maxEl'], 30)
+
+	def test_output_matches_passes_table_schema(self):
+		# Tests that the transformed responses have the passes raw table columns
+		for city, response in zip(CITIES, self.responses):
+			passes_dict, _ = transform_passes_from_api_response(
+				city_data_input_dict=city,
+				passes_response_json=response
+				)
+			if 'passes' in response:
+				self.assertEqual(list(passes_dict), PASSES_COLUMNS)
+
+		# Runs assertions i.e. responses only contain json types
+		json.dumps(self.responses)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,132 @@
+import unittest
+from unittest import mock
+from app.lambdas.functions.rate_limiter import (
+	InMemoryRateLimitBackend,
+	RateLimitExceeded,
+	TokenBucket,
+	get_rate_limiter,
+	reset_rate_limiters,
+	)
+
+
+class FakeClock:
+	# Clock that only advances when sleep is called
+
+	def __init__(self):
+		self.now = 1000.0
+		self.sleeps = []
+
+	def time(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+	# Tests the TokenBucket class
+
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		self.clock = FakeClock()
+
+	def create_bucket(self, capacity=2, period_seconds=10, max_wait_seconds=60):
+		# Creates a token bucket using the fake clock
+		return TokenBucket(
+			name='testing',
+			capacity=capacity,
+			period_seconds=period_seconds,
+			backend=InMemoryRateLimitBackend(),
+			max_wait_seconds=max_wait_seconds,
+			clock=self.clock.time,
+			sleep=self.clock.sleep
+			)
+
+	def test_acquire_does_not_wait_within_capacity(self):
+		# Tests that requests within capacity are not delayed
+		bucket = self.create_bucket()
+
+		# Runs assertions
+		self.assertEqual(bucket.acquire(), 0)
+		self.assertEqual(bucket.acquire(), 0)
+		self.assertEqual(self.clock.sleeps, [])
+
+	def test_acquire_waits_for_refill(self):
+		# Tests that requests over capacity wait for a token to refill
+		bucket = self.create_bucket()
+		bucket.acquire()
+		bucket.acquire()
+
+		# Calls function to be tested
+		waited = bucket.acquire()
+
+		# Runs assertions i.e. 2 tokens per 10 seconds is 5 seconds per token
+		self.assertAlmostEqual(waited, 5.0)
+		self.assertEqual(len(self.clock.sleeps), 1)
+
+	def test_acquire_raises_when_wait_exceeds_maximum(self):
+		# Tests that RateLimitExceeded is raised rather than waiting too long
+		bucket = self.create_bucket(capacity=1, period_seconds=3600, max_wait_seconds=60)
+		bucket.acquire()
+
+		# Runs assertions
+		with self.assertRaises(RateLimitExceeded):
+			bucket.acquire()
+		self.assertEqual(self.clock.sleeps, [])
+
+	def test_observe_usage_removes_tokens_used_by_other_workers(self):
+		# Tests that the reported transaction count is applied to the bucket
+		bucket = self.create_bucket(capacity=10, period_seconds=10)
+		bucket.acquire()
+
+		# Calls function to be tested i.e. other workers used 8 more requests
+		bucket.observe_usage(9)
+
+		# Runs assertions i.e. 1 token left, then waits 1 second per token
+		self.assertEqual(bucket.acquire(), 0)
+		self.assertAlmostEqual(bucket.acquire(), 1.0)
+
+	def test_observe_usage_does_not_add_tokens(self):
+		# Tests that a lower reported count does not refill beyond the local state
+		bucket = self.create_bucket(capacity=2, period_seconds=10)
+		bucket.acquire()
+		bucket.acquire()
+
+		# Calls function to be tested
+		bucket.observe_usage(0)
+
+		# Runs assertions
+		self.assertAlmostEqual(bucket.acquire(), 5.0)
+
+
+class TestGetRateLimiter(unittest.TestCase):
+	# Tests the get_rate_limiter function
+
+	def setUp(self):
+		# Sets up the test class' test requirements before tests run
+		reset_rate_limiters()
+
+	def tearDown(self):
+		# Tears down the class test requirements after tests run
+		reset_rate_limiters()
+
+	@mock.patch.dict('os.environ', {'RATE_LIMIT_MAX_WAIT_SECONDS': '5'})
+	def test_rate_limiter_is_reused(self):
+		# Tests that the same bucket is returned for the same name
+		rate_limiter = get_rate_limiter('testing', capacity=10, period_seconds=60)
+
+		# Runs assertions
+		self.assertIs(rate_limiter, get_rate_limiter('testing', 10, 60))
+		self.assertIsInstance(rate_limiter.backend, InMemoryRateLimitBackend)
+		self.assertEqual(rate_limiter.max_wait_seconds, 5)
+
+	@mock.patch.dict('os.environ', {'RATE_LIMIT_BACKEND': 'testing'})
+	def test_invalid_backend_raises(self):
+		# Tests that an unknown backend raises a ValueError
+		with self.assertRaises(ValueError):
+			get_rate_limiter('testing', capacity=10, period_seconds=60)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,78 @@
+import unittest
+from datetime import date
+from unittest import mock
+from app.lambdas.functions.run_context import (
+	RunContext,
+	iter_run_contexts
+	)
+
+
+class TestRunContext(unittest.TestCase):
+	# Tests the RunContext class
+	
+	def test_run_date_is_formatted_for_s3_sql_and_glue(self):
+		# Tests that every format of the run date comes from the same date
+		run_context = RunContext(date(2023, 5, 3))
+		
+		# Runs assertions
+		self.assertEqual(run_context.iso, '2023-05-03')
+		self.assertEqual(run_context.date_prefix, 'year=2023/month=05/day=03')
+		self.assertEqual(run_context.filename_date, '2023_05_03')
+		self.assertEqual(
+			run_context.sql_parameters(),
+			{'year': '2023', 'month': '05', 'day': '03', 'run_date': '2023-05-03'}
+			)
+		self.assertEqual(run_context.glue_arguments(), {'--RUN_DATE': '2023-05-03'})
+	
+	def test_event_run_date_is_used_before_scheduled_time_and_environment(self):
+		# Tests the order that the run date is taken from a Lambda event
+		with mock.patch.dict('os.environ', {'RUN_DATE': '2023-01-01'}):
+			from_input = RunContext.from_event(
+				{'run_date': '2023-05-23', 'time': '2023-05-24T16:00:00Z'}
+				)
+			from_schedule = RunContext.from_event({'time': '2023-05-24T16:00:00Z'})
+			from_environment = RunContext.from_event(None)
+		
+		# Runs assertions
+		self.assertEqual(from_input.run_date, date(2023, 5, 23))
+		self.assertEqual(from_schedule.run_date, date(2023, 5, 24))
+		self.assertEqual(from_environment.run_date, date(2023, 1, 1))
+	
+	def test_city_without_run_date_is_run_today(self):
+		# Tests that cities sent before run dates were added are run today
+		self.assertEqual(RunContext.from_city({'city': 'Perth'}), RunContext.today())
+		self.assertEqual(
+			RunContext.from_city({'city': 'Perth', 'run_date': '2023-05-23'}).run_date,
+			date(2023, 5, 23)
+			)
+	
+	def test_invalid_run_date_raises_value_error(self):
+		# Tests that a run date that is not an ISO date raises an error
+		with self.assertRaises(ValueError):
+			RunContext.from_string('23/05/2023')
+
+
+class TestIterRunContexts(unittest.TestCase):
+	# Tests the iter_run_contexts function
+	
+	def test_every_date_in_range_is_yielded(self):
+		# Tests that the start and end dates are included across a month end
+		result = [
+			run_context.iso
+			for run_context in iter_run_contexts('2023-02-27', '2023-03-01')
+			]
+		
+		# Runs assertions
+		self.assertEqual(result, ['2023-02-27', '2023-02-28', '2023-03-01'])
+	
+	def test_invalid_ranges_raise_value_error(self):
+		# Tests that reversed and too long date ranges are rejected before any date is
+		# yielded
+		with self.assertRaises(ValueError):
+			iter_run_contexts('2023-05-29', '2023-03-01')
+		with self.assertRaises(ValueError):
+			iter_run_contexts('2020-01-01', '2023-01-01')
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
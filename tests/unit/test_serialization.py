@@ -0,0 +1,69 @@
+import gzip
+import json
+import unittest
+from unittest import mock
+from app.lambdas.functions import serialization
+from app.lambdas.functions.serialization import (
+	create_ndjson_bytes,
+	dumps_json,
+	)
+
+
+class TestCreateNdjsonBytes(unittest.TestCase):
+	# Tests the create_ndjson_bytes function
+	rows = [
+		{'city': 'Perth', 'lat': '-31.95', 'dt': 1684800000, 'rain': {'1h': 0.25}},
+		{'city': 'Ōsaka', 'description': "it's \"raining\"", 'snow': None, 'pop': True}
+		]
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that each row is a compact json line
+		# Calls function to be tested
+		test_func = create_ndjson_bytes(rows=self.rows)
+		
+		# Runs assertions
+		self.assertIsInstance(test_func, bytes)
+		self.assertTrue(test_func.endswith(b'\n'))
+		self.assertEqual(
+			test_func.splitlines()[0],
+			b'{"city":"Perth","lat":"-31.95","dt":1684800000,"rain":{"1h":0.25}}'
+			)
+		self.assertEqual(
+			[json.loads(line) for line in test_func.decode('utf-8').splitlines()],
+			self.rows
+			)
+	
+	def test_stdlib_encoder_equals_orjson(self):
+		# Tests that the output is the same if orjson is not installed, including NaN and
+		# infinite values, which are null instead of invalid json
+		rows = self.rows + [
+			{'city': 'Perth', 'rain': {'1h': float('nan')}, 'wind': [float('inf')]}
+			]
+		with mock.patch.object(serialization, 'orjson', None):
+			# Calls function to be tested
+			test_func = create_ndjson_bytes(rows=rows)
+			self.assertEqual(serialization.get_json_encoder_name(), 'json')
+		
+		# Runs assertions
+		self.assertEqual(test_func, create_ndjson_bytes(rows=rows))
+		self.assertEqual(dumps_json(self.rows[1]), test_func.splitlines()[1])
+		self.assertEqual(
+			test_func.splitlines()[2], b'{"city":"Perth","rain":{"1h":null},"wind":[null]}'
+			)
+	
+	def test_gzip_compression(self):
+		# Calls function to be tested
+		test_func = create_ndjson_bytes(rows=self.rows, compression='gzip')
+		
+		# Runs assertions
+		self.assertEqual(gzip.decompress(test_func), create_ndjson_bytes(rows=self.rows))
+		self.assertEqual(test_func, create_ndjson_bytes(rows=self.rows, compression='gzip'))
+	
+	def test_invalid_compression_raises_error(self):
+		# Runs assertions
+		with self.assertRaises(ValueError):
+			create_ndjson_bytes(rows=self.rows, compression='zstd')
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
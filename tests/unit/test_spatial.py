@@ -0,0 +1,65 @@
+import unittest
+from app.lambdas.functions.spatial import (
+	assign_grid_cells,
+	get_grid_cell,
+	)
+
+
+class TestGetGridCell(unittest.TestCase):
+	# Tests the get_grid_cell function
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that a location is snapped to the centre of its grid cell
+		test_func = get_grid_cell('-33.8650', '151.2094', 0.1)
+		
+		# Runs assertions
+		self.assertEqual(
+			test_func, {'id': '-339:1512', 'latitude': -33.85, 'longitude': 151.25}
+			)
+	
+	def test_nearby_locations_share_a_cell(self):
+		# Tests that locations a few kilometres apart share a cell, and distant ones don't
+		sydney = get_grid_cell(-33.8650, 151.2094, 0.1)
+		
+		# Runs assertions
+		self.assertEqual(sydney['id'], get_grid_cell(-33.8915, 151.2767, 0.1)['id'])
+		self.assertNotEqual(sydney['id'], get_grid_cell(-37.8136, 144.9631, 0.1)['id'])
+
+
+class TestAssignGridCells(unittest.TestCase):
+	# Tests the assign_grid_cells function
+	cities = [
+		{'city': 'Sydney', 'latitude': '-33.8650', 'longitude': '151.2094'},
+		{'city': 'Melbourne', 'latitude': '-37.8136', 'longitude': '144.9631'},
+		{'city': 'Bondi', 'latitude': '-33.8915', 'longitude': '151.2767'},
+		]
+	
+	def test_cities_are_grouped_by_cell(self):
+		# Tests that cities in the same cell are adjacent and tagged with the cell
+		test_func = list(assign_grid_cells(self.cities, cell_degrees=0.1))
+		
+		# Runs assertions
+		self.assertEqual([city['city'] for city in test_func], ['Sydney', 'Bondi', 'Melbourne'])
+		self.assertEqual(test_func[0]['cell'], test_func[1]['cell'])
+		self.assertNotIn('cell', self.cities[0])
+	
+	def test_cities_are_grouped_within_a_window(self):
+		# Tests that cities are only grouped within a window, which is read lazily
+		cities = iter(self.cities * 2)
+		
+		# Calls function to be tested
+		test_func = assign_grid_cells(cities, cell_degrees=0.1, window_size=3)
+		first_window = [next(test_func)['city'] for _ in range(3)]
+		
+		# Runs assertions
+		self.assertEqual(first_window, ['Sydney', 'Bondi', 'Melbourne'])
+		self.assertEqual(len(list(cities)), 3)
+	
+	def test_error_for_invalid_cell_size(self):
+		# Tests that an error is raised for a cell size that is not positive
+		with self.assertRaises(ValueError):
+			assign_grid_cells(self.cities, cell_degrees=0)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
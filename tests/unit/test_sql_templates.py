@@ -0,0 +1,63 @@
+import unittest
+from app.lambdas.functions.sql_templates import (
+	SQL_TEMPLATES,
+	SqlTemplate,
+	get_sql_template
+	)
+
+
+class TestSqlTemplate(unittest.TestCase):
+	# Tests the SqlTemplate class
+	
+	def test_parameters_become_execution_parameters(self):
+		# Tests that parameters are replaced with ? in order of appearance and
+		# identifiers are put in the query string
+		template = SqlTemplate.compile(
+			'test.sql',
+			"SELECT * FROM {table} WHERE day = {day} AND city = {city} AND day2 = {day}"
+			)
+		
+		# Calls function to be tested
+		test_func = template.render(
+			parameters={'day': '03', 'city': "King's Park", 'unused': 'x'},
+			identifiers={'table': 'passes'}
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			test_func.query_string,
+			"SELECT * FROM passes WHERE day = ? AND city = ? AND day2 = ?"
+			)
+		self.assertEqual(test_func.parameters, ["'03'", "'King''s Park'", "'03'"])
+	
+	def test_missing_field_raises_value_error(self):
+		# Tests that a template is not rendered with an unfilled field
+		template = SqlTemplate.compile('test.sql', "SELECT * FROM {table}")
+		with self.assertRaises(ValueError):
+			template.render(parameters={'day': '03'})
+
+
+class TestGetSqlTemplate(unittest.TestCase):
+	# Tests the get_sql_template function
+	
+	def test_bundled_templates_are_loaded(self):
+		# Tests that every SQL script in the deployment package is loaded at import and
+		# only has named fields
+		self.assertIn('insert_update_final_table.sql', SQL_TEMPLATES)
+		for name, template in SQL_TEMPLATES.items():
+			self.assertNotIn('', template.fields, name)
+		self.assertIs(
+			get_sql_template('final_data_test_no_duplicates.sql'),
+			SQL_TEMPLATES['final_data_test_no_duplicates.sql']
+			)
+	
+	def test_unknown_or_invalid_template_raises_value_error(self):
+		# Tests that only bundled .sql templates can be used without an override
+		with self.assertRaises(ValueError):
+			get_sql_template('missing.sql')
+		with self.assertRaises(ValueError):
+			get_sql_template('final_data_test_no_duplicates.csv')
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
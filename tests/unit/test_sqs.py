@@ -0,0 +1,332 @@
+import json
+import unittest
+from unittest import mock
+from app.lambdas.functions.sqs import (
+	SQS_MAX_BATCH_BYTES,
+	_batch_message_entries,
+	_chunk_iterable,
+	_send_message_batch_with_retry,
+	complete_sqs_event,
+	create_city_message_bodies,
+	process_city_records_from_sqs_event,
+	send_messages_to_sqs_queue_in_batches,
+	transform_city_dictionary_to_sqs_message_data,
+	transform_city_sqs_message_response_to_list,
+	)
+from app.lambdas.functions.spatial import assign_grid_cells
+
+# Mocks city dictionaries as sent by send_city_list_to_sqs_queue
+mocked_cities = [
+	{
+		'city': f'City {num}',
+		'region': 'Western Australia',
+		'latitude': '-31.9522',
+		'longitude': '115.8589',
+		'country': 'Australia',
+		'country_code': 'AUS'
+		}
+	for num in range(5)
+	]
+
+
+class TestChunkIterable(unittest.TestCase):
+	# Tests the _chunk_iterable function
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that an iterable is split into lists of at most 10 items
+		test_func = list(_chunk_iterable(iter(range(25)), 10))
+		
+		# Runs assertions
+		self.assertEqual([len(chunk) for chunk in test_func], [10, 10, 5])
+		self.assertEqual(sum(test_func, []), list(range(25)))
+
+
+class TestBatchMessageEntries(unittest.TestCase):
+	# Tests the _batch_message_entries function
+	
+	def test_batches_are_split_by_entries_and_size(self):
+		# Tests that batches have at most 10 entries and 256 KiB of message bodies
+		small_entries = [{'Id': str(num), 'MessageBody': 'a'} for num in range(25)]
+		large_entries = [
+			{'Id': str(num), 'MessageBody': 'a' * (SQS_MAX_BATCH_BYTES // 3)}
+			for num in range(7)
+			]
+		
+		# Calls function to be tested
+		small_batches = list(_batch_message_entries(iter(small_entries)))
+		large_batches = list(_batch_message_entries(iter(large_entries)))
+		
+		# Runs assertions
+		self.assertEqual([len(batch) for batch in small_batches], [10, 10, 5])
+		self.assertEqual([len(batch) for batch in large_batches], [3, 3, 1])
+		self.assertEqual(sum(large_batches, []), large_entries)
+
+
+class TestSendMessageBatchWithRetry(unittest.TestCase):
+	# Tests the _send_message_batch_with_retry function
+	entries = [
+		{'Id': '1', 'MessageBody': 'a'},
+		{'Id': '2', 'MessageBody': 'b'},
+		{'Id': '3', 'MessageBody': 'c'},
+		]
+	
+	def test_failed_entries_are_retried(self):
+		# Tests that only the failed entry is resent and the batch then succeeds
+		sqs_client = mock.Mock()
+		sqs_client.send_message_batch.side_effect = [
+			{
+				'Successful': [{'Id': '1'}, {'Id': '3'}],
+				'Failed': [{'Id': '2', 'Code': 'InternalError', 'SenderFault': False}]
+				},
+			{'Successful': [{'Id': '2'}]},
+			]
+		
+		# Calls function to be tested
+		test_func = _send_message_batch_with_retry(
+			sqs_client, 'queue_url', self.entries, max_attempts=3, base_delay=0
+			)
+		
+		# Runs assertions
+		self.assertEqual(test_func, {'sent': 3, 'requests': 2, 'failed': []})
+		self.assertEqual(
+			sqs_client.send_message_batch.call_args.kwargs['Entries'],
+			[{'Id': '2', 'MessageBody': 'b'}]
+			)
+	
+	def test_sender_faults_are_not_retried(self):
+		# Tests that sender faults and entries still failing after the final attempt
+		# are returned as failed
+		sqs_client = mock.Mock()
+		sqs_client.send_message_batch.side_effect = [
+			{
+				'Successful': [{'Id': '1'}],
+				'Failed': [
+					{'Id': '2', 'Code': 'InvalidMessageContents', 'SenderFault': True},
+					{'Id': '3', 'Code': 'InternalError', 'SenderFault': False},
+					]
+				},
+			{'Failed': [{'Id': '3', 'Code': 'InternalError', 'SenderFault': False}]},
+			]
+		
+		# Calls function to be tested
+		test_func = _send_message_batch_with_retry(
+			sqs_client, 'queue_url', self.entries, max_attempts=2, base_delay=0
+			)
+		
+		# Runs assertions
+		self.assertEqual(test_func['sent'], 1)
+		self.assertEqual(test_func['requests'], 2)
+		self.assertEqual(
+			sorted(entry['Id'] for entry in test_func['failed']), ['2', '3']
+			)
+
+
+class TestSendMessagesToSqsQueueInBatches(unittest.TestCase):
+	# Tests the send_messages_to_sqs_queue_in_batches function
+	
+	def test_error_for_invalid_max_attempts(self):
+		# Tests that an error is raised before any message is sent if no attempt would
+		# be made
+		message_bodies = iter(['a', 'b'])
+		
+		# Runs assertions
+		with self.assertRaises(ValueError):
+			send_messages_to_sqs_queue_in_batches(
+				region_env='MY_AWS_REGION',
+				message_bodies=message_bodies,
+				queue_url_env='SQS_QUEUE_URL',
+				max_attempts=0
+				)
+		self.assertEqual(list(message_bodies), ['a', 'b'])
+
+
+class TestCreateCityMessageBodies(unittest.TestCase):
+	# Tests the create_city_message_bodies function
+	
+	def test_single_city_messages_are_unversioned(self):
+		# Tests that one city per message keeps the original single-city body
+		test_func = list(create_city_message_bodies(mocked_cities, cities_per_message=1))
+		
+		# Runs assertions
+		self.assertEqual([json.loads(body) for body in test_func], mocked_cities)
+	
+	def test_packed_messages_hold_multiple_cities(self):
+		# Tests that cities are packed into versioned messages
+		test_func = list(create_city_message_bodies(mocked_cities, cities_per_message=2))
+		
+		# Runs assertions
+		self.assertEqual(len(test_func), 3)
+		self.assertEqual(
+			json.loads(test_func[0]), {'version': 2, 'cities': mocked_cities[:2]}
+			)
+	
+	def test_packed_messages_larger_than_the_size_limit_are_split(self):
+		# Tests that a packed message body over 256 KiB is split into smaller messages
+		large_cities = [
+			dict(city, city='a' * (SQS_MAX_BATCH_BYTES // 4)) for city in mocked_cities
+			]
+		
+		# Calls function to be tested
+		test_func = list(create_city_message_bodies(large_cities, cities_per_message=5))
+		
+		# Runs assertions
+		self.assertTrue(all(len(body) <= SQS_MAX_BATCH_BYTES for body in test_func))
+		self.assertEqual(
+			sum((json.loads(body)['cities'] for body in test_func), []), large_cities
+			)
+
+
+class TestTransformCitySqsMessageResponseToList(unittest.TestCase):
+	# Tests the transform_city_sqs_message_response_to_list function
+	
+	def test_single_and_packed_messages_give_same_result(self):
+		# Tests that single-city and packed message bodies are both understood
+		single_city_records = [
+			{'body': body}
+			for body in create_city_message_bodies(mocked_cities, cities_per_message=1)
+			]
+		packed_record = {
+			'body': next(create_city_message_bodies(mocked_cities, cities_per_message=5))
+			}
+		
+		# Calls function to be tested
+		single_city_result = [
+			city
+			for record in single_city_records
+			for city in transform_city_sqs_message_response_to_list(record=record)
+			]
+		packed_result = transform_city_sqs_message_response_to_list(record=packed_record)
+		
+		# Runs assertions
+		self.assertEqual(len(packed_result), 5)
+		self.assertEqual(single_city_result, packed_result)
+		self.assertEqual(packed_result[0]['lat'], '-31.9522')
+	
+	def test_pass_windows_are_kept_when_forwarded(self):
+		# Tests that a city forwarded to another queue keeps its pass windows
+		city_data_dict = transform_city_sqs_message_response_to_list(
+			record={'body': json.dumps(mocked_cities[0] | {'pass_windows': [[1, 2]]})}
+			)[0]
+		
+		# Calls function to be tested
+		test_func = transform_city_dictionary_to_sqs_message_data(city_data_dict)
+		
+		# Runs assertions
+		self.assertEqual(city_data_dict['pass_windows'], [[1, 2]])
+		self.assertEqual(test_func, mocked_cities[0] | {'pass_windows': [[1, 2]]})
+	
+	def test_error_for_unsupported_version(self):
+		# Tests that an error is raised for an unknown message format version
+		with self.assertRaises(ValueError):
+			transform_city_sqs_message_response_to_list(
+				record={'body': json.dumps({'version': 99, 'cities': []})}
+				)
+
+
+class TestProcessCityRecordsFromSqsEvent(unittest.TestCase):
+	# Tests the process_city_records_from_sqs_event function
+	
+	def test_only_records_with_failed_cities_are_returned(self):
+		# Tests that errors are isolated to the record containing the failed city
+		bodies = list(create_city_message_bodies(mocked_cities, cities_per_message=2))
+		records = [
+			{'messageId': f'message-{num}', 'body': body}
+			for num, body in enumerate(bodies)
+			] + [{'messageId': 'invalid', 'body': 'not json'}]
+		processed_cities = []
+		
+		def process_city(city_data_dict):
+			# Mocks an api call that fails for the fourth city
+			if city_data_dict['city'] == 'City 3':
+				raise RuntimeError('api error')
+			processed_cities.append(city_data_dict['city'])
+		
+		# Calls function to be tested
+		test_func = process_city_records_from_sqs_event(
+			records=records,
+			process_city=process_city,
+			max_concurrency=3
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			[record['messageId'] for record in test_func], ['message-1', 'invalid']
+			)
+		self.assertEqual(
+			sorted(processed_cities), ['City 0', 'City 1', 'City 2', 'City 4']
+			)
+
+	
+	def test_cities_in_a_cell_are_processed_together(self):
+		# Tests that cities in the same grid cell across records share one task
+		cities = assign_grid_cells(
+			mocked_cities + [mocked_cities[0] | {'city': 'Far City', 'latitude': '-12.46'}],
+			cell_degrees=0.1
+			)
+		records = [
+			{'messageId': f'message-{num}', 'body': body}
+			for num, body in enumerate(create_city_message_bodies(cities, cities_per_message=2))
+			]
+		processed_cells = []
+		
+		def process_cell(cell_cities):
+			# Mocks an api call that fails for the cell containing Far City
+			processed_cells.append(sorted(city['city'] for city in cell_cities))
+			if len(cell_cities) == 1:
+				raise RuntimeError('api error')
+		
+		# Calls function to be tested
+		test_func = process_city_records_from_sqs_event(
+			records=records,
+			process_city=mock.Mock(),
+			process_cell=process_cell
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			sorted(processed_cells),
+			[['City 0', 'City 1', 'City 2', 'City 3', 'City 4'], ['Far City']]
+			)
+		self.assertEqual([record['messageId'] for record in test_func], ['message-2'])
+
+
+class TestCompleteSqsEvent(unittest.TestCase):
+	# Tests the complete_sqs_event function
+	records = [{'messageId': 'one'}, {'messageId': 'two'}]
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that failed messages are reported without deleting any messages
+		with mock.patch(
+				'app.lambdas.functions.sqs.delete_messages_from_sqs_queue'
+				) as mocked_delete:
+			# Calls function to be tested
+			test_func = complete_sqs_event(
+				region_env='AWS_DEFAULT_REGION',
+				queue_url_env='QUEUE_URL',
+				records=self.records,
+				failed_records=self.records[1:]
+				)
+		
+		# Runs assertions
+		self.assertEqual(test_func, {'batchItemFailures': [{'itemIdentifier': 'two'}]})
+		mocked_delete.assert_not_called()
+	
+	def test_successful_messages_are_deleted_without_partial_batch_response(self):
+		# Tests that successful messages are deleted and the failures raise
+		with mock.patch(
+				'app.lambdas.functions.sqs.delete_messages_from_sqs_queue'
+				) as mocked_delete:
+			# Runs assertions
+			with self.assertRaises(Exception):
+				complete_sqs_event(
+					region_env='AWS_DEFAULT_REGION',
+					queue_url_env='QUEUE_URL',
+					records=self.records,
+					failed_records=self.records[1:],
+					report_batch_item_failures=False
+					)
+		self.assertEqual(mocked_delete.call_args.kwargs['sqs_messages'], self.records[:1])
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -1,7 +1,12 @@
 import json
 import unittest
+from unittest import mock
+from app.lambdas.lambda_functions import sqs_to_passes_api
 from app.lambdas.lambda_functions.sqs_to_passes_api import (
+	get_pass_windows,
 	get_passes_api_parameters_from_config,
+	process_city_passes,
+	send_cities_with_passes_to_weather_queue,
 	transform_passes_from_api_response
 	)
 
@@ -58,5 +63,108 @@ class TestTransformPassesFromApiResponseWithoutPasses(unittest.TestCase):
 		self.assertEqual(test_func_response_dict, expected_transformed_passes_from_api_without_passes)
 
 
+
+class TestGetPassWindows(unittest.TestCase):
+	# Tests the get_pass_windows function
+	
+	def test_result_equals_mocked_result(self):
+		# Tests that there is one window per pass and none without passes
+		test_func = get_pass_windows(expected_passes_api_output_with_passes)
+		
+		# Runs assertions
+		self.assertEqual(
+			test_func,
+			[
+				[row['startUTC'], row['endUTC']]
+				for row in expected_passes_api_output_with_passes['passes']
+				]
+			)
+		self.assertEqual(get_pass_windows(expected_passes_api_output_without_passes), [])
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict('os.environ', {'PASSES_RAW_PREFIX': 'testing', 'S3_BUCKET': 'testing'})
+@mock.patch.object(sqs_to_passes_api, 'put_object_in_s3_bucket')
+@mock.patch.object(sqs_to_passes_api, 'call_passes_api')
+class TestProcessCityPasses(unittest.TestCase):
+	# Tests the process_city_passes function
+	
+	def test_city_with_passes_is_collected_for_weather(
+			self, mock_call_passes_api, mock_put_object_in_s3_bucket
+			):
+		# Tests that only cities with passes are collected in passes-first weather mode
+		weather_cities = []
+		for response in (
+				expected_passes_api_output_with_passes,
+				expected_passes_api_output_without_passes
+				):
+			mock_call_passes_api.return_value = response
+			
+			# Calls function to be tested
+			process_city_passes(
+				city_data_input_dict=mocked_sqs_location_data,
+				n2yo_parameters=passes_api_parameters,
+				api_key='testing',
+				weather_cities=weather_cities
+				)
+		
+		# Runs assertions
+		self.assertEqual(mock_put_object_in_s3_bucket.call_count, 2)
+		self.assertEqual(len(weather_cities), 1)
+		self.assertEqual(
+			weather_cities[0]['pass_windows'],
+			get_pass_windows(expected_passes_api_output_with_passes)
+			)
+
+
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict('os.environ', {'MY_AWS_REGION': 'ap-southeast-2'})
+@mock.patch.object(sqs_to_passes_api, 'send_cities_to_sqs_queue')
+class TestSendCitiesWithPassesToWeatherQueue(unittest.TestCase):
+	# Tests the send_cities_with_passes_to_weather_queue function
+	# Mocks a failed record of Perth i.e. mocked_sqs_location_data
+	failed_records = [{
+		'messageId': 'one',
+		'body': json.dumps({
+			'city': 'Perth', 'region': 'Western Australia', 'latitude': '-31.9522',
+			'longitude': '115.8589', 'country': 'Australia', 'country_code': 'AUS'
+			})
+		}]
+	
+	def test_cities_of_failed_records_are_not_sent(self, mock_send_cities_to_sqs_queue):
+		# Tests that only the cities of successful records are sent to the weather
+		# queue, as failed records are retried and would send their cities again
+		mock_send_cities_to_sqs_queue.return_value = {'messages_sent': 1, 'messages_failed': 0}
+		other_city = mocked_sqs_location_data | {'city': 'Fremantle'}
+		weather_cities = [
+			city | {'pass_windows': [[1, 2]]}
+			for city in (mocked_sqs_location_data, other_city)
+			]
+		
+		# Calls function to be tested
+		send_cities_with_passes_to_weather_queue(
+			weather_cities=weather_cities,
+			failed_records=self.failed_records
+			)
+		
+		# Runs assertions
+		sent_cities = mock_send_cities_to_sqs_queue.call_args.kwargs['cities']
+		self.assertEqual([city['city'] for city in sent_cities], ['Fremantle'])
+		self.assertEqual(sent_cities[0]['pass_windows'], [[1, 2]])
+	
+	def test_nothing_is_sent_if_every_record_failed(self, mock_send_cities_to_sqs_queue):
+		# Tests that the weather queue is not called without any cities to send
+		
+		# Calls function to be tested
+		test_func = send_cities_with_passes_to_weather_queue(
+			weather_cities=[mocked_sqs_location_data | {'pass_windows': [[1, 2]]}],
+			failed_records=self.failed_records
+			)
+		
+		# Runs assertions
+		mock_send_cities_to_sqs_queue.assert_not_called()
+		self.assertEqual(test_func['messages_sent'], 0)
+
 if __name__ == '__main__':
 	unittest.main(verbosity=2)
@@ -1,7 +1,15 @@
+import copy
+import io
 import json
 import unittest
+from unittest import mock
+from app.lambdas.lambda_functions import sqs_to_weather_api
 from app.lambdas.lambda_functions.sqs_to_weather_api import (
+	filter_hourly_weather_to_pass_windows,
 	get_weather_api_parameters_from_config,
+	process_cell_weather,
+	iter_weather_json_lines,
+	iter_weather_rows,
 	transform_weather_from_api_response,
 	)
 
@@ -42,5 +50,150 @@ class TestTransformWeatherFromApiResponse(unittest.TestCase):
 		self.assertEqual(test_func_response_dict, expected_transformed_weather_from_api)
 
 
+
+# Patches Lambda environment variables into the tess class
+@mock.patch.dict('os.environ', {'WEATHER_RAW_PREFIX': 'testing', 'S3_BUCKET': 'testing'})
+class TestProcessCellWeather(unittest.TestCase):
+	# Tests the process_cell_weather function
+	
+	@mock.patch.object(sqs_to_weather_api, 'put_object_in_s3_bucket')
+	@mock.patch.object(sqs_to_weather_api, 'call_weather_api')
+	def test_api_response_is_fanned_out_to_each_city(
+			self, mock_call_weather_api, mock_put_object_in_s3_bucket
+			):
+		# Tests that the api is called once per cell and each city keeps its location
+		mock_call_weather_api.return_value = expected_weather_api_output
+		cell = {'id': '-320:1158', 'latitude': -31.95, 'longitude': 115.85}
+		cell_cities = [
+			mocked_sqs_location_data | {'city': 'Perth', 'cell': cell},
+			mocked_sqs_location_data | {
+				'city': 'Fremantle', 'lat': '-31.9959', 'lon': '115.8813', 'cell': cell
+				},
+			]
+		
+		# Calls function to be tested
+		test_func = process_cell_weather(
+			cell_cities=cell_cities,
+			openweather_parameters=weather_api_parameters,
+			api_key='testing'
+			)
+		
+		# Runs assertions
+		mock_call_weather_api.assert_called_once()
+		self.assertEqual(
+			mock_call_weather_api.call_args.kwargs['city_input_data'],
+			{'lat': -31.95, 'lon': 115.85}
+			)
+		self.assertEqual(len(test_func), 2)
+		self.assertIn('Fremantle', test_func[1])
+		fremantle_body = mock_put_object_in_s3_bucket.call_args_list[1].kwargs['body']
+		self.assertIn(b'"lat":-31.9959,"lon":115.8813', fremantle_body)
+
+
+
+class TestFilterHourlyWeatherToPassWindows(unittest.TestCase):
+	# Tests the filter_hourly_weather_to_pass_windows function
+	weather_response_json = {
+		'timezone': 'Australia/Perth',
+		'hourly': [{'dt': 1672588800 + hour * 3600} for hour in range(48)]
+		}
+	
+	def test_only_hours_overlapping_passes_are_kept(self):
+		# Tests that a pass crossing the hour keeps both hours
+		pass_windows = [
+			[1672588800 + 2 * 3600 + 600, 1672588800 + 2 * 3600 + 900],
+			[1672588800 + 5 * 3600 - 120, 1672588800 + 5 * 3600 + 300],
+			]
+		
+		# Calls function to be tested
+		test_func = filter_hourly_weather_to_pass_windows(
+			weather_response_json=self.weather_response_json,
+			pass_windows=pass_windows
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			[row['dt'] for row in test_func['hourly']],
+			[1672588800 + hour * 3600 for hour in (2, 4, 5)]
+			)
+		self.assertEqual(test_func['timezone'], 'Australia/Perth')
+		self.assertEqual(len(self.weather_response_json['hourly']), 48)
+
+
+class TestIterWeatherRows(unittest.TestCase):
+	# Tests that the json lines weather rows equal the previous implementation that
+	# merged the whole api response into every row and printed the dictionaries. See
+	# tests/benchmarks/benchmark_weather_rows.py for their memory and time.
+	
+	def setUp(self):
+		# Replicates the mocked hour to a full 48 hour OpenWeather response
+		self.city_data = mocked_sqs_location_data
+		self.weather_response_json = copy.deepcopy(expected_weather_api_output)
+		first_hour = self.weather_response_json['hourly'][0]
+		self.weather_response_json['hourly'] = []
+		for i in range(48):
+			hour = copy.deepcopy(first_hour)
+			hour['dt'] = first_hour['dt'] + i * 3600
+			self.weather_response_json['hourly'].append(hour)
+	
+	def legacy_weather_rows(self):
+		# Previous implementation of create_weather_rows
+		weather_rows = []
+		for rows in self.weather_response_json['hourly']:
+			conc_weather_data = {
+				'city': self.city_data['city'],
+				'lat': self.city_data['lat'],
+				'lon': self.city_data['lon'],
+				'region': self.city_data['region'],
+				'country': self.city_data['country'],
+				} | self.weather_response_json | rows | rows['weather'][0]
+			del conc_weather_data['hourly']
+			del conc_weather_data['weather']
+			weather_rows.append(conc_weather_data)
+		return weather_rows
+	
+	def legacy_transform(self):
+		# Previous implementation of transform_weather_from_api_response
+		weather_response_io = io.StringIO()
+		for conc_weather_data in self.legacy_weather_rows():
+			print(conc_weather_data, file=weather_response_io)
+		return conc_weather_data, weather_response_io.getvalue()
+	
+	def streaming_transform(self):
+		return transform_weather_from_api_response(self.city_data, self.weather_response_json)
+	
+	def test_output_equals_previous_implementation(self):
+		# Tests that the json lines contain the same rows as the previous implementation
+		# Calls function to be tested
+		test_func_dict, test_func_body = self.streaming_transform()
+		
+		# Runs assertions
+		self.assertEqual(
+			[json.loads(line) for line in test_func_body.splitlines()],
+			self.legacy_weather_rows()
+			)
+		self.assertEqual(
+			list(iter_weather_rows(self.city_data, self.weather_response_json)),
+			self.legacy_weather_rows()
+			)
+		self.assertEqual(test_func_dict, self.legacy_transform()[0])
+	
+	def test_repeated_field_overwrites_header_field(self):
+		# Tests that an hour that repeats a response field falls back to a dictionary
+		self.weather_response_json['hourly'][0]['timezone'] = 'UTC'
+		
+		# Calls function to be tested
+		test_func_lines = list(
+			iter_weather_json_lines(self.city_data, self.weather_response_json)
+			)
+		
+		# Runs assertions
+		self.assertEqual(
+			[json.loads(line) for line in test_func_lines],
+			self.legacy_weather_rows()
+			)
+		self.assertEqual(json.loads(test_func_lines[0])['timezone'], 'UTC')
+
+
 if __name__ == '__main__':
 	unittest.main(verbosity=2)
@@ -0,0 +1,234 @@
+import itertools
+import json
+import re
+import unittest
+import yaml
+
+STEP_TEMPLATES = {
+	'app/step/passes-template.yaml': 'PassesSF',
+	'app/step/weather-template.yaml': 'WeatherSF',
+	'app/step/backfill-template.yaml': 'BackfillSF'
+	}
+
+# JSONPaths of the state input, i.e. not the context object ($$.) or intrinsic functions
+INPUT_PATH_PATTERN = re.compile(r'(?<![$\w])\$(?:\.[\w-]+)+')
+
+# State fields that read the state input, in addition to Parameters values with keys
+# ending .$ and the Path fields of Choice rules
+INPUT_PATH_FIELDS = ('InputPath', 'ItemsPath', 'SecondsPath', 'TimestampPath')
+
+
+class CloudFormationLoader(yaml.SafeLoader):
+	# YAML loader that keeps CloudFormation intrinsic functions as (name, value)
+	pass
+
+
+def construct_intrinsic_function(loader, tag_suffix, node):
+	if isinstance(node, yaml.ScalarNode):
+		value = loader.construct_scalar(node)
+	elif isinstance(node, yaml.SequenceNode):
+		value = loader.construct_sequence(node, deep=True)
+	else:
+		value = loader.construct_mapping(node, deep=True)
+	return tag_suffix, value
+
+
+CloudFormationLoader.add_multi_constructor('!', construct_intrinsic_function)
+
+
+def load_state_machine_definitions(template_path: str, resource_name: str) -> dict:
+	"""
+	Loads a state machine's definition for every combination of the template
+	conditions used in its DefinitionString !Sub variables. Parameters and Lambda ARNs
+	are substituted with their names, and numeric parameters with 1.
+	:return: Dictionary of condition values and definition
+	"""
+	with open(template_path, 'r') as f:
+		template = yaml.load(f, Loader=CloudFormationLoader)
+	_, (definition_string, variables) = (
+		template['Resources'][resource_name]['Properties']['DefinitionString']
+		)
+	conditions = sorted({
+		value[1][0] for value in variables.values() if value[0] == 'If'
+		})
+	
+	definitions = {}
+	for condition_values in itertools.product((True, False), repeat=len(conditions)):
+		condition_values = dict(zip(conditions, condition_values))
+		resolved = {
+			name: resolve_variable(value, condition_values)
+			for name, value in variables.items()
+			}
+		definition = re.sub(r'(:\s*)\$\{\w+\}', r'\g<1>1', definition_string)
+		definition = re.sub(
+			r'\$\{(\w+)\}', lambda match: resolved[match.group(1)], definition
+			)
+		definitions[tuple(condition_values.items())] = json.loads(definition)
+	return definitions
+
+
+def resolve_variable(value, condition_values: dict) -> str:
+	"""
+	Resolves a !Sub variable to a string
+	"""
+	if isinstance(value, str):
+		return value
+	function, argument = value
+	if function == 'If':
+		condition, if_true, if_false = argument
+		return resolve_variable(
+			if_true if condition_values[condition] else if_false, condition_values
+			)
+	if function == 'Ref':
+		return argument
+	if function == 'Sub':
+		return re.sub(r'\$\{(\w+)\}', r'\1', argument)
+	raise ValueError(f'Unsupported intrinsic function: {function}')
+
+
+def get_read_paths(state: dict) -> set:
+	"""
+	Gets the JSONPaths of the state input that a state reads
+	"""
+	read_paths = set()
+	
+	def read_parameters(parameters):
+		for key, value in parameters.items():
+			if isinstance(value, dict):
+				read_parameters(value)
+			elif key.endswith('.$'):
+				read_paths.update(INPUT_PATH_PATTERN.findall(value))
+	
+	read_parameters(state.get('Parameters', {}))
+	read_paths.update(state[field] for field in INPUT_PATH_FIELDS if field in state)
+	for rule in state.get('Choices', []):
+		if 'IsPresent' not in rule:
+			read_paths.add(rule['Variable'])
+		read_paths.update(
+			value for key, value in rule.items()
+			if key.endswith('Path') and key != 'Variable'
+			)
+	return read_paths
+
+
+def get_written_paths(state: dict, input_paths: frozenset) -> frozenset:
+	"""
+	Gets the JSONPaths of a state's output that are known to be written
+	"""
+	if state['Type'] in ('Choice', 'Wait', 'Succeed', 'Fail'):
+		return input_paths
+	if state['Type'] == 'Pass' and 'Result' not in state and 'Parameters' not in state:
+		return input_paths
+	if 'ResultPath' in state:
+		if state['ResultPath'] is None:
+			return input_paths
+		return input_paths | {state['ResultPath']}
+	if state['Type'] == 'Pass':
+		# The state input is replaced with the Pass state's result
+		result = state.get('Result', state.get('Parameters'))
+		return frozenset(f'$.{key[:-2] if key.endswith(".$") else key}' for key in result)
+	# The state input is replaced with the task result
+	return frozenset()
+
+
+def get_next_states(state: dict, input_paths: frozenset) -> list:
+	"""
+	Gets the next states of a state and the JSONPaths written in their input
+	"""
+	next_states = []
+	for rule in state.get('Choices', []):
+		if rule.get('IsPresent') is True:
+			next_states.append((rule['Next'], input_paths | {rule['Variable']}))
+		else:
+			next_states.append((rule['Next'], input_paths))
+	for field in ('Next', 'Default'):
+		if field in state:
+			next_states.append((state[field], get_written_paths(state, input_paths)))
+	return next_states
+
+
+def find_unwritten_reads(definition: dict, input_paths: frozenset = frozenset()) -> list:
+	"""
+	Finds the JSONPaths that states read but that are not written on every path of
+	the state machine to the state. Map iterators and Parallel branches are checked
+	with their own input.
+	:return: List of (state name, JSONPath)
+	"""
+	states = definition['States']
+	state_input_paths = {definition['StartAt']: input_paths}
+	queue = [definition['StartAt']]
+	while queue:
+		name = queue.pop()
+		for next_name, next_input_paths in get_next_states(
+				states[name], state_input_paths[name]
+				):
+			if next_name in state_input_paths:
+				next_input_paths = state_input_paths[next_name] & next_input_paths
+				if next_input_paths == state_input_paths[next_name]:
+					continue
+			state_input_paths[next_name] = next_input_paths
+			queue.append(next_name)
+	
+	unwritten_reads = []
+	for name, paths in state_input_paths.items():
+		state = states[name]
+		unwritten_reads.extend(
+			(name, read_path) for read_path in sorted(get_read_paths(state))
+			if not any(
+				read_path == path or read_path.startswith(f'{path}.') for path in paths
+				)
+			)
+		if state['Type'] == 'Map':
+			iterator_input_paths = (
+				frozenset(
+					f'$.{key[:-2] if key.endswith(".$") else key}'
+					for key in state['Parameters']
+					)
+				if 'Parameters' in state else frozenset()
+				)
+			unwritten_reads.extend(
+				find_unwritten_reads(state['Iterator'], iterator_input_paths)
+				)
+		for branch in state.get('Branches', []):
+			unwritten_reads.extend(find_unwritten_reads(branch, paths))
+	return unwritten_reads
+
+
+class TestStepFunctionDefinitions(unittest.TestCase):
+	# Tests the state machine definitions of the Step Function templates
+	
+	def test_every_read_path_is_written_by_an_earlier_state(self):
+		# Tests that no state reads a JSONPath that an earlier state overwrote or never
+		# wrote, e.g. a Task state without a ResultPath replacing $.run
+		for template_path, resource_name in STEP_TEMPLATES.items():
+			definitions = load_state_machine_definitions(template_path, resource_name)
+			for condition_values, definition in definitions.items():
+				with self.subTest(template=template_path, conditions=condition_values):
+					
+					# Runs assertions
+					self.assertEqual(find_unwritten_reads(definition), [])
+	
+	def test_overwritten_state_input_is_found(self):
+		# Tests that a Task state without a ResultPath is found to lose the state input
+		definition = {
+			'StartAt': 'Start',
+			'States': {
+				'Start': {'Type': 'Task', 'ResultPath': '$.run', 'Next': 'Send'},
+				'Send': {'Type': 'Task', 'Next': 'Status'},
+				'Status': {
+					'Type': 'Task',
+					'Parameters': {'run_id.$': '$.run.run_id'},
+					'End': True
+					}
+				}
+			}
+		
+		# Calls function to be tested
+		unwritten_reads = find_unwritten_reads(definition)
+		
+		# Runs assertions
+		self.assertEqual(unwritten_reads, [('Status', '$.run.run_id')])
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)